@@ -3,6 +3,7 @@ import os
 
 from .config import Config
 from .email_service import init_mail
+from . import db_pool, digest, migrations, outbox, sla, webhooks
 
 
 def create_app():
@@ -14,6 +15,30 @@ def create_app():
     # Init Flask-Mail
     init_mail(app)
 
+    # Én gjenbrukt SQLite-tilkobling per request
+    db_pool.init_app(app)
+
+    # Skjema-migreringer kjøres én gang her (eller via `flask migrate-db`),
+    # ikke på hver request
+    migrations.init_app(app)
+    if app.config.get("DB_MIGRATE_ON_STARTUP", True):
+        from .db import init_db
+        try:
+            with app.app_context():
+                init_db()
+        except Exception as e:
+            app.logger.error(f"Database initialization failed: {e}")
+
+    # SLA-varsler (breach / nær breach) fra en bakgrunnstråd per prosess
+    sla.init_app(app)
+
+    # E-post sendes fra utboksen av bakgrunnstråder (outbox.py)
+    outbox.init_app(app)
+    # Varsler samles til e-postsammendrag per bruker (digest.py)
+    digest.init_app(app)
+    # Sakshendelser til webhook-abonnenter (webhooks.py)
+    webhooks.init_app(app)
+
     # Security headers
     @app.after_request
     def set_security_headers(response):
@@ -0,0 +1,164 @@
+"""
+Aktivitetsloggen skrives i bakgrunnen (write-behind).
+
+log_activity() kalles ved innlogging, chat, saksendringer, innstillinger osv.
+Før ble hver rad en egen INSERT + commit, og activity-tabellen var det som
+oftest ventet på skrivelåsen. Nå legges radene i en begrenset kø, og en
+bakgrunnstråd skriver dem med executemany i én transaksjon hvert
+ACTIVITY_FLUSH_MS millisekund, eller straks ACTIVITY_FLUSH_BATCH rader venter.
+
+Tidspunktet settes når aktiviteten skjer, ikke når raden skrives. Er køen
+full, skrives raden direkte (ingenting forkastes). Køen tømmes når prosessen
+avsluttes (atexit), og get_activity() tømmer den først, så en prosess alltid
+ser sine egne rader.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import Config
+from .sla import format_ts, utcnow
+
+logger = logging.getLogger(__name__)
+
+# (user, details, created_at)
+_Row = Tuple[str, str, str]
+
+
+class ActivityWriter:
+    def __init__(
+        self,
+        flush_ms: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        maxsize: Optional[int] = None,
+    ):
+        self.flush_interval = (flush_ms if flush_ms is not None else Config.ACTIVITY_FLUSH_MS) / 1000
+        self.batch_size = batch_size or Config.ACTIVITY_FLUSH_BATCH
+        self.maxsize = maxsize or Config.ACTIVITY_QUEUE_SIZE
+        self._queue: "queue.Queue[_Row]" = queue.Queue(maxsize=self.maxsize)
+        # Rader fra en batch som ikke ble skrevet (f.eks. låst database); prøves først neste gang
+        self._retry: List[_Row] = []
+        self._flush_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.stats: Dict[str, Any] = {
+            "queued": 0, "written": 0, "flushes": 0, "overflow": 0, "errors": 0, "dropped": 0,
+            "last_flush_ms": 0.0, "max_flush_ms": 0.0,
+        }
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() + len(self._retry)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        return dict(stats, depth=self.depth, maxsize=self.maxsize)
+
+    def _count(self, **deltas: float) -> None:
+        # Tellerne oppdateres både fra requestene og fra bakgrunnstråden
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def log(self, user: str, details: str) -> None:
+        row = (user, details, format_ts(utcnow()))
+        if not Config.ACTIVITY_WRITE_BEHIND:
+            self._write([row])
+            return
+
+        self.ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count(overflow=1)
+            self._write([row])
+            return
+        self._count(queued=1)
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Skriver alt som ligger i køen nå, én transaksjon per batch. Returnerer antall rader."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                rows, self._retry = self._retry, []
+                while len(rows) < self.batch_size:
+                    try:
+                        rows.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not rows:
+                    return written
+                try:
+                    self._write(rows)
+                except Exception as e:
+                    self._count(errors=1)
+                    logger.error(f"Skriving av {len(rows)} aktivitetsrader feilet: {e}")
+                    self._keep_for_retry(rows)
+                    return written
+                written += len(rows)
+
+    def _keep_for_retry(self, rows: List[_Row]) -> None:
+        overflow = len(rows) - self.maxsize
+        if overflow > 0:
+            self._count(dropped=overflow)
+            rows = rows[overflow:]
+        self._retry = rows
+
+    def _write(self, rows: List[_Row]) -> None:
+        from . import db
+
+        start = time.perf_counter()
+        db.insert_activity(rows)
+        elapsed = round((time.perf_counter() - start) * 1000, 3)
+        with self._lock:
+            self.stats["written"] += len(rows)
+            self.stats["flushes"] += 1
+            self.stats["last_flush_ms"] = elapsed
+            self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], elapsed)
+
+    # -- tråd --------------------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Aktivitetslogg-tråden feilet: {e}")
+
+    def ensure_started(self) -> None:
+        # pid-sjekk som i SlaTimer: tråder overlever ikke fork
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stopper tråden og skriver det som er igjen i køen."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+
+writer = ActivityWriter()
+atexit.register(writer.stop)
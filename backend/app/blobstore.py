@@ -0,0 +1,156 @@
+"""
+Innholdsadressert lagring av vedlegg.
+
+save_upload skrev tidligere hver opplasting til en ny ticket_<id>_<uuid>.<ext>
+i én flat UPLOAD_FOLDER, så samme skjermbilde eller logg lagt ved femti saker
+under et driftsavbrudd ble lagret femti ganger. Nå regnes SHA-256 mens
+opplastingen leses, og innholdet lagres én gang som
+
+    uploads/blobs/ab/cd/abcd…(64 hex)
+
+(to nivåer à 256 mapper, så ingen mappe blir stor). Vedleggsraden peker på
+bloben (attachments.blob_sha256), og stored_filename er stien under
+UPLOAD_FOLDER, så nedlasting og visning virker som før. Finnes bloben fra
+før, koster opplastingen én hashing og ingen skriving til disk.
+
+Referansene telles i blobs.refcount av triggere (migrering 17), også når
+saker slettes i bulk; collect_garbage() fjerner blober ingen peker på.
+Vedlegg i et saksutkast (save_draft, migrering 18) teller også som
+referanse til saken opprettes.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict, List, Sequence, Tuple
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = "blobs"
+CHUNK_SIZE = 64 * 1024
+
+
+def relative_path(sha256: str) -> str:
+    """Stien under UPLOAD_FOLDER, det som lagres i attachments.stored_filename."""
+    return "/".join((BLOB_DIR, sha256[:2], sha256[2:4], sha256))
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(Config.UPLOAD_FOLDER, BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def _hash(stream: BinaryIO) -> Tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _write(stream: BinaryIO, path: str) -> None:
+    # Midlertidig fil i samme mappe og os.replace, så en halvskrevet blob
+    # aldri ligger under det endelige navnet (to samtidige opplastinger av
+    # samme innhold skriver bare samme fil to ganger).
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(stream, out, CHUNK_SIZE)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def store(stream: BinaryIO) -> Tuple[str, int]:
+    """
+    Lagrer innholdet i stream (fra nåværende posisjon) som blob hvis det
+    ikke finnes fra før. Returnerer (sha256, størrelse i byte).
+    Strømmen må kunne spoles tilbake; det kan werkzeug sine opplastinger.
+    """
+    start = stream.tell()
+    sha, size = _hash(stream)
+    path = blob_path(sha)
+    if not os.path.exists(path):
+        stream.seek(start)
+        _write(stream, path)
+    return sha, size
+
+
+def save(stream: BinaryIO, ticket_id: int, original_filename: str, uploaded_by: str) -> int:
+    """Lagrer opplastingen som blob og legger den ved saken. Returnerer vedleggets id."""
+    from . import db
+
+    start = stream.tell()
+    sha, size = store(stream)
+    attachment_id = db.add_attachment(
+        ticket_id, relative_path(sha), original_filename, uploaded_by, blob_sha256=sha, size=size
+    )
+    _ensure(stream, start, sha)
+    return attachment_id
+
+
+def save_draft(
+    user: str,
+    data: Dict[str, Any],
+    uploads: List[Tuple[BinaryIO, str]],
+    kept: Sequence[Dict[str, Any]] = (),
+) -> str:
+    """
+    Lagrer et saksutkast (db.create_ticket_draft) med opplastingene
+    (strøm, filnavn) som blober, pluss filene i `kept` fra et tidligere
+    utkast. Returnerer utkastets id.
+    """
+    from . import db
+
+    stored = []
+    for stream, original_filename in uploads:
+        start = stream.tell()
+        sha, size = store(stream)
+        stored.append((stream, start, sha, size, original_filename))
+
+    files = [(f["blob_sha256"], f["size"], f["original_filename"]) for f in kept]
+    files += [(sha, size, name) for _, _, sha, size, name in stored]
+    draft_id = db.create_ticket_draft(user, data, files)
+    for stream, start, sha, _, _ in stored:
+        _ensure(stream, start, sha)
+    return draft_id
+
+
+def _ensure(stream: BinaryIO, start: int, sha256: str) -> None:
+    # collect_garbage() kan ha fjernet en ubrukt blob med samme innhold
+    # mellom store() og at referansen ble lagret; nå har den refcount > 0
+    # og står, så filen skrives på nytt hvis den mangler.
+    path = blob_path(sha256)
+    if not os.path.exists(path):
+        stream.seek(start)
+        _write(stream, path)
+
+
+def collect_garbage(limit: int = 500) -> int:
+    """Sletter opptil `limit` blober ingen vedlegg peker på. Returnerer antallet."""
+    from . import db
+
+    def remove(sha: str) -> None:
+        try:
+            os.unlink(blob_path(sha))
+        except FileNotFoundError:
+            pass
+
+    removed = db.delete_unreferenced_blobs(remove, limit)
+    if removed:
+        logger.info(f"Slettet {removed} ubrukte vedleggsfiler")
+    return removed
@@ -0,0 +1,68 @@
+"""
+Små in-process cacher.
+
+TTLCache brukes foran billige, men svært hyppige oppslag (f.eks. antall uleste
+varsler som vises på hver side). Verdiene lever bare i denne prosessen, så
+andre worker-prosesser ser en endring senest etter `ttl` sekunder; skrivinger
+i samme prosess bør kalle invalidate() for å vises med en gang.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = self._clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.stats["misses"] += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
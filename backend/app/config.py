@@ -6,6 +6,27 @@ class Config:
 
     DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'helpdesk.db')
 
+    # SQLite-tilkoblinger (se db_pool.py)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 8)
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 10)
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_CACHE_SIZE = -16000  # negativ = KiB, dvs. ca. 16 MB side-cache per tilkobling
+    DB_MMAP_SIZE = 128 * 1024 * 1024
+    DB_MIGRATE_ON_STARTUP = os.environ.get('DB_MIGRATE_ON_STARTUP', 'true').lower() in ['true', 'on', '1']
+
+    # Aktivitetsloggen skrives i batch fra en bakgrunnstråd (activity.py):
+    # hvert ACTIVITY_FLUSH_MS ms eller når ACTIVITY_FLUSH_BATCH rader venter
+    ACTIVITY_WRITE_BEHIND = os.environ.get('ACTIVITY_WRITE_BEHIND', 'true').lower() in ['true', 'on', '1']
+    ACTIVITY_FLUSH_MS = int(os.environ.get('ACTIVITY_FLUSH_MS', 200))
+    ACTIVITY_FLUSH_BATCH = int(os.environ.get('ACTIVITY_FLUSH_BATCH', 500))
+    ACTIVITY_QUEUE_SIZE = int(os.environ.get('ACTIVITY_QUEUE_SIZE', 10000))
+
+    # Sekunder antall uleste varsler (badgen i menyen) caches per prosess
+    NOTIFICATION_COUNT_TTL = float(os.environ.get('NOTIFICATION_COUNT_TTL', 5))
+    # Uleste varsler av samme type (f.eks. "Ny sak opprettet") slås sammen til
+    # én rad per bruker innenfor så mange minutter (db.notify_many)
+    NOTIFICATION_COALESCE_MINUTES = int(os.environ.get('NOTIFICATION_COALESCE_MINUTES', 10))
+
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'pdf', 'txt', 'doc', 'docx', 'log'}
@@ -17,6 +38,45 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'noreply@helpdesk.no'
 
+    # E-post sendes fra utboksen (outbox.py) av EMAIL_WORKERS tråder per prosess,
+    # opptil EMAIL_BATCH_SIZE e-poster over samme SMTP-tilkobling. Mislykkede
+    # forsøk prøves igjen etter EMAIL_RETRY_SECONDS, doblet for hvert forsøk.
+    # Etter EMAIL_BREAKER_THRESHOLD tilkoblingsfeil på rad sendes ingenting
+    # på EMAIL_BREAKER_COOLDOWN sekunder.
+    EMAIL_OUTBOX_ENABLED = os.environ.get('EMAIL_OUTBOX_ENABLED', 'true').lower() in ['true', 'on', '1']
+    EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS', 2))
+    EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 50))
+    EMAIL_POLL_SECONDS = float(os.environ.get('EMAIL_POLL_SECONDS', 5))
+    EMAIL_LEASE_SECONDS = int(os.environ.get('EMAIL_LEASE_SECONDS', 300))
+    EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 6))
+    EMAIL_RETRY_SECONDS = int(os.environ.get('EMAIL_RETRY_SECONDS', 30))
+    EMAIL_RETRY_MAX_SECONDS = int(os.environ.get('EMAIL_RETRY_MAX_SECONDS', 3600))
+    EMAIL_BREAKER_THRESHOLD = int(os.environ.get('EMAIL_BREAKER_THRESHOLD', 3))
+    EMAIL_BREAKER_COOLDOWN = float(os.environ.get('EMAIL_BREAKER_COOLDOWN', 60))
+
+    # Varsler samles til én e-post per bruker (digest.py). Brukeren velger
+    # vindu (immediate/hourly/daily); jobben ser etter ferdige sammendrag hvert
+    # DIGEST_INTERVAL_SECONDS sekund, og daglige sendes kl. DIGEST_DAILY_HOUR UTC.
+    DIGEST_TIMER_ENABLED = os.environ.get('DIGEST_TIMER_ENABLED', 'true').lower() in ['true', 'on', '1']
+    DIGEST_INTERVAL_SECONDS = float(os.environ.get('DIGEST_INTERVAL_SECONDS', 60))
+    DIGEST_DAILY_HOUR = int(os.environ.get('DIGEST_DAILY_HOUR', 7))
+    DIGEST_BATCH_USERS = int(os.environ.get('DIGEST_BATCH_USERS', 500))
+    DIGEST_MAX_ITEMS = int(os.environ.get('DIGEST_MAX_ITEMS', 50))
+
+    # Webhooks (webhooks.py): én leveringstråd per prosess som sender opptil
+    # WEBHOOK_BATCH_SIZE hendelser om gangen, én POST per endepunkt fra en
+    # pool på WEBHOOK_WORKERS tråder. Nye forsøk etter WEBHOOK_RETRY_SECONDS,
+    # doblet for hvert forsøk; etter WEBHOOK_MAX_ATTEMPTS blir de liggende som døde.
+    WEBHOOKS_ENABLED = os.environ.get('WEBHOOKS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+    WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 200))
+    WEBHOOK_POLL_SECONDS = float(os.environ.get('WEBHOOK_POLL_SECONDS', 5))
+    WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 5))
+    WEBHOOK_LEASE_SECONDS = int(os.environ.get('WEBHOOK_LEASE_SECONDS', 120))
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+    WEBHOOK_RETRY_SECONDS = int(os.environ.get('WEBHOOK_RETRY_SECONDS', 10))
+    WEBHOOK_RETRY_MAX_SECONDS = int(os.environ.get('WEBHOOK_RETRY_MAX_SECONDS', 3600))
+
     ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL') or 'admin@helpdesk.no'
     SITE_NAME = 'IT Helpdesk'
     BASE_URL = os.environ.get('BASE_URL') or 'http://localhost:5000'
@@ -26,4 +86,35 @@ class Config:
     SLA_CRITICAL = 2
     SLA_HIGH = 8
     SLA_MEDIUM = 24
-    SLA_LOW = 72
\ No newline at end of file
+    SLA_LOW = 72
+    # SLA-timer (sla.py): varsel så mange minutter før fristen, og hvor ofte
+    # nærmeste frister lastes inn fra databasen
+    SLA_TIMER_ENABLED = os.environ.get('SLA_TIMER_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SLA_WARNING_MINUTES = int(os.environ.get('SLA_WARNING_MINUTES', 30))
+    SLA_RELOAD_SECONDS = int(os.environ.get('SLA_RELOAD_SECONDS', 60))
+
+    # Nesten like saker (dedup.py): estimert likhet (0–1) for å foreslå en
+    # åpen sak som duplikat, og maks antall forslag som vises
+    DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', 0.5))
+    DUPLICATE_MAX_SUGGESTIONS = 3
+
+    # Chatboten foreslår KB-artikler (db.suggest_articles): antall per svar, og
+    # hvor mange artikler de valgte søkeordene til sammen kan treffe
+    CHAT_ARTICLE_SUGGESTIONS = 3
+    CHAT_ARTICLE_MAX_CANDIDATES = 2000
+
+    # Chat-samtaler lagres i databasen (session-cookien har bare id-en) og
+    # slettes når de ikke er brukt på så mange timer
+    CHAT_CONVERSATION_TTL_HOURS = int(os.environ.get('CHAT_CONVERSATION_TTL_HOURS', 24))
+
+    # Utkast fra /tickets når det finnes lignende saker (med vedleggene) ligger
+    # i databasen til saken sendes inn, eller så mange timer
+    TICKET_DRAFT_TTL_HOURS = int(os.environ.get('TICKET_DRAFT_TTL_HOURS', 24))
+
+    # Ferdige chatbot-svar caches per prosess (IntelligentHelpdeskAI.respond).
+    # Svarene foreslår KB-artikler, så endringer i andre prosesser vises etter TTL.
+    CHAT_REPLY_CACHE_SIZE = int(os.environ.get('CHAT_REPLY_CACHE_SIZE', 1000))
+    CHAT_REPLY_CACHE_TTL = float(os.environ.get('CHAT_REPLY_CACHE_TTL', 300))
+
+    # Hvor ofte hver prosess ser etter en ny versjon av chatbotens kunnskapsbase
+    CHATBOT_KB_RELOAD_SECONDS = float(os.environ.get('CHATBOT_KB_RELOAD_SECONDS', 30))
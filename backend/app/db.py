@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import json
 import os
 import sqlite3
 import logging
+import random
+import re
+import secrets
+import unicodedata
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 from werkzeug.security import generate_password_hash
 from .config import Config
+from . import activity, db_pool, digest, migrations, sla
+from .cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -15,124 +22,20 @@ DB_PATH = Path(Config.DATABASE_PATH)
 
 
 def _conn() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Gjenbrukt tilkobling fra poolen (per request / per tråd), se db_pool.py.
+    # conn.close() leverer den tilbake i stedet for å lukke den.
+    return db_pool.connection(DB_PATH)
 
 
 def init_db() -> None:
+    """
+    Kjører ventende skjema-migreringer (se migrations.py) og oppretter
+    admin-brukeren. Kalles én gang ved oppstart, ikke per request.
+    """
     conn = _conn()
+    migrations.migrate(conn)
     cur = conn.cursor()
 
-    # USERS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            pw_hash TEXT NOT NULL,
-            role TEXT NOT NULL DEFAULT 'user',
-            email TEXT,
-            phone TEXT,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            last_login TEXT,
-            notify_email INTEGER NOT NULL DEFAULT 1,
-            notify_inapp INTEGER NOT NULL DEFAULT 1,
-            notify_sms INTEGER NOT NULL DEFAULT 0
-        )
-    """)
-
-    # Hvis DB allerede finnes fra før (uten nye kolonner), legg til kolonnene trygt:
-    for stmt in [
-        "ALTER TABLE users ADD COLUMN email TEXT",
-        "ALTER TABLE users ADD COLUMN phone TEXT",
-        "ALTER TABLE users ADD COLUMN notify_email INTEGER NOT NULL DEFAULT 1",
-        "ALTER TABLE users ADD COLUMN notify_inapp INTEGER NOT NULL DEFAULT 1",
-        "ALTER TABLE users ADD COLUMN notify_sms INTEGER NOT NULL DEFAULT 0",
-        "ALTER TABLE users ADD COLUMN last_login TEXT",
-    ]:
-        try:
-            cur.execute(stmt)
-        except sqlite3.OperationalError:
-            pass
-
-    # TICKETS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            desc TEXT NOT NULL,
-            owner TEXT NOT NULL,
-            category TEXT NOT NULL DEFAULT 'Annet',
-            priority TEXT NOT NULL DEFAULT 'Middels',
-            device TEXT NOT NULL DEFAULT '',
-            status TEXT NOT NULL DEFAULT 'Åpen',
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            updated_at TEXT NOT NULL DEFAULT (datetime('now')),
-            closed_at TEXT
-        )
-    """)
-
-    # NOTIFICATIONS (in-app)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user TEXT NOT NULL,
-            message TEXT NOT NULL,
-            link TEXT,
-            read INTEGER NOT NULL DEFAULT 0,
-            created_at TEXT NOT NULL DEFAULT (datetime('now'))
-        )
-    """)
-
-    # RATINGS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS ratings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ticket_id INTEGER NOT NULL UNIQUE,
-            user TEXT NOT NULL,
-            stars INTEGER NOT NULL,
-            feedback TEXT NOT NULL DEFAULT '',
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY(ticket_id) REFERENCES tickets(id)
-        )
-    """)
-
-    # KNOWLEDGE BASE ARTICLES
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            author TEXT NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            updated_at TEXT
-        )
-    """)
-
-    # ACTIVITY LOG
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS activity (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user TEXT NOT NULL,
-            details TEXT NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now'))
-        )
-    """)
-
-    # ATTACHMENTS (vedlegg til tickets)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS attachments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ticket_id INTEGER NOT NULL,
-            stored_filename TEXT NOT NULL,
-            original_filename TEXT NOT NULL,
-            uploaded_by TEXT NOT NULL,
-            uploaded_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY(ticket_id) REFERENCES tickets(id)
-        )
-    """)
-
     # Opprett admin/support uten hardkodet passord
     cur.execute("SELECT 1 FROM users WHERE username = 'admin'")
     if not cur.fetchone():
@@ -150,6 +53,79 @@ def init_db() -> None:
     conn.close()
 
 
+# -----------------------------
+# PAGINERING (keyset / cursor)
+# -----------------------------
+PAGE_SIZE = 25
+
+
+def _keyset_page(
+    select_sql: str,
+    filters: List[str],
+    params: List[Any],
+    key_col: str,
+    key_name: str,
+    after: Any = None,
+    before: Any = None,
+    limit: int = PAGE_SIZE,
+    descending: bool = True,
+) -> Dict[str, Any]:
+    """
+    Henter én side med `WHERE key < :cursor ORDER BY key DESC LIMIT n` (eller
+    motsatt for stigende rekkefølge), slik at kostnaden er den samme uansett
+    hvor langt ut i tabellen man blar.
+
+    after:  vis radene som kommer etter denne nøkkelen (neste side)
+    before: vis radene som kommer før denne nøkkelen (forrige side)
+
+    Returnerer {"rows": [...], "next": cursor|None, "prev": cursor|None}.
+    """
+    limit = max(1, min(int(limit), 200))
+    backwards = before is not None and after is None
+
+    # I visningsrekkefølge: "etter" betyr mindre nøkkel når vi sorterer synkende
+    forward_op, forward_dir = ("<", "DESC") if descending else (">", "ASC")
+    back_op, back_dir = (">", "ASC") if descending else ("<", "DESC")
+
+    where = list(filters)
+    args = list(params)
+    if backwards:
+        where.append(f"{key_col} {back_op} ?")
+        args.append(before)
+        order = back_dir
+    else:
+        if after is not None:
+            where.append(f"{key_col} {forward_op} ?")
+            args.append(after)
+        order = forward_dir
+
+    sql = select_sql
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {key_col} {order} LIMIT ?"
+    args.append(limit + 1)
+
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(sql, args)
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+
+    return {
+        "rows": rows,
+        "next": rows[-1][key_name] if rows and has_next else None,
+        "prev": rows[0][key_name] if rows and has_prev else None,
+    }
+
+
 # -----------------------------
 # USERS
 # -----------------------------
@@ -226,7 +202,10 @@ def update_preferences(
     notify_inapp: int,
     notify_sms: int = 0,
     phone: Optional[str] = None,
+    email_digest: Optional[str] = None,
 ) -> None:
+    if email_digest is not None and email_digest not in digest.FREQUENCIES:
+        raise ValueError(f"Ukjent e-postfrekvens: {email_digest}")
     conn = _conn()
     cur = conn.cursor()
     # SMS sending is removed; these columns are kept for legacy UI/state only.
@@ -236,10 +215,11 @@ def update_preferences(
         SET notify_email = ?,
             notify_inapp = ?,
             notify_sms = ?,
-            phone = ?
+            phone = ?,
+            email_digest = COALESCE(?, email_digest)
         WHERE username = ?
         """,
-        (int(notify_email), int(notify_inapp), int(notify_sms), phone, username),
+        (int(notify_email), int(notify_inapp), int(notify_sms), phone, email_digest, username),
     )
     conn.commit()
     conn.close()
@@ -264,15 +244,23 @@ def get_support_users() -> List[Dict[str, Any]]:
 # -----------------------------
 # TICKETS
 # -----------------------------
-def add_ticket(owner: str, title: str, desc: str, category: str, priority: str, device: str) -> int:
+def add_ticket(
+    owner: str,
+    title: str,
+    desc: str,
+    category: str,
+    priority: str,
+    device: str,
+    duplicate_of: Optional[int] = None,
+) -> int:
     conn = _conn()
     cur = conn.cursor()
     cur.execute(
         """
-        INSERT INTO tickets (title, desc, owner, category, priority, device, status, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, 'Åpen', datetime('now'))
+        INSERT INTO tickets (title, desc, owner, category, priority, device, status, updated_at, due_at, duplicate_of)
+        VALUES (?, ?, ?, ?, ?, ?, 'Åpen', datetime('now'), datetime('now', ?), ?)
         """,
-        (title.strip(), desc.strip(), owner, category, priority, device),
+        (title.strip(), desc.strip(), owner, category, priority, device, sla.due_modifier(priority), duplicate_of),
     )
     conn.commit()
     ticket_id = int(cur.lastrowid)
@@ -303,6 +291,71 @@ def get_tickets(owner: Optional[str] = None) -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+def get_tickets_page(
+    owner: Optional[str] = None,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+) -> Dict[str, Any]:
+    filters, params = _ticket_filters(status, priority)
+    if owner is not None:
+        filters.append("t.owner = ?")
+        params.append(owner)
+    return _keyset_page(
+        """
+        SELECT t.*, r.stars AS rating, r.feedback AS feedback
+        FROM tickets t
+        LEFT JOIN ratings r ON r.ticket_id = t.id
+        """,
+        filters, params, "t.id", "id", after, before, limit,
+    )
+
+
+def _ticket_filters(status: Optional[str], priority: Optional[str]) -> Tuple[List[str], List[Any]]:
+    filters: List[str] = []
+    params: List[Any] = []
+    if status:
+        filters.append("t.status = ?")
+        params.append(status)
+    if priority:
+        filters.append("t.priority = ?")
+        params.append(priority)
+    return filters, params
+
+
+def search_tickets(
+    query: str,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+) -> Dict[str, Any]:
+    """
+    Fulltekstsøk i tittel, beskrivelse, enhet og kategori (tickets_fts), med
+    prefiks- og frasesøk som i search_articles. Nyeste treff først: FTS5 leser
+    treffene i rowid-rekkefølge og kan stoppe ved LIMIT, så kostnaden er den
+    samme selv om søkeordet finnes i mange saker. Returnerer samme form som
+    _keyset_page, med et utdrag fra beskrivelsen i "snippet".
+    """
+    match = _fts_query(query)
+    if not match:
+        return {"rows": [], "next": None, "prev": None}
+
+    filters, params = _ticket_filters(status, priority)
+    return _keyset_page(
+        f"""
+        SELECT t.*, snippet(tickets_fts, 1, '{HL_START}', '{HL_END}', '…', 16) AS snippet
+        FROM tickets_fts
+        JOIN tickets t ON t.id = tickets_fts.rowid
+        """,
+        ["tickets_fts MATCH ?"] + filters, [match] + params,
+        "tickets_fts.rowid", "id", after, before, limit,
+    )
+
+
 def get_ticket(ticket_id: int) -> Optional[Dict[str, Any]]:
     conn = _conn()
     cur = conn.cursor()
@@ -317,7 +370,8 @@ def get_ticket(ticket_id: int) -> Optional[Dict[str, Any]]:
     return dict(row) if row else None
 
 
-def close_ticket(ticket_id: int) -> None:
+def close_ticket(ticket_id: int) -> bool:
+    """Lukker saken. Returnerer False hvis den ikke finnes eller allerede er lukket."""
     conn = _conn()
     cur = conn.cursor()
     cur.execute(
@@ -326,12 +380,14 @@ def close_ticket(ticket_id: int) -> None:
         SET status = 'Lukket',
             updated_at = datetime('now'),
             closed_at = datetime('now')
-        WHERE id = ?
+        WHERE id = ? AND status != 'Lukket'
         """,
         (ticket_id,),
     )
+    closed = cur.rowcount > 0
     conn.commit()
     conn.close()
+    return closed
 
 
 # -----------------------------
@@ -360,22 +416,97 @@ def get_rating(ticket_id: int) -> Optional[Dict[str, Any]]:
 # -----------------------------
 # NOTIFICATIONS (in-app)
 # -----------------------------
-def add_notification(user: str, message: str, link: Optional[str] = None) -> None:
-    conn = _conn()
-    cur = conn.cursor()
+# Antall uleste per bruker foran notification_counts (se migrering 4).
+# Skrivinger i denne prosessen invaliderer; andre prosesser ser endringen etter TTL.
+_unread_cache = TTLCache(ttl=Config.NOTIFICATION_COUNT_TTL)
+
+
+def _digest_due_sql() -> str:
+    """
+    SQL-uttrykk for når et varsel skal med i e-postsammendraget (digest.py),
+    ut fra brukerens email_digest (krever users-tabellen som `u`).
+    """
+    hour = f"'+{int(Config.DIGEST_DAILY_HOUR)} hours'"
+    return f"""(CASE u.email_digest
+            WHEN 'immediate' THEN datetime('now')
+            WHEN 'daily' THEN CASE WHEN datetime(date('now'), {hour}) > datetime('now')
+                                   THEN datetime(date('now'), {hour})
+                                   ELSE datetime(date('now'), '+1 day', {hour}) END
+            ELSE strftime('%Y-%m-%d %H:00:00', 'now', '+1 hour')
+        END)"""
 
-    cur.execute("SELECT notify_inapp FROM users WHERE username = ?", (user,))
-    row = cur.fetchone()
-    if not row or int(row["notify_inapp"]) != 1:
-        conn.close()
-        return
 
+def add_notification(user: str, message: str, link: Optional[str] = None, kind: Optional[str] = None) -> None:
+    notify_many([user], message, link, kind=kind)
+
+
+def notify_many(usernames, message: str, link: Optional[str] = None, kind: Optional[str] = None) -> int:
+    """
+    Samme varsel til mange brukere med én INSERT ... SELECT i én transaksjon.
+    Brukernavnene sendes som én JSON-parameter (json_each), og JOIN mot users
+    filtrerer bort ukjente brukere og de som har skrudd av notify_inapp.
+
+    Med `kind` slås varselet sammen med brukerens uleste varsel av samme type
+    fra de siste NOTIFICATION_COALESCE_MINUTES minuttene (count + 1, siste
+    melding og lenke), så en travel periode gir én rad per bruker og type.
+    Returnerer antall brukere som ble varslet (nye og sammenslåtte rader).
+    """
+    names = sorted({u for u in usernames if u})
+    if not names:
+        return 0
+
+    window = f"-{int(Config.NOTIFICATION_COALESCE_MINUTES)} minutes"
+    conn = _conn()
+    cur = conn.cursor()
+    merged = 0
+    if kind:
+        cur.execute(
+            """
+            UPDATE notifications
+            SET count = count + 1, message = ?, link = ?, updated_at = datetime('now')
+            WHERE id IN (
+                SELECT MAX(n.id)
+                FROM json_each(?) AS j
+                JOIN users u ON u.username = j.value
+                JOIN notifications n ON n.user = u.username
+                WHERE u.notify_inapp = 1
+                  AND n.kind = ? AND n.read = 0 AND n.updated_at >= datetime('now', ?)
+                GROUP BY n.user
+            )
+            """,
+            (message, link, json.dumps(names), kind, window),
+        )
+        merged = cur.rowcount
+    cur.execute(
+        """
+        INSERT INTO notifications (user, message, link, kind, updated_at)
+        SELECT u.username, ?, ?, ?, datetime('now')
+        FROM json_each(?) AS j
+        JOIN users u ON u.username = j.value
+        WHERE u.notify_inapp = 1
+          AND (? IS NULL OR NOT EXISTS (
+                SELECT 1 FROM notifications n
+                WHERE n.user = u.username AND n.kind = ? AND n.read = 0
+                  AND n.updated_at >= datetime('now', ?)
+          ))
+        """,
+        (message, link, kind, json.dumps(names), kind, kind, window),
+    )
+    created = merged + cur.rowcount
     cur.execute(
-        "INSERT INTO notifications (user, message, link) VALUES (?, ?, ?)",
-        (user, message, link),
+        f"""
+        INSERT INTO digest_items (user, message, link, due_at)
+        SELECT u.username, ?, ?, {_digest_due_sql()}
+        FROM json_each(?) AS j
+        JOIN users u ON u.username = j.value
+        WHERE u.notify_email = 1 AND COALESCE(u.email, '') != ''
+        """,
+        (message, link, json.dumps(names)),
     )
     conn.commit()
     conn.close()
+    _unread_cache.invalidate(*names)
+    return created
 
 
 def get_notifications(user: str) -> List[Dict[str, Any]]:
@@ -387,21 +518,37 @@ def get_notifications(user: str) -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+def get_notifications_page(
+    user: str,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+) -> Dict[str, Any]:
+    return _keyset_page(
+        "SELECT * FROM notifications", ["user = ?"], [user], "id", "id", after, before, limit,
+    )
+
+
 def mark_all_notifications_read(user: str) -> None:
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("UPDATE notifications SET read = 1 WHERE user = ?", (user,))
+    cur.execute("UPDATE notifications SET read = 1 WHERE user = ? AND read = 0", (user,))
     conn.commit()
     conn.close()
+    _unread_cache.invalidate(user)
 
 
 def count_notifications(user: str) -> int:
+    return _unread_cache.get_or_set(user, lambda: _load_unread_count(user))
+
+
+def _load_unread_count(user: str) -> int:
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) AS c FROM notifications WHERE user = ? AND read = 0", (user,))
+    cur.execute("SELECT unread FROM notification_counts WHERE user = ?", (user,))
     row = cur.fetchone()
     conn.close()
-    return int(row["c"]) if row else 0
+    return int(row["unread"]) if row else 0
 
 
 # -----------------------------
@@ -429,6 +576,17 @@ def get_articles() -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+def get_articles_page(
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+) -> Dict[str, Any]:
+    return _keyset_page(
+        "SELECT id, title, content, author, cover_url, created_at FROM articles",
+        [], [], "id", "id", after, before, limit,
+    )
+
+
 def get_article(article_id: int) -> Optional[Dict[str, Any]]:
     conn = _conn()
     cur = conn.cursor()
@@ -458,331 +616,694 @@ def delete_article_db(article_id: int) -> None:
 
 
 # -----------------------------
-# ACTIVITY LOG
+# FULLTEKSTSØK (FTS5)
 # -----------------------------
-def log_activity(user: str, details: str) -> None:
+# Markører rundt treff i highlight()/snippet(). Kontrolltegn forekommer ikke i
+# vanlig tekst, så visningen kan HTML-escape alt og deretter bytte dem ut med <mark>.
+HL_START, HL_END = "\x02", "\x03"
+
+_FTS_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+_FTS_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _fts_query(text: str, prefix: bool = True) -> str:
+    """
+    Gjør brukerinput om til en trygg FTS5-spørring: "sitater" blir fraser,
+    andre ord blir prefiks-termer (feid -> "feid"*). Alle ledd må treffe (AND).
+    Spesialtegn fjernes, så input kan aldri gi syntaksfeil i MATCH.
+    Returnerer "" hvis det ikke er noe å søke på.
+    """
+    parts = []
+    for phrase, word in _FTS_TOKEN_RE.findall(text or ""):
+        tokens = _FTS_WORD_RE.findall(phrase or word)
+        if not tokens:
+            continue
+        if phrase:
+            parts.append('"' + " ".join(tokens) + '"')
+        else:
+            parts.extend(f'"{t}"*' if prefix else f'"{t}"' for t in tokens)
+    return " ".join(parts)
+
+
+def _split_rank_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    if not cursor:
+        return None
+    try:
+        score, _, row_id = cursor.rpartition("|")
+        return float(score), int(row_id)
+    except ValueError:
+        return None
+
+
+def search_articles(query: str, after: Optional[str] = None, limit: int = PAGE_SIZE) -> Dict[str, Any]:
+    """
+    bm25-rangert søk i kunnskapsbasen (tittel vektes 5x innhold), med uthevet
+    tittel og et utdrag rundt treffene. Cursoren er "score|id" for neste side.
+    Returnerer {"rows": [...], "next": cursor|None}.
+    """
+    match = _fts_query(query)
+    if not match:
+        return {"rows": [], "next": None}
+    limit = max(1, min(int(limit), 100))
+
+    sql = f"""
+        SELECT * FROM (
+            SELECT a.id, a.title, a.author, a.created_at, a.cover_url,
+                   bm25(articles_fts, 5.0, 1.0) AS score,
+                   highlight(articles_fts, 0, '{HL_START}', '{HL_END}') AS title_hl,
+                   snippet(articles_fts, 1, '{HL_START}', '{HL_END}', '…', 24) AS snippet
+            FROM articles_fts
+            JOIN articles a ON a.id = articles_fts.rowid
+            WHERE articles_fts MATCH ?
+        )
+    """
+    args: List[Any] = [match]
+    cursor = _split_rank_cursor(after)
+    if cursor:
+        sql += " WHERE score > ? OR (score = ? AND id > ?)"
+        args += [cursor[0], cursor[0], cursor[1]]
+    sql += " ORDER BY score, id LIMIT ?"
+    args.append(limit + 1)
+
     conn = _conn()
     cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO activity (user, details) VALUES (?, ?)",
-        (user, details),
-    )
-    conn.commit()
+    cur.execute(sql, args)
+    rows = [dict(r) for r in cur.fetchall()]
     conn.close()
 
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    last = rows[-1] if rows else None
+    return {
+        "rows": rows,
+        "next": f"{last['score']!r}|{last['id']}" if last and has_more else None,
+    }
+
+
+def _fold(word: str) -> str:
+    # Som tokenizeren i articles_fts (unicode61 remove_diacritics 2): små bokstaver uten aksenter
+    word = unicodedata.normalize("NFKD", word.lower())
+    return "".join(ch for ch in word if not unicodedata.combining(ch))
+
+
+def _article_doc_frequency(cur: sqlite3.Cursor, term: str, prefix: bool, cap: int) -> Optional[int]:
+    """Antall artikler med ordet (eller ord som starter med det); None = flere enn cap."""
+    if not prefix:
+        row = cur.execute("SELECT doc FROM articles_fts_vocab WHERE term = ?", (term,)).fetchone()
+        docs = row[0] if row else 0
+        return None if docs > cap else docs
+    # fts5vocab teller dokumentene for hvert ord mens radene leses, så et
+    # vanlig prefiks koster mye; stopp så snart summen går over cap
+    docs = 0
+    for (doc,) in cur.execute(
+        "SELECT doc FROM articles_fts_vocab WHERE term >= ? AND term < ?", (term, term + "\uffff")
+    ):
+        docs += doc
+        if docs > cap:
+            return None
+    return docs
+
+
+def suggest_articles(words: List[str], limit: int = 3, max_candidates: int = 2000) -> List[Dict[str, Any]]:
+    """
+    Artikler som passer til en chatmelding (chatboten): minst ett av ordene
+    må treffe (OR), rangert med bm25 som i search_articles.
+
+    En OR-spørring med vanlige ord treffer nesten hele kunnskapsbasen, og da
+    må bm25 regnes ut for hver artikkel. Derfor slås dokumentfrekvensen opp i
+    articles_fts_vocab, og bare de sjeldneste ordene tas med, til sammen for
+    høyst max_candidates artikler. Det er også de ordene som teller mest i bm25.
+    Ord på 4+ tegn søkes som prefiks, og lange ord kuttes til 6 tegn
+    ("skriveren" -> "skrive"*), en enkel stamming for norske endelser.
+    """
+    terms = {}
+    for word in words:
+        for token in _FTS_WORD_RE.findall(_fold(word)):
+            if len(token) >= 4:
+                terms.setdefault((token[:6], True), None)
+            elif len(token) == 3:
+                terms.setdefault((token, False), None)
+    if not terms:
+        return []
 
-def get_activity(limit: int = 100) -> List[Dict[str, Any]]:
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM activity ORDER BY id DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
+    frequencies = []
+    for term, prefix in terms:
+        df = _article_doc_frequency(cur, term, prefix, cap=max_candidates)
+        if df:
+            frequencies.append((df, term, prefix))
+    frequencies.sort()
+
+    chosen, total = [], 0
+    for df, term, prefix in frequencies:
+        if total + df > max_candidates:
+            break
+        chosen.append(f'"{term}"*' if prefix else f'"{term}"')
+        total += df
+    if not chosen:
+        conn.close()
+        return []
+
+    rows = cur.execute(
+        """
+        SELECT a.id, a.title, bm25(articles_fts, 5.0, 1.0) AS score
+        FROM articles_fts
+        JOIN articles a ON a.id = articles_fts.rowid
+        WHERE articles_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+        """,
+        (" OR ".join(chosen), limit),
+    ).fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
 
 # -----------------------------
-# ATTACHMENTS
+# DUPLIKATER (MinHash-signaturer, se dedup.py)
 # -----------------------------
-def add_attachment(ticket_id: int, stored_filename: str, original_filename: str, uploaded_by: str) -> int:
+def save_ticket_signatures(rows: List[Tuple[int, bytes]]) -> None:
+    """Lagrer (ticket_id, signatur) i én transaksjon."""
+    if not rows:
+        return
     conn = _conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO attachments (ticket_id, stored_filename, original_filename, uploaded_by)
-        VALUES (?, ?, ?, ?)
-        """,
-        (int(ticket_id), stored_filename, original_filename, uploaded_by),
+    conn.executemany(
+        "INSERT OR REPLACE INTO ticket_signatures (ticket_id, signature) VALUES (?, ?)",
+        rows,
     )
     conn.commit()
-    attachment_id = int(cur.lastrowid)
     conn.close()
-    return attachment_id
 
 
-def get_attachments(ticket_id: int) -> List[Dict[str, Any]]:
+def get_open_ticket_signatures(after_id: int = 0) -> List[Tuple[int, bytes]]:
+    """
+    Signaturer for åpne saker som ikke er duplikater, med id > after_id.
+    CROSS JOIN låser rekkefølgen: ellers velger SQLite idx_tickets_sla og
+    leser alle åpne saker selv når bare de siste signaturene trengs.
+    """
     conn = _conn()
-    cur = conn.cursor()
-    cur.execute(
+    rows = conn.execute(
         """
-        SELECT id, ticket_id, stored_filename, original_filename, uploaded_by, uploaded_at
-        FROM attachments
-        WHERE ticket_id = ?
-        ORDER BY id DESC
+        SELECT s.ticket_id, s.signature
+        FROM ticket_signatures s
+        CROSS JOIN tickets t ON t.id = s.ticket_id
+        WHERE s.ticket_id > ? AND t.status = 'Åpen' AND t.duplicate_of IS NULL
+        ORDER BY s.ticket_id
         """,
-        (int(ticket_id),),
-    )
-    rows = cur.fetchall()
+        (after_id,),
+    ).fetchall()
+    conn.close()
+    return [(r[0], r[1]) for r in rows]
+
+
+def get_open_tickets_without_signature(after_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+    conn = _conn()
+    rows = conn.execute(
+        """
+        SELECT t.id, t.title, t.desc
+        FROM tickets t
+        LEFT JOIN ticket_signatures s ON s.ticket_id = t.id
+        WHERE t.id > ? AND t.status = 'Åpen' AND t.duplicate_of IS NULL AND s.ticket_id IS NULL
+        ORDER BY t.id
+        LIMIT ?
+        """,
+        (after_id, limit),
+    ).fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
 
-def get_attachment(attachment_id: int) -> Optional[Dict[str, Any]]:
+def get_open_tickets_by_ids(ticket_ids) -> List[Dict[str, Any]]:
+    """
+    Korte oppslag for forslag om duplikat; lukkede saker utelates. `+status`
+    hindrer at status-indeksen velges foran primærnøkkelen.
+    """
+    ids = list(dict.fromkeys(int(i) for i in ticket_ids))
+    if not ids:
+        return []
     conn = _conn()
-    cur = conn.cursor()
-    cur.execute(
+    rows = conn.execute(
         """
-        SELECT id, ticket_id, stored_filename, original_filename, uploaded_by, uploaded_at
-        FROM attachments
-        WHERE id = ?
+        SELECT id, title, owner, assigned_to, priority, created_at
+        FROM tickets
+        WHERE id IN (SELECT value FROM json_each(?)) AND +status = 'Åpen'
         """,
-        (int(attachment_id),),
-    )
-    row = cur.fetchone()
+        (json.dumps(ids),),
+    ).fetchall()
     conn.close()
-    return dict(row) if row else None
+    return [dict(r) for r in rows]
+
 
 # -----------------------------
-# ADMIN: Users & Tickets helpers
+# CHAT-SAMTALER (chatboten, se migrering 11)
 # -----------------------------
+# Session-cookien har bare samtale-id-en. Tilstanden (JSON) og alle meldinger
+# ligger her, så alle prosesser ser den samme samtalen.
+def _chat_ttl() -> str:
+    return f"-{int(Config.CHAT_CONVERSATION_TTL_HOURS)} hours"
 
-def get_all_users() -> List[Dict[str, Any]]:
-    """Get all users for admin management"""
+
+def create_chat_conversation(user: str, state: Dict[str, Any]) -> str:
+    """Ny samtale med tilfeldig id; samtaler som har gått ut slettes samtidig."""
+    conv_id = secrets.token_urlsafe(16)
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT username, role, email, created_at, last_login
-        FROM users
-        ORDER BY created_at DESC
-    """)
-    rows = cur.fetchall()
+    cur.execute("DELETE FROM chat_conversations WHERE updated_at < datetime('now', ?)", (_chat_ttl(),))
+    cur.execute(
+        "INSERT INTO chat_conversations (id, user, state) VALUES (?, ?, ?)",
+        (conv_id, user, json.dumps(state)),
+    )
+    conn.commit()
     conn.close()
-    return [dict(r) for r in rows]
+    return conv_id
 
 
-def change_user_role(username: str, new_role: str) -> None:
-    """Change user's role (admin only)"""
+def get_chat_conversation(conv_id: str, user: str) -> Optional[Dict[str, Any]]:
+    """Tilstanden i samtalen, eller None hvis den ikke finnes, er en annens eller har gått ut."""
     conn = _conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET role = ? WHERE username = ?", (new_role, username))
-    conn.commit()
+    row = conn.execute(
+        """
+        SELECT state FROM chat_conversations
+        WHERE id = ? AND user = ? AND updated_at >= datetime('now', ?)
+        """,
+        (conv_id, user, _chat_ttl()),
+    ).fetchone()
     conn.close()
+    return json.loads(row["state"]) if row else None
 
 
-def delete_user_db(username: str) -> None:
-    """Delete user permanently (admin only)"""
+def save_chat_turn(conv_id: str, state: Dict[str, Any], user_msg: str, reply: str) -> None:
+    """Lagrer ny tilstand og meldingen + svaret i én transaksjon."""
     conn = _conn()
     cur = conn.cursor()
-    # Delete user's tickets, notifications, etc.
-    cur.execute("DELETE FROM tickets WHERE owner = ?", (username,))
-    cur.execute("DELETE FROM notifications WHERE user = ?", (username,))
-    cur.execute("DELETE FROM ratings WHERE user = ?", (username,))
-    cur.execute("DELETE FROM activity WHERE user = ?", (username,))
-    cur.execute("DELETE FROM users WHERE username = ?", (username,))
+    cur.execute(
+        "UPDATE chat_conversations SET state = ?, updated_at = datetime('now') WHERE id = ?",
+        (json.dumps(state), conv_id),
+    )
+    cur.executemany(
+        "INSERT INTO chat_messages (conversation_id, sender, message) VALUES (?, ?, ?)",
+        [(conv_id, "user", user_msg), (conv_id, "bot", reply)],
+    )
     conn.commit()
     conn.close()
 
 
-def assign_ticket(ticket_id: int, assigned_to: str) -> None:
-    """Assign ticket to support user"""
+def get_chat_conversations(user: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """Brukerens siste samtaler (nyeste først) med alle meldinger, for support."""
     conn = _conn()
     cur = conn.cursor()
+    conversations = [
+        dict(r)
+        for r in cur.execute(
+            """
+            SELECT id, created_at, updated_at FROM chat_conversations
+            WHERE user = ? AND updated_at >= datetime('now', ?)
+            ORDER BY updated_at DESC
+            LIMIT ?
+            """,
+            (user, _chat_ttl(), limit),
+        )
+    ]
+    for conv in conversations:
+        conv["messages"] = [
+            dict(r)
+            for r in cur.execute(
+                "SELECT sender, message, created_at FROM chat_messages WHERE conversation_id = ? ORDER BY id",
+                (conv["id"],),
+            )
+        ]
+    conn.close()
+    return conversations
+
 
-    # Add column if it doesn't exist
+# -----------------------------
+# SAKSUTKAST (forslag om duplikater i /tickets, se migrering 18)
+# -----------------------------
+# Som chat-samtalene: session-cookien har bare id-en. Vedleggene er blober
+# (blobstore.py); ticket_draft_files holder en referanse til dem så de ikke
+# ryddes bort før saken er opprettet.
+def _draft_ttl() -> str:
+    return f"-{int(Config.TICKET_DRAFT_TTL_HOURS)} hours"
+
+
+def create_ticket_draft(user: str, data: Dict[str, Any], files: List[Tuple[str, int, str]]) -> str:
+    """
+    Lagrer utkastet med filene (sha256, størrelse, filnavn). Brukerens
+    tidligere utkast og utkast som har gått ut slettes i samme transaksjon,
+    etter at referansene til det nye er lagt inn.
+    """
+    draft_id = secrets.token_urlsafe(16)
+    conn = _conn()
+    cur = conn.cursor()
     try:
-        cur.execute("ALTER TABLE tickets ADD COLUMN assigned_to TEXT")
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany(
+            "INSERT INTO blobs (sha256, size) VALUES (?, ?) ON CONFLICT(sha256) DO NOTHING",
+            [(sha, int(size)) for sha, size, _ in files],
+        )
+        cur.execute(
+            "INSERT INTO ticket_drafts (id, user, data) VALUES (?, ?, ?)",
+            (draft_id, user, json.dumps(data)),
+        )
+        cur.executemany(
+            "INSERT INTO ticket_draft_files (draft_id, blob_sha256, original_filename) VALUES (?, ?, ?)",
+            [(draft_id, sha, name) for sha, _, name in files],
+        )
+        cur.execute("DELETE FROM ticket_drafts WHERE user = ? AND id != ?", (user, draft_id))
+        cur.execute("DELETE FROM ticket_drafts WHERE created_at < datetime('now', ?)", (_draft_ttl(),))
         conn.commit()
-    except sqlite3.OperationalError:
-        pass
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return draft_id
 
-    cur.execute("""
-        UPDATE tickets
-        SET assigned_to = ?, updated_at = datetime('now')
-        WHERE id = ?
-    """, (assigned_to, ticket_id))
-    conn.commit()
+
+def get_ticket_draft(draft_id: str, user: str) -> Optional[Dict[str, Any]]:
+    """Utkastet med "id" og "files", eller None hvis det ikke finnes, er en annens eller har gått ut."""
+    conn = _conn()
+    cur = conn.cursor()
+    row = cur.execute(
+        "SELECT data FROM ticket_drafts WHERE id = ? AND user = ? AND created_at >= datetime('now', ?)",
+        (draft_id, user, _draft_ttl()),
+    ).fetchone()
+    if not row:
+        conn.close()
+        return None
+    files = [
+        dict(r)
+        for r in cur.execute(
+            """
+            SELECT f.blob_sha256, f.original_filename, b.size
+            FROM ticket_draft_files f
+            JOIN blobs b ON b.sha256 = f.blob_sha256
+            WHERE f.draft_id = ?
+            ORDER BY f.id
+            """,
+            (draft_id,),
+        )
+    ]
     conn.close()
+    return dict(json.loads(row["data"]), id=draft_id, files=files)
 
 
-def update_ticket_priority(ticket_id: int, priority: str) -> None:
-    """Update ticket priority"""
+def delete_ticket_draft(draft_id: str) -> None:
     conn = _conn()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE tickets
-        SET priority = ?, updated_at = datetime('now')
-        WHERE id = ?
-    """, (priority, ticket_id))
+    conn.execute("DELETE FROM ticket_drafts WHERE id = ?", (draft_id,))
     conn.commit()
     conn.close()
 
 
-def delete_ticket_db(ticket_id: int) -> None:
-    """Delete ticket permanently"""
+# -----------------------------
+# CHATBOT-KUNNSKAPSBASE (versjoner, se migrering 12)
+# -----------------------------
+def save_chatbot_kb(data: Dict[str, Any], created_by: str) -> int:
+    """Lagrer en ny versjon av kunnskapsbasen og returnerer versjonsnummeret."""
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("DELETE FROM attachments WHERE ticket_id = ?", (ticket_id,))
-    cur.execute("DELETE FROM ratings WHERE ticket_id = ?", (ticket_id,))
-    cur.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+    cur.execute(
+        "INSERT INTO chatbot_kb_versions (data, created_by) VALUES (?, ?)",
+        (json.dumps(data, ensure_ascii=False), created_by),
+    )
+    version = cur.lastrowid
     conn.commit()
     conn.close()
+    return version
 
 
+def get_chatbot_kb(after_version: int = 0) -> Optional[Dict[str, Any]]:
+    """Nyeste versjon ({"version", "data"}) hvis den er nyere enn after_version, ellers None."""
+    conn = _conn()
+    row = conn.execute(
+        "SELECT id, data FROM chatbot_kb_versions WHERE id > ? ORDER BY id DESC LIMIT 1",
+        (after_version,),
+    ).fetchone()
+    conn.close()
+    return {"version": row["id"], "data": json.loads(row["data"])} if row else None
 
-import os
-import sqlite3
-import logging
-import random
-from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
-
-from werkzeug.security import generate_password_hash
-from .config import Config
 
-logger = logging.getLogger(__name__)
+def get_chatbot_kb_versions(limit: int = 20) -> List[Dict[str, Any]]:
+    conn = _conn()
+    rows = conn.execute(
+        "SELECT id AS version, created_by, created_at FROM chatbot_kb_versions ORDER BY id DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
 
-DB_PATH = Path(Config.DATABASE_PATH)
 
+# -----------------------------
+# ACTIVITY LOG
+# -----------------------------
+# log_activity() legger raden i køen til activity.writer, som skriver i batch
+# fra en bakgrunnstråd (se activity.py).
+def log_activity(user: str, details: str) -> None:
+    activity.writer.log(user, details)
 
-def _conn() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
 
+def insert_activity(rows: List[Tuple[str, str, str]]) -> None:
+    """Skriver (user, details, created_at) i én transaksjon."""
+    conn = _conn()
+    conn.executemany("INSERT INTO activity (user, details, created_at) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
 
-def init_db() -> None:
+
+def get_activity(limit: int = 100) -> List[Dict[str, Any]]:
+    activity.writer.flush()  # egne rader som fortsatt ligger i køen
     conn = _conn()
     cur = conn.cursor()
+    cur.execute("SELECT * FROM activity ORDER BY id DESC LIMIT ?", (limit,))
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
 
-    # USERS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            pw_hash TEXT NOT NULL,
-            role TEXT NOT NULL DEFAULT 'user',
-            email TEXT,
-            phone TEXT,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            last_login TEXT,
-            notify_email INTEGER NOT NULL DEFAULT 1,
-            notify_inapp INTEGER NOT NULL DEFAULT 1,
-            notify_sms INTEGER NOT NULL DEFAULT 0
-        )
-    """)
 
-    # Trygge ALTERs (hvis DB allerede finnes)
-    for stmt in [
-        "ALTER TABLE users ADD COLUMN email TEXT",
-        "ALTER TABLE users ADD COLUMN phone TEXT",
-        "ALTER TABLE users ADD COLUMN last_login TEXT",
-        "ALTER TABLE users ADD COLUMN notify_email INTEGER NOT NULL DEFAULT 1",
-        "ALTER TABLE users ADD COLUMN notify_inapp INTEGER NOT NULL DEFAULT 1",
-        "ALTER TABLE users ADD COLUMN notify_sms INTEGER NOT NULL DEFAULT 0",
-    ]:
-        try:
-            cur.execute(stmt)
-        except sqlite3.OperationalError:
-            pass
-
-    # TICKETS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            desc TEXT NOT NULL,
-            owner TEXT NOT NULL,
-            category TEXT NOT NULL DEFAULT 'Annet',
-            priority TEXT NOT NULL DEFAULT 'Middels',
-            device TEXT NOT NULL DEFAULT '',
-            status TEXT NOT NULL DEFAULT 'Åpen',
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            updated_at TEXT NOT NULL DEFAULT (datetime('now')),
-            closed_at TEXT
+# -----------------------------
+# ATTACHMENTS
+# -----------------------------
+def add_attachment(
+    ticket_id: int,
+    stored_filename: str,
+    original_filename: str,
+    uploaded_by: str,
+    blob_sha256: Optional[str] = None,
+    size: Optional[int] = None,
+) -> int:
+    """
+    Med blob_sha256 registreres bloben (om den er ny) i samme transaksjon;
+    refcount telles opp av trg_attachments_blob_insert.
+    """
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        if blob_sha256 is not None:
+            cur.execute(
+                "INSERT INTO blobs (sha256, size) VALUES (?, ?) ON CONFLICT(sha256) DO NOTHING",
+                (blob_sha256, int(size or 0)),
+            )
+        cur.execute(
+            """
+            INSERT INTO attachments (ticket_id, stored_filename, original_filename, uploaded_by, blob_sha256)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (int(ticket_id), stored_filename, original_filename, uploaded_by, blob_sha256),
         )
-    """)
+        attachment_id = int(cur.lastrowid)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return attachment_id
 
-    # ATTACHMENTS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS attachments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ticket_id INTEGER NOT NULL,
-            stored_filename TEXT NOT NULL,
-            original_filename TEXT NOT NULL,
-            uploaded_by TEXT NOT NULL,
-            uploaded_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY(ticket_id) REFERENCES tickets(id)
-        )
-    """)
 
-    # NOTIFICATIONS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user TEXT NOT NULL,
-            message TEXT NOT NULL,
-            link TEXT,
-            read INTEGER NOT NULL DEFAULT 0,
-            created_at TEXT NOT NULL DEFAULT (datetime('now'))
-        )
-    """)
+def delete_unreferenced_blobs(remove: Callable[[str], None], limit: int = 500) -> int:
+    """
+    Sletter opptil `limit` blober ingen vedlegg peker på. remove(sha256)
+    fjerner filen, og kalles mens skrivelåsen holdes: et samtidig opplastet
+    vedlegg med samme innhold får enten refcount > 0 først (og bloben står),
+    eller lagres etterpå og finner filen borte (blobstore.save skriver den da
+    på nytt).
+    """
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT sha256 FROM blobs WHERE refcount = 0 LIMIT ?", (int(limit),))
+        hashes = [r["sha256"] for r in cur.fetchall()]
+        for sha in hashes:
+            remove(sha)
+        cur.executemany("DELETE FROM blobs WHERE sha256 = ? AND refcount = 0", [(h,) for h in hashes])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(hashes)
+
+
+def get_attachments(ticket_id: int) -> List[Dict[str, Any]]:
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, ticket_id, stored_filename, original_filename, uploaded_by, uploaded_at
+        FROM attachments
+        WHERE ticket_id = ?
+        ORDER BY id DESC
+        """,
+        (int(ticket_id),),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def get_attachments_for_tickets(
+    ticket_ids: List[int], owner: Optional[str] = None
+) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Vedlegg for mange saker i én spørring (i stedet for get_attachments per sak).
+    Med owner tas bare saker brukeren eier med. Saker uten vedlegg er ikke med.
+    """
+    ids = sorted({int(i) for i in ticket_ids})
+    if not ids:
+        return {}
+
+    placeholders = ",".join("?" for _ in ids)
+    sql = f"""
+        SELECT a.id, a.ticket_id, a.stored_filename, a.original_filename, a.uploaded_by, a.uploaded_at
+        FROM attachments a
+        JOIN tickets t ON t.id = a.ticket_id
+        WHERE a.ticket_id IN ({placeholders})
+    """
+    params: List[Any] = list(ids)
+    if owner is not None:
+        sql += " AND t.owner = ?"
+        params.append(owner)
+    sql += " ORDER BY a.ticket_id, a.id DESC"
+
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    conn.close()
+
+    grouped: Dict[int, List[Dict[str, Any]]] = {}
+    for r in rows:
+        grouped.setdefault(r["ticket_id"], []).append(dict(r))
+    return grouped
+
+
+def count_attachments_for_tickets(ticket_ids: List[int]) -> Dict[int, int]:
+    """Antall vedlegg per sak for en hel side med saker, i én spørring."""
+    ids = sorted({int(i) for i in ticket_ids})
+    if not ids:
+        return {}
+
+    placeholders = ",".join("?" for _ in ids)
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT ticket_id, COUNT(*) AS n
+        FROM attachments
+        WHERE ticket_id IN ({placeholders})
+        GROUP BY ticket_id
+        """,
+        ids,
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return {r["ticket_id"]: r["n"] for r in rows}
 
-    # RATINGS
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS ratings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ticket_id INTEGER NOT NULL UNIQUE,
-            user TEXT NOT NULL,
-            stars INTEGER NOT NULL,
-            feedback TEXT NOT NULL DEFAULT '',
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY(ticket_id) REFERENCES tickets(id)
-        )
-    """)
 
-    # ARTICLES
+def get_attachment(attachment_id: int) -> Optional[Dict[str, Any]]:
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, ticket_id, stored_filename, original_filename, uploaded_by, uploaded_at
+        FROM attachments
+        WHERE id = ?
+        """,
+        (int(attachment_id),),
+    )
+    row = cur.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+# -----------------------------
+# ADMIN: Users & Tickets helpers
+# -----------------------------
+
+def get_all_users() -> List[Dict[str, Any]]:
+    """Get all users for admin management"""
+    conn = _conn()
+    cur = conn.cursor()
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            author TEXT NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            updated_at TEXT
-        )
+        SELECT username, role, email, created_at, last_login
+        FROM users
+        ORDER BY created_at DESC
     """)
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
 
-    # ACTIVITY
+def change_user_role(username: str, new_role: str) -> None:
+    """Change user's role (admin only)"""
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("UPDATE users SET role = ? WHERE username = ?", (new_role, username))
+    conn.commit()
+    conn.close()
+
+
+def assign_ticket(ticket_id: int, assigned_to: str) -> None:
+    """Assign ticket to support user"""
+    conn = _conn()
+    cur = conn.cursor()
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS activity (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user TEXT NOT NULL,
-            details TEXT NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now'))
-        )
-    """)
+        UPDATE tickets
+        SET assigned_to = ?, updated_at = datetime('now')
+        WHERE id = ?
+    """, (assigned_to, ticket_id))
+    conn.commit()
+    conn.close()
 
-    # PASSWORD RESETS (NY)
+
+def update_ticket_priority(ticket_id: int, priority: str) -> None:
+    """Update ticket priority"""
+    conn = _conn()
+    cur = conn.cursor()
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS password_resets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            code TEXT NOT NULL,
-            channel TEXT NOT NULL, -- 'email' eller 'sms'
-            sent_to TEXT NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            expires_at TEXT NOT NULL,
-            used INTEGER NOT NULL DEFAULT 0
-        )
-    """)
+        UPDATE tickets
+        SET priority = ?, updated_at = datetime('now')
+        WHERE id = ?
+    """, (priority, ticket_id))
+    conn.commit()
+    conn.close()
 
-    # Opprett admin/support uten hardkodet passord
-    cur.execute("SELECT 1 FROM users WHERE username = 'admin'")
-    if not cur.fetchone():
-        admin_pw = os.environ.get("ADMIN_PASSWORD")
-        if not admin_pw:
-            logger.warning("ADMIN_PASSWORD ikke satt. Admin-bruker ble ikke opprettet.")
-        else:
-            cur.execute(
-                "INSERT INTO users (username, pw_hash, role) VALUES (?, ?, ?)",
-                ("admin", generate_password_hash(admin_pw, method="pbkdf2:sha256"), "support"),
-            )
-            logger.info("Admin/support bruker opprettet (admin).")
 
+def delete_ticket_db(ticket_id: int) -> None:
+    """Delete ticket permanently"""
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM attachments WHERE ticket_id = ?", (ticket_id,))
+    cur.execute("DELETE FROM ratings WHERE ticket_id = ?", (ticket_id,))
+    cur.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
     conn.commit()
     conn.close()
 
 
+
 # -----------------------------
 # USERS
 # -----------------------------
@@ -811,8 +1332,8 @@ def get_user(username: str) -> Optional[Dict[str, Any]]:
     cur = conn.cursor()
     try:
         cur.execute(
-            "SELECT username, pw_hash, role, email, phone, last_login, notify_email, notify_inapp, notify_sms "
-            "FROM users WHERE username = ?",
+            "SELECT username, pw_hash, role, email, phone, last_login, notify_email, notify_inapp, notify_sms, "
+            "email_digest FROM users WHERE username = ?",
             (username,),
         )
         row = cur.fetchone()
@@ -937,6 +1458,27 @@ def get_all_users() -> list[dict]:
     return [dict(r) for r in rows]
 
 
+def get_users_page(
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+) -> Dict[str, Any]:
+    # Sortert på brukernavn (UNIQUE-indeks), så cursoren er selve brukernavnet
+    return _keyset_page(
+        "SELECT username, role, email, created_at, last_login FROM users",
+        [], [], "username", "username", after, before, limit, descending=False,
+    )
+
+
+def count_users_by_role() -> Dict[str, int]:
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("SELECT role, COUNT(*) AS c FROM users GROUP BY role")
+    counts = {r["role"]: int(r["c"]) for r in cur.fetchall()}
+    conn.close()
+    return counts
+
+
 def change_user_role(username: str, role: str) -> None:
     conn = _conn()
     cur = conn.cursor()
@@ -972,14 +1514,17 @@ def assign_ticket(ticket_id: int, assigned_to: str) -> None:
 def update_ticket_priority(ticket_id: int, priority: str) -> None:
     conn = _conn()
     cur = conn.cursor()
+    # Ny SLA-frist regnes fra opprettelsen; varslene nullstilles
     cur.execute(
         """
         UPDATE tickets
         SET priority = ?,
-            updated_at = datetime('now')
+            updated_at = datetime('now'),
+            due_at = datetime(created_at, ?),
+            sla_notified = 0
         WHERE id = ?
         """,
-        (priority.strip(), ticket_id),
+        (priority.strip(), sla.due_modifier(priority), ticket_id),
     )
     conn.commit()
     conn.close()
@@ -997,84 +1542,760 @@ def delete_ticket_db(ticket_id: int) -> None:
     conn.commit()
     conn.close()
 
-    import secrets
-from datetime import datetime, timedelta
 
-def set_password_hash(username: str, pw_hash: str) -> None:
+# -----------------------------
+# BULK-OPERASJONER PÅ SAKER
+# -----------------------------
+# Hver funksjon kjører i én transaksjon (én commit/fsync uansett antall saker)
+# og returnerer antall saker som faktisk ble endret. Saker som allerede har
+# ønsket verdi hoppes over, så de verken telles, logges eller varsles.
+BULK_CHUNK = 500  # ids per IN (...) – godt under SQLITE_MAX_VARIABLE_NUMBER
+
+
+def _bulk_ids(ticket_ids) -> List[int]:
+    return sorted({int(i) for i in ticket_ids})
+
+
+def _bulk_targets(cur: sqlite3.Cursor, ids: List[int], where_sql: str = "", where_params: Tuple = ()) -> List[sqlite3.Row]:
+    rows: List[sqlite3.Row] = []
+    for i in range(0, len(ids), BULK_CHUNK):
+        chunk = ids[i:i + BULK_CHUNK]
+        placeholders = ",".join("?" for _ in chunk)
+        cur.execute(
+            f"SELECT id, owner FROM tickets WHERE id IN ({placeholders}) {where_sql}",
+            (*chunk, *where_params),
+        )
+        rows.extend(cur.fetchall())
+    return rows
+
+
+def _bulk_ticket_update(
+    ticket_ids,
+    actor: str,
+    update_sql: str,
+    update_params: Tuple,
+    activity_text: str,
+    notification: Optional[str] = None,
+    link: Optional[str] = None,
+    where_sql: str = "",
+    where_params: Tuple = (),
+    webhook_event: Optional[str] = None,
+    webhook_data: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Felles løype for bulk-endringer: finner sakene som skal endres, kjører
+    UPDATE med executemany og skriver aktivitetslogg og eiervarsler (kun til
+    brukere med notify_inapp = 1, som i add_notification) i samme transaksjon.
+    `activity_text` og `notification` formateres med {id}. Med `webhook_event`
+    legges hendelsen også i webhook-køen for hver sak (webhooks.py).
+    """
+    ids = _bulk_ids(ticket_ids)
+    if not ids:
+        return 0
+
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("UPDATE users SET pw_hash=? WHERE username=?", (pw_hash, username))
-    conn.commit()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        targets = _bulk_targets(cur, ids, where_sql, where_params)
+
+        cur.executemany(update_sql, [(*update_params, r["id"]) for r in targets])
+        affected = max(cur.rowcount, 0)
+
+        cur.executemany(
+            "INSERT INTO activity (user, details) VALUES (?, ?)",
+            [(actor, activity_text.format(id=r["id"])) for r in targets],
+        )
+        if notification:
+            cur.executemany(
+                """
+                INSERT INTO notifications (user, message, link)
+                SELECT username, ?, ? FROM users WHERE username = ? AND notify_inapp = 1
+                """,
+                [(notification.format(id=r["id"]), link, r["owner"]) for r in targets],
+            )
+            cur.executemany(
+                f"""
+                INSERT INTO digest_items (user, message, link, due_at)
+                SELECT username, ?, ?, {_digest_due_sql()} FROM users u
+                WHERE username = ? AND notify_email = 1 AND COALESCE(email, '') != ''
+                """,
+                [(notification.format(id=r["id"]), link, r["owner"]) for r in targets],
+            )
+        if webhook_event:
+            _insert_webhook_events(cur, [
+                (webhook_event, {"ticket_id": r["id"], "owner": r["owner"], "actor": actor, **(webhook_data or {})})
+                for r in targets
+            ])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if notification:
+        _unread_cache.invalidate(*{r["owner"] for r in targets})
+    return affected
+
+
+def close_tickets(ticket_ids, actor: str, link: Optional[str] = None) -> int:
+    return _bulk_ticket_update(
+        ticket_ids,
+        actor,
+        """
+        UPDATE tickets
+        SET status = 'Lukket',
+            updated_at = datetime('now'),
+            closed_at = datetime('now')
+        WHERE id = ?
+        """,
+        (),
+        activity_text="Lukket sak #{id}",
+        notification=f"Sak #{{id}} ble lukket av support ({actor}).",
+        link=link,
+        where_sql="AND status != 'Lukket'",
+        webhook_event="ticket.closed",
+    )
+
+
+def assign_tickets(ticket_ids, assigned_to: str, actor: str, link: Optional[str] = None) -> int:
+    assigned_to = assigned_to.strip()
+    return _bulk_ticket_update(
+        ticket_ids,
+        actor,
+        "UPDATE tickets SET assigned_to = ?, updated_at = datetime('now') WHERE id = ?",
+        (assigned_to,),
+        activity_text=f"Tildelte sak #{{id}} til {assigned_to}",
+        notification=f"Sak #{{id}} er tildelt {assigned_to}",
+        link=link,
+        where_sql="AND assigned_to IS NOT ?",
+        where_params=(assigned_to,),
+        webhook_event="ticket.assigned",
+        webhook_data={"assigned_to": assigned_to},
+    )
+
+
+def update_tickets_priority(ticket_ids, priority: str, actor: str) -> int:
+    priority = priority.strip()
+    return _bulk_ticket_update(
+        ticket_ids,
+        actor,
+        """
+        UPDATE tickets
+        SET priority = ?, updated_at = datetime('now'), due_at = datetime(created_at, ?), sla_notified = 0
+        WHERE id = ?
+        """,
+        (priority, sla.due_modifier(priority)),
+        activity_text=f"Endret prioritet på sak #{{id}} til {priority}",
+        where_sql="AND priority != ?",
+        where_params=(priority,),
+    )
+
+
+def delete_tickets(ticket_ids, actor: str) -> int:
+    ids = _bulk_ids(ticket_ids)
+    if not ids:
+        return 0
+
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        targets = [(r["id"],) for r in _bulk_targets(cur, ids)]
+        cur.executemany("DELETE FROM attachments WHERE ticket_id = ?", targets)
+        cur.executemany("DELETE FROM ratings WHERE ticket_id = ?", targets)
+        cur.executemany("DELETE FROM tickets WHERE id = ?", targets)
+        affected = max(cur.rowcount, 0)
+        cur.executemany(
+            "INSERT INTO activity (user, details) VALUES (?, ?)",
+            [(actor, f"Slettet sak #{tid} permanent") for (tid,) in targets],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return affected
+
+
+# -----------------------------
+# STATISTIKK (dashbord)
+# -----------------------------
+# Tallene for support leses fra rollup-tabellene som triggerne i migrering 5
+# holder oppdatert, så kostnaden er uavhengig av hvor mange saker som finnes.
+CRITICAL_PRIORITIES = ("Kritisk", "Høy")
+
+
+def get_dashboard_stats(owner: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Nøkkeltall for dashbordet: aktive saker, kritiske (åpne med Kritisk/Høy),
+    lukket i dag (UTC, som created_at/closed_at) og snittlig løsningstid i timer.
+    Med owner aggregeres brukerens egne saker via idx_tickets_owner.
+    """
+    conn = _conn()
+    cur = conn.cursor()
+    placeholders = ",".join("?" for _ in CRITICAL_PRIORITIES)
+
+    if owner is not None:
+        cur.execute(
+            f"""
+            SELECT
+                COALESCE(SUM(status != 'Lukket'), 0) AS total_active,
+                COALESCE(SUM(status != 'Lukket' AND priority IN ({placeholders})), 0) AS critical,
+                COALESCE(SUM(status = 'Lukket' AND date(closed_at) = date('now')), 0) AS closed_today,
+                AVG(CASE WHEN status = 'Lukket' AND closed_at IS NOT NULL
+                         THEN (julianday(closed_at) - julianday(created_at)) * 24 END) AS avg_hours
+            FROM tickets
+            WHERE owner = ?
+            """,
+            (*CRITICAL_PRIORITIES, owner),
+        )
+        stats = dict(cur.fetchone())
+        conn.close()
+        return stats
+
+    cur.execute(
+        f"""
+        SELECT
+            (SELECT COALESCE(SUM(n), 0) FROM ticket_gauges
+             WHERE dim = 'status' AND value != 'Lukket') AS total_active,
+            (SELECT COALESCE(SUM(n), 0) FROM ticket_gauges
+             WHERE dim = 'open_priority' AND value IN ({placeholders})) AS critical,
+            (SELECT COALESCE(SUM(n), 0) FROM ticket_rollups
+             WHERE grain = 'day' AND bucket = date('now') AND event = 'closed' AND dim = 'all') AS closed_today,
+            (SELECT SUM(total_seconds) / 3600.0 / NULLIF(SUM(n), 0) FROM resolution_histogram) AS avg_hours
+        """,
+        CRITICAL_PRIORITIES,
+    )
+    stats = dict(cur.fetchone())
+    conn.close()
+    return stats
+
+
+def get_ticket_rollups(
+    grain: str = "day",
+    event: str = "created",
+    dim: str = "all",
+    limit: int = 30,
+) -> List[Dict[str, Any]]:
+    """Siste rader (nyeste bøtte først) for én hendelse, f.eks. saker opprettet per dag."""
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT bucket, value, n
+        FROM ticket_rollups
+        WHERE grain = ? AND event = ? AND dim = ?
+        ORDER BY bucket DESC
+        LIMIT ?
+        """,
+        (grain, event, dim, int(limit)),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def get_resolution_histogram() -> List[Dict[str, Any]]:
+    """Løsningstid-bøtter i stigende rekkefølge; bucket_hours = -1 er den åpne øvre bøtta."""
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("SELECT bucket_hours, n, total_seconds FROM resolution_histogram")
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return sorted(rows, key=lambda r: (r["bucket_hours"] < 0, r["bucket_hours"]))
+
+
+# -----------------------------
+# SLA
+# -----------------------------
+def get_sla_deadlines(until: str) -> List[Dict[str, Any]]:
+    """Åpne saker med frist før `until` som ikke har fått bruddvarsel (for SlaTimer)."""
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, due_at, sla_notified
+        FROM tickets
+        WHERE status = 'Åpen' AND due_at <= ? AND sla_notified < ?
+        ORDER BY due_at
+        """,
+        (until, sla.BREACHED),
+    )
+    rows = cur.fetchall()
     conn.close()
+    return [dict(r) for r in rows]
+
 
-def create_reset_code(username: str, channel: str, destination: str, minutes_valid: int = 15) -> str:
-    code = f"{secrets.randbelow(1000000):06d}"  # 6 siffer
-    expires = (datetime.utcnow() + timedelta(minutes=minutes_valid)).strftime("%Y-%m-%d %H:%M:%S")
+def mark_sla_notified(ticket_id: int, level: int, due_at: str) -> bool:
+    """
+    Registrerer at SLA-varsel på `level` er sendt. Returnerer False hvis saken
+    er lukket, har fått ny frist eller allerede er varslet på dette nivået.
+    """
     conn = _conn()
     cur = conn.cursor()
     cur.execute(
-        "INSERT INTO password_resets(username, code, channel, destination, expires_at, consumed) "
-        "VALUES(?,?,?,?,?,0)",
-        (username, code, channel, destination, expires)
+        """
+        UPDATE tickets
+        SET sla_notified = ?
+        WHERE id = ? AND status = 'Åpen' AND due_at = ? AND sla_notified < ?
+        """,
+        (int(level), int(ticket_id), due_at, int(level)),
     )
     conn.commit()
+    changed = cur.rowcount == 1
     conn.close()
-    return code
+    return changed
 
-def verify_reset_code(username: str, code: str) -> bool:
+
+def _split_due_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    if not cursor:
+        return None
+    due_at, sep, row_id = cursor.rpartition("|")
+    try:
+        return (due_at, int(row_id)) if sep and due_at else None
+    except ValueError:
+        return None
+
+
+def get_sla_queue_page(
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+) -> Dict[str, Any]:
+    """
+    Åpne saker sortert på tid igjen (due_at, så id) via idx_tickets_sla.
+    Cursoren er "due_at|id" siden flere saker kan ha samme frist.
+    Returnerer samme form som _keyset_page.
+    """
+    limit = max(1, min(int(limit), 200))
+    backwards = before is not None and after is None
+    cursor = _split_due_cursor(before if backwards else after)
+    if cursor is None:
+        # Ugyldig eller manglende cursor gir første side
+        backwards, after = False, None
+
+    sql = "SELECT * FROM tickets WHERE status = 'Åpen' AND due_at IS NOT NULL"
+    args: List[Any] = []
+    if cursor:
+        sql += f" AND (due_at, id) {'<' if backwards else '>'} (?, ?)"
+        args += list(cursor)
+    order = "DESC" if backwards else "ASC"
+    sql += f" ORDER BY due_at {order}, id {order} LIMIT ?"
+    args.append(limit + 1)
+
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(sql, args)
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+
+    def key(r):
+        return f"{r['due_at']}|{r['id']}"
+
+    return {
+        "rows": rows,
+        "next": key(rows[-1]) if rows and has_next else None,
+        "prev": key(rows[0]) if rows and has_prev else None,
+    }
+
+
+# -----------------------------
+# E-POST-UTBOKS (se outbox.py og migrering 13)
+# -----------------------------
+def enqueue_email(recipients: List[str], subject: str, body: str) -> int:
+    """Legger en e-post i utboksen. Sendes av bakgrunnstråden i outbox.py."""
     conn = _conn()
     cur = conn.cursor()
     cur.execute(
-        "SELECT * FROM password_resets WHERE username=? AND code=? AND consumed=0 "
-        "ORDER BY id DESC LIMIT 1",
-        (username, code)
+        "INSERT INTO email_outbox (recipients, subject, body) VALUES (?, ?, ?)",
+        (json.dumps(list(recipients)), subject, body),
     )
-    row = cur.fetchone()
+    conn.commit()
+    email_id = cur.lastrowid
     conn.close()
-    if not row:
-        return False
+    return email_id
+
+
+def claim_emails(limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """
+    Henter opptil `limit` e-poster som skal sendes nå, og skyver
+    next_attempt_at `lease_seconds` fram så ingen annen sender tar dem.
+    Blir de verken sendt eller lagt tilbake (prosessen dør), sendes de etter leien.
+    """
+    conn = _conn()
+    cur = conn.cursor()
     try:
-        exp = datetime.strptime(row["expires_at"], "%Y-%m-%d %H:%M:%S")
+        cur.execute("BEGIN IMMEDIATE")
+        rows = [
+            dict(r)
+            for r in cur.execute(
+                """
+                SELECT id, recipients, subject, body, attempts FROM email_outbox
+                WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+                ORDER BY next_attempt_at
+                LIMIT ?
+                """,
+                (int(limit),),
+            )
+        ]
+        cur.executemany(
+            "UPDATE email_outbox SET next_attempt_at = datetime('now', ?) WHERE id = ?",
+            [(f"+{int(lease_seconds)} seconds", r["id"]) for r in rows],
+        )
+        conn.commit()
     except Exception:
-        return False
-    return datetime.utcnow() <= exp
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    for r in rows:
+        r["recipients"] = json.loads(r["recipients"])
+    return rows
 
-def consume_reset_code(username: str, code: str) -> None:
+
+def mark_emails_sent(email_ids: List[int]) -> None:
+    """Sendte e-poster fjernes fra utboksen."""
+    conn = _conn()
+    conn.executemany("DELETE FROM email_outbox WHERE id = ?", [(int(i),) for i in email_ids])
+    conn.commit()
+    conn.close()
+
+
+def release_emails(email_ids: List[int], delay_seconds: int) -> None:
+    """Legger e-poster tilbake uten å telle et forsøk (serveren var nede, ikke e-posten som feilet)."""
+    conn = _conn()
+    conn.executemany(
+        "UPDATE email_outbox SET next_attempt_at = datetime('now', ?) WHERE id = ? AND status = 'pending'",
+        [(f"+{int(delay_seconds)} seconds", int(i)) for i in email_ids],
+    )
+    conn.commit()
+    conn.close()
+
+
+def fail_email(email_id: int, error: str, retry_in_seconds: Optional[int] = None) -> None:
+    """Teller et mislykket forsøk. Uten `retry_in_seconds` gis e-posten opp (status = 'failed')."""
+    conn = _conn()
+    conn.execute(
+        """
+        UPDATE email_outbox
+        SET attempts = attempts + 1,
+            last_error = ?,
+            status = ?,
+            next_attempt_at = datetime('now', ?)
+        WHERE id = ?
+        """,
+        (
+            str(error)[:500],
+            "pending" if retry_in_seconds is not None else "failed",
+            f"+{int(retry_in_seconds or 0)} seconds",
+            int(email_id),
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_email_outbox_stats() -> Dict[str, Any]:
+    """Antall ventende (og hvor mange som kan sendes nå), eldste ventende og antall som er gitt opp."""
+    conn = _conn()
+    cur = conn.cursor()
+    pending, due, oldest = cur.execute(
+        """
+        SELECT COUNT(*),
+               COALESCE(SUM(next_attempt_at <= datetime('now')), 0),
+               MIN(created_at)
+        FROM email_outbox WHERE status = 'pending'
+        """
+    ).fetchone()
+    failed = cur.execute("SELECT COUNT(*) FROM email_outbox WHERE status = 'failed'").fetchone()[0]
+    conn.close()
+    return {"pending": pending, "due": due, "failed": failed, "oldest_pending": oldest}
+
+
+# -----------------------------
+# E-POSTSAMMENDRAG (se digest.py og migrering 14)
+# -----------------------------
+def claim_digest_items(max_users: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """
+    Alle varsler som skal med i sammendrag nå, for opptil `max_users` brukere
+    (alltid alle varslene til en bruker, så det blir én e-post per bruker).
+    due_at skyves `lease_seconds` fram til enqueue_digest_emails() sletter dem.
+    """
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        users = [
+            r[0]
+            for r in cur.execute(
+                "SELECT DISTINCT user FROM digest_items WHERE due_at <= datetime('now') LIMIT ?",
+                (int(max_users),),
+            )
+        ]
+        rows = [
+            dict(r)
+            for r in cur.execute(
+                """
+                SELECT d.id, d.user, d.message, d.link, d.created_at, u.email, u.notify_email
+                FROM digest_items d
+                LEFT JOIN users u ON u.username = d.user
+                WHERE d.due_at <= datetime('now') AND d.user IN (SELECT value FROM json_each(?))
+                ORDER BY d.user, d.id
+                """,
+                (json.dumps(users),),
+            )
+        ]
+        cur.executemany(
+            "UPDATE digest_items SET due_at = datetime('now', ?) WHERE id = ?",
+            [(f"+{int(lease_seconds)} seconds", r["id"]) for r in rows],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows
+
+
+def enqueue_digest_emails(emails: List[Tuple[str, str, str]], item_ids: List[int]) -> int:
+    """
+    Legger (mottaker, emne, tekst) i utboksen og sletter varslene de
+    oppsummerer, i én transaksjon. Returnerer antall e-poster.
+    """
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany(
+            "INSERT INTO email_outbox (recipients, subject, body) VALUES (?, ?, ?)",
+            [(json.dumps([to]), subject, body) for to, subject, body in emails],
+        )
+        cur.executemany("DELETE FROM digest_items WHERE id = ?", [(int(i),) for i in item_ids])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(emails)
+
+
+# -----------------------------
+# WEBHOOKS (se webhooks.py og migrering 16)
+# -----------------------------
+_WEBHOOK_FANOUT_SQL = """
+    INSERT INTO webhook_deliveries (subscription_id, event, payload)
+    SELECT id, ?, ? FROM webhook_subscriptions
+    WHERE active = 1 AND (events = '*' OR instr(',' || events || ',', ',' || ? || ',') > 0)
+"""
+
+
+def _insert_webhook_events(cur: sqlite3.Cursor, events: List[Tuple[str, Dict[str, Any]]]) -> int:
+    """Én leveranse per aktivt abonnement som vil ha hendelsen (kalles i en åpen transaksjon)."""
+    cur.executemany(_WEBHOOK_FANOUT_SQL, [(event, json.dumps(data), event) for event, data in events])
+    return max(cur.rowcount, 0)
+
+
+def create_webhook_subscription(url: str, events: List[str], created_by: str) -> Dict[str, Any]:
+    """Nytt abonnement med tilfeldig hemmelighet for signaturen. Hemmeligheten vises bare her."""
+    secret = secrets.token_hex(32)
     conn = _conn()
     cur = conn.cursor()
     cur.execute(
-        "UPDATE password_resets SET consumed=1 WHERE username=? AND code=?",
-        (username, code)
+        "INSERT INTO webhook_subscriptions (url, secret, events, created_by) VALUES (?, ?, ?, ?)",
+        (url, secret, ",".join(events) or "*", created_by),
     )
     conn.commit()
+    sub_id = cur.lastrowid
     conn.close()
+    return {"id": sub_id, "url": url, "secret": secret, "events": ",".join(events) or "*"}
 
 
-def get_all_users():
+def get_webhook_subscriptions() -> List[Dict[str, Any]]:
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT username, role, email, created_at, last_login
-        FROM users
-        ORDER BY username ASC
-    """)
+    cur.execute(
+        """
+        SELECT s.id, s.url, s.events, s.active, s.created_by, s.created_at,
+               (SELECT COUNT(*) FROM webhook_deliveries d WHERE d.subscription_id = s.id) AS pending
+        FROM webhook_subscriptions s
+        ORDER BY s.id
+        """
+    )
     rows = cur.fetchall()
     conn.close()
-    return rows
+    return [dict(r) for r in rows]
 
 
-def change_user_role(username: str, role: str):
+def delete_webhook_subscription(sub_id: int) -> bool:
+    """Sletter abonnementet og leveransene som venter (trigger). Døde leveranser beholdes."""
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("UPDATE users SET role=? WHERE username=?", (role, username))
+    cur.execute("DELETE FROM webhook_subscriptions WHERE id = ?", (int(sub_id),))
     conn.commit()
+    deleted = cur.rowcount == 1
     conn.close()
+    return deleted
 
 
-def delete_user_db(username: str):
+def enqueue_webhook_events(events: List[Tuple[str, Dict[str, Any]]]) -> int:
+    """Legger (hendelse, data) i køen for alle abonnenter. Returnerer antall leveranser."""
+    if not events:
+        return 0
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE username=?", (username,))
+    created = _insert_webhook_events(cur, events)
     conn.commit()
     conn.close()
+    return created
 
+
+def claim_webhook_deliveries(
+    limit: int, lease_seconds: int, exclude_subscriptions: Sequence[int] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Henter opptil `limit` leveranser som skal sendes nå, med url og
+    hemmelighet, og skyver next_attempt_at fram (som claim_emails).
+    Abonnementene i `exclude_subscriptions` (med en POST underveis) hoppes over.
+    """
+    exclude = [int(i) for i in exclude_subscriptions]
+    exclude_sql = f"AND d.subscription_id NOT IN ({','.join('?' for _ in exclude)})" if exclude else ""
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        rows = [
+            dict(r)
+            for r in cur.execute(
+                f"""
+                SELECT d.id, d.subscription_id, d.event, d.payload, d.attempts, d.created_at, s.url, s.secret
+                FROM webhook_deliveries d
+                JOIN webhook_subscriptions s ON s.id = d.subscription_id
+                WHERE d.next_attempt_at <= datetime('now') {exclude_sql}
+                ORDER BY d.next_attempt_at
+                LIMIT ?
+                """,
+                (*exclude, int(limit)),
+            )
+        ]
+        cur.executemany(
+            "UPDATE webhook_deliveries SET next_attempt_at = datetime('now', ?) WHERE id = ?",
+            [(f"+{int(lease_seconds)} seconds", r["id"]) for r in rows],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    for r in rows:
+        r["payload"] = json.loads(r["payload"])
+    return rows
+
+
+def complete_webhook_deliveries(delivery_ids: List[int]) -> None:
+    conn = _conn()
+    conn.executemany("DELETE FROM webhook_deliveries WHERE id = ?", [(int(i),) for i in delivery_ids])
+    conn.commit()
+    conn.close()
+
+
+def retry_webhook_deliveries(delivery_ids: List[int], error: str, delay_seconds: int) -> None:
+    conn = _conn()
+    conn.executemany(
+        """
+        UPDATE webhook_deliveries
+        SET attempts = attempts + 1, last_error = ?, next_attempt_at = datetime('now', ?)
+        WHERE id = ?
+        """,
+        [(str(error)[:500], f"+{int(delay_seconds)} seconds", int(i)) for i in delivery_ids],
+    )
+    conn.commit()
+    conn.close()
+
+
+def dead_letter_webhook_deliveries(delivery_ids: List[int], error: str) -> None:
+    """Flytter leveranser som har brukt opp forsøkene til webhook_dead_letters."""
+    params = [(str(error)[:500], int(i)) for i in delivery_ids]
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany(
+            """
+            INSERT INTO webhook_dead_letters (subscription_id, event, payload, attempts, last_error, created_at)
+            SELECT subscription_id, event, payload, attempts + 1, ?, created_at
+            FROM webhook_deliveries WHERE id = ?
+            """,
+            params,
+        )
+        cur.executemany("DELETE FROM webhook_deliveries WHERE id = ?", [(i,) for _, i in params])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def get_webhook_dead_letters(limit: int = 50) -> List[Dict[str, Any]]:
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM webhook_dead_letters ORDER BY id DESC LIMIT ?", (int(limit),))
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def requeue_webhook_dead_letter(dead_id: int) -> bool:
+    """Legger en død leveranse tilbake i køen med nye forsøk (hvis abonnementet finnes)."""
+    conn = _conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(
+            """
+            INSERT INTO webhook_deliveries (subscription_id, event, payload, created_at)
+            SELECT l.subscription_id, l.event, l.payload, l.created_at
+            FROM webhook_dead_letters l
+            JOIN webhook_subscriptions s ON s.id = l.subscription_id
+            WHERE l.id = ?
+            """,
+            (int(dead_id),),
+        )
+        requeued = cur.rowcount == 1
+        if requeued:
+            cur.execute("DELETE FROM webhook_dead_letters WHERE id = ?", (int(dead_id),))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return requeued
+
+
+def get_webhook_queue_stats() -> Dict[str, Any]:
+    """Leveranser som kan sendes nå, som venter på nytt forsøk, og antall døde."""
+    conn = _conn()
+    cur = conn.cursor()
+    due, oldest = cur.execute(
+        "SELECT COUNT(*), MIN(created_at) FROM webhook_deliveries WHERE next_attempt_at <= datetime('now')"
+    ).fetchone()
+    waiting = cur.execute(
+        "SELECT COUNT(*) FROM webhook_deliveries WHERE next_attempt_at > datetime('now')"
+    ).fetchone()[0]
+    dead = cur.execute("SELECT COUNT(*) FROM webhook_dead_letters").fetchone()[0]
+    conn.close()
+    return {"due": due, "waiting": waiting, "oldest_due": oldest, "dead_letters": dead}
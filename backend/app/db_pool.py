@@ -0,0 +1,255 @@
+"""
+Gjenbruk av SQLite-tilkoblinger for db.py.
+
+Tidligere åpnet hver funksjon i db.py en helt ny sqlite3-tilkobling (med mkdir)
+og lukket den igjen, slik at én sidevisning kunne åpne dusinvis av tilkoblinger.
+
+Her holdes et begrenset antall tilkoblinger åpne per databasefil. PRAGMA-ene
+settes én gang når tilkoblingen opprettes. Innenfor en Flask-app-kontekst deler
+alle kall samme tilkobling (lagret i `flask.g`) og den leveres tilbake til
+poolen ved teardown. Utenfor Flask gjenbrukes tilkoblingen per tråd.
+
+db.py trenger ikke å endre seg: `conn.close()` lukker ikke lenger den fysiske
+tilkoblingen, men leverer den tilbake (og ruller tilbake en transaksjon som
+ikke ble committet, slik en ekte close() ville gjort).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from flask import current_app, g, has_app_context
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+_EXTENSION_KEY = "helpdesk_db"
+
+
+def _pragmas() -> list[str]:
+    return [
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        f"PRAGMA busy_timeout = {int(Config.DB_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA cache_size = {int(Config.DB_CACHE_SIZE)}",
+        f"PRAGMA mmap_size = {int(Config.DB_MMAP_SIZE)}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+
+
+class ConnectionPool:
+    """
+    Begrenset pool av sqlite3-tilkoblinger mot én databasefil.
+
+    size=0 slår av gjenbruk (ny tilkobling per lån, lukkes ved retur),
+    som tilsvarer gammel oppførsel og brukes i benchmarken.
+    """
+
+    def __init__(self, path: Path, size: int, timeout: float) -> None:
+        self.path = Path(path)
+        self.size = max(0, int(size))
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size) if self.size else None
+        self._stats_lock = threading.Lock()
+        self.stats = {"connects": 0, "acquires": 0, "checkouts": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in _pragmas():
+            conn.execute(pragma)
+        self._count("connects")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        self._count("acquires")
+        if self._slots is None:
+            return self._connect()
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"Ingen ledig databasetilkobling etter {self.timeout}s (pool size={self.size})"
+            )
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Ødelagt tilkobling: kast den og frigjør plassen
+            conn.close()
+            if self._slots is not None:
+                self._slots.release()
+            return
+
+        if self._slots is None:
+            conn.close()
+            return
+
+        self._idle.put(conn)
+        self._slots.release()
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class _Lease:
+    """Én utlånt tilkobling med teller for nestede _conn()-kall."""
+
+    __slots__ = ("pool", "conn", "depth")
+
+    def __init__(self, pool: ConnectionPool, conn: sqlite3.Connection) -> None:
+        self.pool = pool
+        self.conn = conn
+        self.depth = 0
+
+
+class PooledConnection:
+    """
+    Tynn wrapper rundt sqlite3.Connection. Alt delegeres til den ekte
+    tilkoblingen, bortsett fra close() som leverer tilbake til poolen.
+    """
+
+    __slots__ = ("_lease", "_request_bound", "_closed")
+
+    def __init__(self, lease: _Lease, request_bound: bool) -> None:
+        self._lease = lease
+        self._request_bound = request_bound
+        self._closed = False
+        lease.depth += 1
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._lease.conn, name)
+
+    def __enter__(self) -> "PooledConnection":
+        self._lease.conn.__enter__()
+        return self
+
+    def __exit__(self, *exc) -> Any:
+        return self._lease.conn.__exit__(*exc)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        lease = self._lease
+        lease.depth -= 1
+        if lease.depth > 0:
+            return
+
+        if self._request_bound:
+            # Behold tilkoblingen til teardown, men ikke la en ucommittet
+            # transaksjon lekke inn i neste kall i samme request.
+            if lease.conn.in_transaction:
+                lease.conn.rollback()
+            return
+
+        leases = _thread_leases()
+        key = str(lease.pool.path)
+        if leases.get(key) is lease:
+            del leases[key]
+        lease.pool.release(lease.conn)
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool(path: Path) -> ConnectionPool:
+    key = str(path)
+    pool = _pools.get(key)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        # Etter fork (f.eks. gunicorn) må barneprosessen ha egne tilkoblinger
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(path, Config.DB_POOL_SIZE, Config.DB_POOL_TIMEOUT)
+            _pools[key] = pool
+        return pool
+
+
+def _thread_leases() -> Dict[str, _Lease]:
+    leases = getattr(_local, "leases", None)
+    if leases is None:
+        leases = _local.leases = {}
+    return leases
+
+
+def _request_bound() -> bool:
+    return has_app_context() and _EXTENSION_KEY in current_app.extensions
+
+
+def connection(path: Path) -> PooledConnection:
+    """
+    Returnerer en tilkobling til `path`. Inne i en app-kontekst gjenbrukes
+    samme tilkobling for hele requesten, ellers per tråd.
+    """
+    pool = get_pool(path)
+    pool._count("checkouts")
+
+    if pool.size == 0:
+        # Gjenbruk avslått: ny tilkobling per kall, som før
+        return PooledConnection(_Lease(pool, pool.acquire()), request_bound=False)
+
+    key = str(path)
+    request_bound = _request_bound()
+    if request_bound:
+        leases = g.setdefault("_db_leases", {})
+    else:
+        leases = _thread_leases()
+
+    lease = leases.get(key)
+    if lease is None:
+        lease = _Lease(pool, pool.acquire())
+        leases[key] = lease
+
+    return PooledConnection(lease, request_bound)
+
+
+def release_request_connections(exc: Optional[BaseException] = None) -> None:
+    leases = g.pop("_db_leases", None)
+    if not leases:
+        return
+    for lease in leases.values():
+        lease.pool.release(lease.conn)
+
+
+def pool_stats(path: Path) -> Dict[str, int]:
+    pool = get_pool(path)
+    return dict(pool.stats, size=pool.size, idle=pool._idle.qsize())
+
+
+def init_app(app) -> None:
+    """Kobler tilkoblings-poolen til app-konteksten (én tilkobling per request)."""
+    app.extensions[_EXTENSION_KEY] = True
+    app.teardown_appcontext(release_request_connections)
@@ -0,0 +1,222 @@
+"""
+Gjenkjenning av nesten like saker når en ny sak sendes inn.
+
+Ved driftsavbrudd kommer det mange nesten identiske saker ("får ikke nett",
+"Får ikke nett!!"), og hver av dem sendte tidligere varsel og e-post til hele
+support. Nå regnes en MinHash-signatur over normalisert tittel + beskrivelse,
+og LSH-bøtter (BANDS bånd à ROWS verdier) gir kandidater uten å sammenligne
+mot alle åpne saker. Treff vises for brukeren, som kan koble saken sin til en
+eksisterende sak i stedet for å varsle hele support på nytt.
+
+Signaturene lagres i ticket_signatures (migrering 9), så indeksen i hver
+prosess bygges fra databasen og ikke fra teksten. Nye saker fra andre
+prosesser plukkes opp ved neste oppslag (id > sist lastet), og lukkede saker
+filtreres bort når kandidatene slås opp i tickets.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import Config
+
+# Hvor ofte saker med endret tekst (slettet signatur) ses etter
+BACKFILL_SECONDS = 60
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # 4 rader per bånd: ~50 % likhet gir treff med høy sannsynlighet
+SHINGLE = 4
+
+# Småord som ikke sier noe om hva saken gjelder
+STOPWORDS = frozenset(
+    "jeg meg min mitt mine du det den de er var har har hadde og eller i på til fra med for som en et ei "
+    "at av kan vil skal ikke noe når hva hvordan hei takk "
+    "i me my the a an is it to of on in and or not can".split()
+)
+
+Signature = Tuple[int, ...]
+
+
+def normalize(text: str) -> str:
+    """Små bokstaver, uten diakritika og tegnsetting, og uten småord."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    words = re.findall(r"\w+", text)
+    return " ".join(w for w in words if w not in STOPWORDS)
+
+
+def shingles(text: str) -> Set[str]:
+    """
+    Tegn-4-gram innenfor hvert ord (ordet omgitt av mellomrom), så "nett" og
+    "nettet" deler de fleste, mens tilfeldige tekster deler få (gram på tvers
+    av ordgrenser ga høy grunnlikhet mellom helt ulike saker).
+    """
+    grams: Set[str] = set()
+    for word in normalize(text).split():
+        padded = f" {word} "
+        grams.update(padded[i:i + SHINGLE] for i in range(max(1, len(padded) - SHINGLE + 1)))
+    return grams
+
+
+def _hashes(gram: str) -> array:
+    # NUM_PERM uavhengige 32-bits hasher i ett kall: SHAKE-128 gir så mange
+    # bytes vi ber om, og er lik i alle prosesser (i motsetning til hash())
+    return array("I", hashlib.shake_128(gram.encode("utf-8")).digest(NUM_PERM * 4))
+
+
+def signature(title: str, desc: str = "") -> Optional[Signature]:
+    """MinHash-signatur (NUM_PERM verdier), eller None for tom tekst."""
+    grams = shingles(f"{title} {desc}")
+    if not grams:
+        return None
+    # Minste hash per posisjon over alle grammene (min/zip kjører i C)
+    return tuple(map(min, zip(*map(_hashes, grams))))
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimert Jaccard-likhet: andelen like posisjoner i signaturene."""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def to_blob(sig: Optional[Signature]) -> bytes:
+    # Tom blob = saken har ingen tekst å sammenligne (lagres så den ikke regnes ut igjen)
+    return array("I", sig or ()).tobytes()
+
+
+def from_blob(blob: bytes) -> Signature:
+    arr = array("I")
+    arr.frombytes(blob)
+    return tuple(arr)
+
+
+def _bands(sig: Signature) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(i, sig[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+
+class DuplicateIndex:
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = threshold if threshold is not None else Config.DUPLICATE_THRESHOLD
+        self._sigs: Dict[int, Signature] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = defaultdict(set)
+        self._max_id = 0
+        self._backfill_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+    # -- indeks ------------------------------------------------------------
+    def add(self, ticket_id: int, sig: Signature) -> None:
+        with self._lock:
+            self._remove(ticket_id)
+            self._sigs[ticket_id] = sig
+            for band in _bands(sig):
+                self._buckets[band].add(ticket_id)
+            self._max_id = max(self._max_id, ticket_id)
+
+    def _remove(self, ticket_id: int) -> None:
+        sig = self._sigs.pop(ticket_id, None)
+        if sig is None:
+            return
+        for band in _bands(sig):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(ticket_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def remove(self, *ticket_ids: int) -> None:
+        with self._lock:
+            for ticket_id in ticket_ids:
+                self._remove(ticket_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sigs.clear()
+            self._buckets.clear()
+            self._max_id = 0
+            self._backfill_at = 0.0
+
+    def candidates(self, sig: Signature, limit: int = 5) -> List[Tuple[int, float]]:
+        """(ticket_id, likhet) for saker over terskelen, mest like først. Ingen I/O."""
+        with self._lock:
+            ids: Set[int] = set()
+            for band in _bands(sig):
+                bucket = self._buckets.get(band)
+                if bucket:
+                    ids |= bucket
+            scored = [(tid, similarity(sig, self._sigs[tid])) for tid in ids]
+        scored = [c for c in scored if c[1] >= self.threshold]
+        scored.sort(key=lambda c: (-c[1], -c[0]))
+        return scored[:limit]
+
+    # -- database ----------------------------------------------------------
+    def sync(self) -> int:
+        """Laster signaturer lagt til siden sist (også fra andre prosesser)."""
+        from . import db
+
+        if time.monotonic() >= self._backfill_at:
+            self._backfill()
+            self._backfill_at = time.monotonic() + BACKFILL_SECONDS
+        rows = db.get_open_ticket_signatures(after_id=self._max_id)
+        for ticket_id, blob in rows:
+            sig = from_blob(blob)
+            if len(sig) == NUM_PERM:
+                self.add(ticket_id, sig)
+            else:
+                self._max_id = max(self._max_id, ticket_id)
+        return len(rows)
+
+    def _backfill(self) -> None:
+        # Saker der tittel/beskrivelse er endret har fått signaturen slettet
+        # (trigger i migrering 9); regn den ut på nytt og last alt inn igjen
+        from . import db
+
+        missing = db.get_open_tickets_without_signature()
+        if not missing:
+            return
+        while missing:
+            db.save_ticket_signatures([(t["id"], to_blob(signature(t["title"], t["desc"]))) for t in missing])
+            missing = db.get_open_tickets_without_signature(after_id=missing[-1]["id"])
+        self.clear()
+
+    def remember(self, ticket_id: int, sig: Optional[Signature]) -> None:
+        """Lagrer signaturen til en ny sak og legger den i indeksen."""
+        from . import db
+
+        db.save_ticket_signatures([(ticket_id, to_blob(sig))])
+        if sig is not None:
+            self.add(ticket_id, sig)
+
+    def find_similar(self, sig: Optional[Signature], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Åpne saker som ligner, med "similarity", mest like først."""
+        from . import db
+
+        if sig is None:
+            return []
+        self.sync()
+        limit = limit or Config.DUPLICATE_MAX_SUGGESTIONS
+        scored = self.candidates(sig, limit=limit * 2)
+        if not scored:
+            return []
+
+        open_tickets = {t["id"]: t for t in db.get_open_tickets_by_ids([tid for tid, _ in scored])}
+        closed = [tid for tid, _ in scored if tid not in open_tickets]
+        if closed:
+            self.remove(*closed)
+
+        result = []
+        for tid, score in scored:
+            if tid in open_tickets:
+                result.append({**open_tickets[tid], "similarity": score})
+        return result[:limit]
+
+
+index = DuplicateIndex()
@@ -0,0 +1,142 @@
+"""
+E-postsammendrag av varsler (users.notify_email / users.email_digest).
+
+Varsler lages som før én rad per hendelse i notifications. For brukere med
+notify_email = 1 og en e-postadresse legges samme varsel også i
+digest_items, med due_at satt ut fra brukerens valg:
+
+- immediate: neste gang jobben kjører (hvert DIGEST_INTERVAL_SECONDS sekund)
+- hourly: neste hele time
+- daily: neste gang klokka er DIGEST_DAILY_HOUR (UTC)
+
+DigestJob henter alle ferdige varsler for opptil DIGEST_BATCH_USERS brukere
+om gangen, lager én e-post per bruker og legger alle i utboksen i én
+transaksjon (db.enqueue_digest_emails). Utboksen (outbox.py) sender dem i
+batch over samme SMTP-tilkobling. Tusen varsler til samme bruker i en
+travel time blir dermed én e-post.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = ("immediate", "hourly", "daily")
+FREQUENCY_LABELS = {
+    "immediate": "Med en gang",
+    "hourly": "Samlet hver time",
+    "daily": "Samlet én gang i døgnet",
+}
+
+
+def render_digest(user: str, items: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Emne og tekst for ett sammendrag. Viser de DIGEST_MAX_ITEMS nyeste varslene."""
+    count = len(items)
+    subject = "Helpdesk: 1 nytt varsel" if count == 1 else f"Helpdesk: {count} nye varsler"
+    shown = items[-Config.DIGEST_MAX_ITEMS:]
+
+    lines = [f"Hei {user}!", "", "Dette har skjedd siden sist:", ""]
+    for item in reversed(shown):
+        line = f"- {item['created_at']} UTC: {item['message']}"
+        if item.get("link"):
+            line += f"\n  {Config.BASE_URL.rstrip('/')}{item['link']}"
+        lines.append(line)
+    if count > len(shown):
+        lines.append(f"... og {count - len(shown)} eldre varsler.")
+    lines += [
+        "",
+        f"Se alle varsler: {Config.BASE_URL.rstrip('/')}/notifications",
+        "Du kan endre hvor ofte du får e-post under Innstillinger.",
+        "",
+        "Hilsen\nHelpdesk",
+    ]
+    return subject, "\n".join(lines)
+
+
+class DigestJob:
+    def __init__(self, interval_seconds: Optional[float] = None, batch_users: Optional[int] = None):
+        self.interval = interval_seconds or Config.DIGEST_INTERVAL_SECONDS
+        self.batch_users = batch_users or Config.DIGEST_BATCH_USERS
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.stats: Dict[str, Any] = {"runs": 0, "digests": 0, "items": 0, "skipped": 0, "last_run_ms": 0.0}
+
+    def run_pending(self) -> int:
+        """Lager og legger i utboksen alle sammendrag som er klare. Returnerer antall e-poster."""
+        from . import db, outbox
+
+        start = time.perf_counter()
+        total = 0
+        while True:
+            rows = db.claim_digest_items(self.batch_users, Config.EMAIL_LEASE_SECONDS)
+            if not rows:
+                break
+
+            emails = []
+            for user, group in groupby(rows, key=lambda r: r["user"]):
+                items = list(group)
+                # Brukeren kan ha skrudd av e-post (eller blitt slettet) etter at varselet ble laget
+                if not items[0]["notify_email"] or not items[0]["email"]:
+                    self.stats["skipped"] += len(items)
+                    continue
+                subject, body = render_digest(user, items)
+                emails.append((items[0]["email"], subject, body))
+                self.stats["items"] += len(items)
+
+            total += db.enqueue_digest_emails(emails, [r["id"] for r in rows])
+
+        self.stats["runs"] += 1
+        self.stats["digests"] += total
+        self.stats["last_run_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        if total:
+            outbox.sender.notify()
+        return total
+
+    # -- tråd --------------------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"E-postsammendrag feilet: {e}")
+            self._stop.wait(timeout=self.interval)
+
+    def ensure_started(self) -> None:
+        # pid-sjekk som i SlaTimer: tråder overlever ikke fork
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="email-digest", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+
+job = DigestJob()
+
+
+def init_app(app) -> None:
+    """Starter sammendragsjobben i hver worker-prosess ved første request."""
+    if not app.config.get("DIGEST_TIMER_ENABLED", True):
+        return
+
+    @app.before_request
+    def _start_digest_job():
+        job.ensure_started()
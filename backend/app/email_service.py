@@ -71,7 +71,9 @@ def _mail_configured(app=None) -> bool:
 
 def _send_message(app, subject: str, recipients: List[str], body: str) -> bool:
     """
-    Sender e-post. Returnerer True hvis sendt, ellers False.
+    Legger e-posten i utboksen (email_outbox) og vekker senderen i outbox.py.
+    Returnerer True hvis den ble lagt i kø, ellers False. Selve sendingen
+    skjer i bakgrunnen, så en treg SMTP-server forsinker ikke requesten.
     """
     if Mail is None or Message is None or mail is None:
         logger.warning("E-post kan ikke sendes (flask_mail mangler eller er ikke init).")
@@ -80,14 +82,15 @@ def _send_message(app, subject: str, recipients: List[str], body: str) -> bool:
     if not recipients:
         return False
 
+    from . import db, outbox
+
     try:
-        with app.app_context():
-            msg = Message(subject=subject, recipients=recipients, body=body)
-            mail.send(msg)  # type: ignore[union-attr]
-        return True
+        db.enqueue_email(recipients, subject, body)
     except Exception as e:
-        logger.error(f"Kunne ikke sende e-post: {e}")
+        logger.error(f"Kunne ikke legge e-post i utboksen: {e}")
         return False
+    outbox.sender.notify()
+    return True
 
 
 def send_ticket_created_email(ticket: Dict[str, Any], user_email: Optional[str] = None, app=None) -> bool:
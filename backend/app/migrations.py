@@ -0,0 +1,927 @@
+"""
+Versjonerte skjema-migreringer for SQLite-databasen.
+
+Tidligere kjørte `init_db()` på hver eneste request (CREATE TABLE IF NOT EXISTS
++ ALTER TABLE som feilet og ble svelget). Nå ligger skjemaet som en ordnet
+liste med steg, og tabellen `schema_version` husker hvilke som er kjørt.
+`migrate()` kalles én gang ved oppstart (create_app) eller fra CLI:
+
+    flask --app app migrate-db           # kjør ventende migreringer
+    flask --app app migrate-db --status  # vis versjon
+
+Nye steg legges til nederst i MIGRATIONS med neste versjonsnummer.
+Eksisterende steg skal aldri endres etter at de er tatt i bruk.
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+    # batched=True: steget committer selv underveis (se backfill()),
+    # og kjøres derfor ikke inne i én stor transaksjon.
+    batched: bool = False
+
+
+# -----------------------------
+# Hjelpere
+# -----------------------------
+def _columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    """Legger til kolonne bare hvis den mangler (eldre databaser)."""
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def backfill(
+    conn: sqlite3.Connection,
+    table: str,
+    set_sql: str,
+    where_sql: str = "1",
+    batch_size: int = 1000,
+) -> int:
+    """
+    Oppdaterer store tabeller i små rowid-intervaller med commit mellom hver
+    batch, slik at skrivelåsen bare holdes kort og appen kan kjøre samtidig.
+    Må være idempotent (where_sql bør utelukke rader som allerede er fylt ut),
+    så et avbrutt steg kan kjøres på nytt. Returnerer antall oppdaterte rader.
+    """
+    row = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    if row is None or row[0] is None:
+        return 0
+
+    low, high = int(row[0]) - 1, int(row[1])
+    updated = 0
+    while low < high:
+        upper = low + batch_size
+        cur = conn.execute(
+            f"UPDATE {table} SET {set_sql} WHERE rowid > ? AND rowid <= ? AND ({where_sql})",
+            (low, upper),
+        )
+        conn.commit()
+        updated += cur.rowcount
+        low = upper
+    return updated
+
+
+# -----------------------------
+# Migreringssteg
+# -----------------------------
+def _m001_base_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            pw_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            email TEXT,
+            phone TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            last_login TEXT,
+            notify_email INTEGER NOT NULL DEFAULT 1,
+            notify_inapp INTEGER NOT NULL DEFAULT 1,
+            notify_sms INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Databaser laget før varselpreferansene fantes
+    add_column(conn, "users", "email", "TEXT")
+    add_column(conn, "users", "phone", "TEXT")
+    add_column(conn, "users", "last_login", "TEXT")
+    add_column(conn, "users", "notify_email", "INTEGER NOT NULL DEFAULT 1")
+    add_column(conn, "users", "notify_inapp", "INTEGER NOT NULL DEFAULT 1")
+    add_column(conn, "users", "notify_sms", "INTEGER NOT NULL DEFAULT 0")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            desc TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            category TEXT NOT NULL DEFAULT 'Annet',
+            priority TEXT NOT NULL DEFAULT 'Middels',
+            device TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL DEFAULT 'Åpen',
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+            closed_at TEXT
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL,
+            stored_filename TEXT NOT NULL,
+            original_filename TEXT NOT NULL,
+            uploaded_by TEXT NOT NULL,
+            uploaded_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(ticket_id) REFERENCES tickets(id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT NOT NULL,
+            message TEXT NOT NULL,
+            link TEXT,
+            read INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL UNIQUE,
+            user TEXT NOT NULL,
+            stars INTEGER NOT NULL,
+            feedback TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(ticket_id) REFERENCES tickets(id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS articles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            author TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT NOT NULL,
+            details TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS password_resets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            code TEXT NOT NULL,
+            channel TEXT NOT NULL, -- 'email' eller 'sms'
+            sent_to TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            expires_at TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def _m002_article_cover_and_ticket_assignee(conn: sqlite3.Connection) -> None:
+    # create_article/update_article skriver cover_url, assign_ticket skriver
+    # assigned_to – men ingen av kolonnene fantes i grunnskjemaet.
+    add_column(conn, "articles", "cover_url", "TEXT")
+    add_column(conn, "tickets", "assigned_to", "TEXT")
+
+
+# Indekser for oppslagene db.py gjør på hver side. Hold denne listen i synk
+# med tests/test_query_plans.py, som feiler hvis et oppslag scanner en stor tabell.
+HOT_PATH_INDEXES = [
+    # get_tickets(owner=...), slett brukers saker
+    "CREATE INDEX IF NOT EXISTS idx_tickets_owner ON tickets(owner, id DESC)",
+    # get_notifications / mark_all_notifications_read
+    "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user, id DESC)",
+    # count_notifications (hver side, via inject_notification_count)
+    "CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(user) WHERE read = 0",
+    # get_attachments / delete_ticket_db
+    "CREATE INDEX IF NOT EXISTS idx_attachments_ticket ON attachments(ticket_id)",
+    # verify_reset_code / consume_reset_code / create_reset_code
+    "CREATE INDEX IF NOT EXISTS idx_password_resets_user_code ON password_resets(username, code)",
+    # get_support_users (varsler ved ny sak og vurdering)
+    "CREATE INDEX IF NOT EXISTS idx_users_role ON users(role, username)",
+]
+
+
+def _m003_hot_path_indexes(conn: sqlite3.Connection) -> None:
+    for stmt in HOT_PATH_INDEXES:
+        conn.execute(stmt)
+
+
+def _m004_unread_notification_counter(conn: sqlite3.Connection) -> None:
+    # Antall uleste varsler per bruker, holdt oppdatert av triggere på
+    # notifications, så badgen i base.html er ett primærnøkkel-oppslag.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notification_counts (
+            user TEXT PRIMARY KEY,
+            unread INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_insert
+        AFTER INSERT ON notifications WHEN NEW.read = 0
+        BEGIN
+            INSERT INTO notification_counts (user, unread) VALUES (NEW.user, 1)
+            ON CONFLICT(user) DO UPDATE SET unread = unread + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_update
+        AFTER UPDATE OF read, user ON notifications
+        WHEN (OLD.read = 0) != (NEW.read = 0) OR OLD.user != NEW.user
+        BEGIN
+            UPDATE notification_counts SET unread = unread - 1
+            WHERE user = OLD.user AND OLD.read = 0;
+            INSERT INTO notification_counts (user, unread)
+            SELECT NEW.user, 1 WHERE NEW.read = 0
+            ON CONFLICT(user) DO UPDATE SET unread = unread + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_delete
+        AFTER DELETE ON notifications WHEN OLD.read = 0
+        BEGIN
+            UPDATE notification_counts SET unread = unread - 1 WHERE user = OLD.user;
+        END
+    """)
+
+    conn.execute("DELETE FROM notification_counts")
+    conn.execute("""
+        INSERT INTO notification_counts (user, unread)
+        SELECT user, COUNT(*) FROM notifications WHERE read = 0 GROUP BY user
+    """)
+
+
+# Grenser (timer) for histogrammet over løsningstid; siste bøtte er "mer enn".
+RESOLUTION_BUCKETS_HOURS = [1, 4, 8, 24, 72, 168]
+
+
+def _resolution_bucket_sql(created: str, closed: str) -> str:
+    hours = f"((julianday({closed}) - julianday({created})) * 24)"
+    cases = " ".join(f"WHEN {hours} < {h} THEN {h}" for h in RESOLUTION_BUCKETS_HOURS)
+    return f"CASE {cases} ELSE -1 END"
+
+
+def _rollup_upserts(event: str, row: str, ts: str, sign: int = 1) -> str:
+    """INSERT ... ON CONFLICT-setninger for én hendelse: time/dag × all/prioritet/kategori."""
+    stmts = []
+    for grain, bucket in (("hour", f"strftime('%Y-%m-%d %H:00', {ts})"), ("day", f"date({ts})")):
+        for dim, value in (("all", "''"), ("priority", f"{row}.priority"), ("category", f"{row}.category")):
+            stmts.append(
+                f"INSERT INTO ticket_rollups (grain, bucket, event, dim, value, n) "
+                f"VALUES ('{grain}', {bucket}, '{event}', '{dim}', {value}, {sign}) "
+                f"ON CONFLICT(grain, bucket, event, dim, value) DO UPDATE SET n = n + {sign};"
+            )
+    return "\n".join(stmts)
+
+
+def _gauge(dim: str, value: str, sign: int, when: str = "1") -> str:
+    return (
+        f"INSERT INTO ticket_gauges (dim, value, n) SELECT '{dim}', {value}, {sign} WHERE {when} "
+        f"ON CONFLICT(dim, value) DO UPDATE SET n = n + {sign};"
+    )
+
+
+def _m005_ticket_stats_rollups(conn: sqlite3.Connection) -> None:
+    # Dashbord-statistikk uten å lese tickets-tabellen:
+    #   ticket_gauges:     nåverdier (saker per status, åpne per prioritet/kategori)
+    #   ticket_rollups:    opprettet/lukket per time og dag, totalt og per prioritet/kategori
+    #   resolution_histogram: antall lukkede saker per løsningstid-bøtte + sum sekunder
+    # Alt holdes oppdatert av triggere på tickets, på samme måte som notification_counts.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_gauges (
+            dim TEXT NOT NULL,   -- 'status' | 'open_priority' | 'open_category'
+            value TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dim, value)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_rollups (
+            grain TEXT NOT NULL,  -- 'hour' | 'day'
+            bucket TEXT NOT NULL, -- 'YYYY-MM-DD HH:00' | 'YYYY-MM-DD' (UTC, som created_at)
+            event TEXT NOT NULL,  -- 'created' | 'closed'
+            dim TEXT NOT NULL,    -- 'all' | 'priority' | 'category'
+            value TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (grain, bucket, event, dim, value)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS resolution_histogram (
+            bucket_hours INTEGER PRIMARY KEY, -- øvre grense i timer, -1 = lengre enn siste grense
+            n INTEGER NOT NULL DEFAULT 0,
+            total_seconds INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    is_open_new = "NEW.status != 'Lukket'"
+    is_open_old = "OLD.status != 'Lukket'"
+    closed_at = "COALESCE(NEW.closed_at, datetime('now'))"
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_stats_insert
+        AFTER INSERT ON tickets
+        BEGIN
+            {_gauge('status', 'NEW.status', 1)}
+            {_gauge('open_priority', 'NEW.priority', 1, is_open_new)}
+            {_gauge('open_category', 'NEW.category', 1, is_open_new)}
+            {_rollup_upserts('created', 'NEW', 'NEW.created_at')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_stats_status
+        AFTER UPDATE OF status ON tickets
+        WHEN OLD.status != NEW.status
+        BEGIN
+            {_gauge('status', 'OLD.status', -1)}
+            {_gauge('status', 'NEW.status', 1)}
+            {_gauge('open_priority', 'OLD.priority', -1, f'{is_open_old} AND NOT ({is_open_new})')}
+            {_gauge('open_category', 'OLD.category', -1, f'{is_open_old} AND NOT ({is_open_new})')}
+            {_gauge('open_priority', 'NEW.priority', 1, f'{is_open_new} AND NOT ({is_open_old})')}
+            {_gauge('open_category', 'NEW.category', 1, f'{is_open_new} AND NOT ({is_open_old})')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_stats_closed
+        AFTER UPDATE OF status ON tickets
+        WHEN NEW.status = 'Lukket' AND OLD.status != 'Lukket'
+        BEGIN
+            {_rollup_upserts('closed', 'NEW', closed_at)}
+            INSERT INTO resolution_histogram (bucket_hours, n, total_seconds)
+            VALUES (
+                {_resolution_bucket_sql('NEW.created_at', closed_at)}, 1,
+                MAX(0, CAST((julianday({closed_at}) - julianday(NEW.created_at)) * 86400 AS INTEGER))
+            )
+            ON CONFLICT(bucket_hours) DO UPDATE SET
+                n = n + 1, total_seconds = total_seconds + excluded.total_seconds;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_stats_priority
+        AFTER UPDATE OF priority ON tickets
+        WHEN OLD.priority != NEW.priority AND {is_open_new} AND {is_open_old}
+        BEGIN
+            {_gauge('open_priority', 'OLD.priority', -1)}
+            {_gauge('open_priority', 'NEW.priority', 1)}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_stats_delete
+        AFTER DELETE ON tickets
+        BEGIN
+            {_gauge('status', 'OLD.status', -1)}
+            {_gauge('open_priority', 'OLD.priority', -1, is_open_old)}
+            {_gauge('open_category', 'OLD.category', -1, is_open_old)}
+        END
+    """)
+
+    # Backfill fra eksisterende saker
+    for table in ("ticket_gauges", "ticket_rollups", "resolution_histogram"):
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("INSERT INTO ticket_gauges SELECT 'status', status, COUNT(*) FROM tickets GROUP BY status")
+    for dim, col in (("open_priority", "priority"), ("open_category", "category")):
+        conn.execute(
+            f"INSERT INTO ticket_gauges SELECT '{dim}', {col}, COUNT(*) "
+            f"FROM tickets WHERE status != 'Lukket' GROUP BY {col}"
+        )
+    for event, ts, where in (
+        ("created", "created_at", "1"),
+        ("closed", "closed_at", "status = 'Lukket' AND closed_at IS NOT NULL"),
+    ):
+        for grain, bucket in (("hour", f"strftime('%Y-%m-%d %H:00', {ts})"), ("day", f"date({ts})")):
+            for dim, value in (("all", "''"), ("priority", "priority"), ("category", "category")):
+                conn.execute(
+                    f"INSERT INTO ticket_rollups "
+                    f"SELECT '{grain}', {bucket}, '{event}', '{dim}', {value}, COUNT(*) "
+                    f"FROM tickets WHERE {where} GROUP BY 2, 5"
+                )
+    conn.execute(f"""
+        INSERT INTO resolution_histogram (bucket_hours, n, total_seconds)
+        SELECT {_resolution_bucket_sql('created_at', 'closed_at')}, COUNT(*),
+               SUM(MAX(0, CAST((julianday(closed_at) - julianday(created_at)) * 86400 AS INTEGER)))
+        FROM tickets
+        WHERE status = 'Lukket' AND closed_at IS NOT NULL
+        GROUP BY 1
+    """)
+
+
+def _m006_ticket_sla_due_at(conn: sqlite3.Connection) -> None:
+    # SLA-frist per sak (se sla.py). sla_notified: 0 = ingen varsel, 1 = frist
+    # nærmer seg, 2 = brutt. Indeksen gir både timerens vindu og sortering på
+    # tid igjen i support-visningen uten å scanne tabellen.
+    from .sla import due_modifier
+
+    add_column(conn, "tickets", "due_at", "TEXT")
+    add_column(conn, "tickets", "sla_notified", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_sla ON tickets(status, due_at)")
+    conn.commit()
+
+    for priority in ("Kritisk", "Høy", "Lav"):
+        backfill(
+            conn, "tickets",
+            f"due_at = datetime(created_at, '{due_modifier(priority)}')",
+            f"due_at IS NULL AND priority = '{priority}'",
+        )
+    backfill(conn, "tickets", f"due_at = datetime(created_at, '{due_modifier('Middels')}')", "due_at IS NULL")
+
+
+def _m007_articles_fts(conn: sqlite3.Connection) -> None:
+    # Fulltekstsøk i kunnskapsbasen (db.search_articles). External content-
+    # tabell: teksten lagres bare i articles, FTS-indeksen holdes i synk av
+    # triggere. remove_diacritics 2 gjør at "pa" også treffer "på".
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+            title, content,
+            content='articles', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_articles_fts_insert AFTER INSERT ON articles
+        BEGIN
+            INSERT INTO articles_fts (rowid, title, content) VALUES (NEW.id, NEW.title, NEW.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_articles_fts_delete AFTER DELETE ON articles
+        BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title, content)
+            VALUES ('delete', OLD.id, OLD.title, OLD.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_articles_fts_update AFTER UPDATE OF title, content ON articles
+        BEGIN
+            INSERT INTO articles_fts (articles_fts, rowid, title, content)
+            VALUES ('delete', OLD.id, OLD.title, OLD.content);
+            INSERT INTO articles_fts (rowid, title, content) VALUES (NEW.id, NEW.title, NEW.content);
+        END
+    """)
+    conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')")
+
+
+def _m008_tickets_fts(conn: sqlite3.Connection) -> None:
+    # Fulltekstsøk i saker for support (db.search_tickets), samme oppsett som
+    # articles_fts. Kolonnerekkefølgen brukes av snippet() i db.py.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+            title, desc, device, category,
+            content='tickets', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_fts_insert AFTER INSERT ON tickets
+        BEGIN
+            INSERT INTO tickets_fts (rowid, title, desc, device, category)
+            VALUES (NEW.id, NEW.title, NEW.desc, NEW.device, NEW.category);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_fts_delete AFTER DELETE ON tickets
+        BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, title, desc, device, category)
+            VALUES ('delete', OLD.id, OLD.title, OLD.desc, OLD.device, OLD.category);
+        END
+    """)
+    # Bare når de indekserte kolonnene endres – ikke ved lukking, tildeling o.l.
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_fts_update
+        AFTER UPDATE OF title, desc, device, category ON tickets
+        BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, title, desc, device, category)
+            VALUES ('delete', OLD.id, OLD.title, OLD.desc, OLD.device, OLD.category);
+            INSERT INTO tickets_fts (rowid, title, desc, device, category)
+            VALUES (NEW.id, NEW.title, NEW.desc, NEW.device, NEW.category);
+        END
+    """)
+    conn.execute("INSERT INTO tickets_fts (tickets_fts) VALUES ('rebuild')")
+
+
+def _m009_ticket_duplicates(conn: sqlite3.Connection) -> None:
+    # MinHash-signaturer for åpne saker (se dedup.py) og kobling fra en
+    # duplikat til saken den gjelder. Signaturene regnes ut i Python, så
+    # eksisterende åpne saker fylles inn i batcher her.
+    from .dedup import signature, to_blob
+
+    add_column(conn, "tickets", "duplicate_of", "INTEGER")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tickets_duplicate_of
+        ON tickets(duplicate_of) WHERE duplicate_of IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_signatures (
+            ticket_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_ticket_signatures_delete AFTER DELETE ON tickets
+        BEGIN
+            DELETE FROM ticket_signatures WHERE ticket_id = OLD.id;
+        END
+    """)
+    # Ny tekst gir ny signatur; den gamle slettes og regnes ut på nytt ved neste innlasting
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_ticket_signatures_update AFTER UPDATE OF title, desc ON tickets
+        BEGIN
+            DELETE FROM ticket_signatures WHERE ticket_id = OLD.id;
+        END
+    """)
+    conn.commit()
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, title, desc FROM tickets WHERE id > ? AND status = 'Åpen' ORDER BY id LIMIT 1000",
+            (last_id,),
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "INSERT OR REPLACE INTO ticket_signatures (ticket_id, signature) VALUES (?, ?)",
+            [(r[0], to_blob(signature(r[1] or "", r[2] or ""))) for r in rows],
+        )
+        conn.commit()
+        last_id = rows[-1][0]
+
+
+def _m010_articles_fts_vocab(conn: sqlite3.Connection) -> None:
+    # Dokumentfrekvens per ord i kunnskapsbasen (db.suggest_articles velger
+    # de sjeldneste ordene i en chatmelding). fts5vocab leser rett fra
+    # articles_fts-indeksen og lagrer ingenting selv.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts_vocab
+        USING fts5vocab(articles_fts, 'row')
+    """)
+
+
+def _m011_chat_conversations(conn: sqlite3.Connection) -> None:
+    # Chatbot-samtaler lagres på serveren (før lå hele tilstanden i den
+    # signerte session-cookien). Cookien har bare den tilfeldige id-en, og
+    # hele samtalen ligger i chat_messages så support kan lese den.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_conversations (
+            id TEXT PRIMARY KEY,
+            user TEXT NOT NULL,
+            state TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_conversations_updated
+        ON chat_conversations(updated_at)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_conversations_user
+        ON chat_conversations(user, updated_at)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation
+        ON chat_messages(conversation_id, id)
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_chat_conversations_delete AFTER DELETE ON chat_conversations
+        BEGIN
+            DELETE FROM chat_messages WHERE conversation_id = OLD.id;
+        END
+    """)
+
+
+def _m012_chatbot_kb_versions(conn: sqlite3.Connection) -> None:
+    # Kunnskapsbasen til chatboten (emner, fraser, feilmønstre, løsninger)
+    # som JSON, én rad per versjon. Alle prosesser bruker nyeste rad; første
+    # versjon lastes fra app/data/chatbot_kb.json (se routes.get_bot).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chatbot_kb_versions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+
+
+def _m013_email_outbox(conn: sqlite3.Connection) -> None:
+    # E-post legges i en utboks i stedet for å sendes inne i requesten (se
+    # outbox.py). Sendte rader slettes; status = 'failed' blir liggende.
+    # next_attempt_at er både tidspunkt for neste forsøk og leiefristen mens
+    # en sender jobber med raden, så rader fra en prosess som dør sendes igjen.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipients TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL DEFAULT (datetime('now')),
+            last_error TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+        ON email_outbox(status, next_attempt_at)
+    """)
+
+
+def _m014_email_digests(conn: sqlite3.Connection) -> None:
+    # notify_email ble lagret, men aldri brukt. Varsler til brukere med
+    # notify_email = 1 legges nå også i digest_items, og digest.py samler dem
+    # til én e-post per bruker når vinduet (email_digest) er over. due_at
+    # settes når varselet lages: neste hele time for 'hourly', neste morgen
+    # for 'daily', og med en gang for 'immediate'.
+    add_column(conn, "users", "email_digest", "TEXT NOT NULL DEFAULT 'hourly'")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS digest_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT NOT NULL,
+            message TEXT NOT NULL,
+            link TEXT,
+            due_at TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_digest_items_due
+        ON digest_items(due_at)
+    """)
+
+
+def _m015_notification_coalescing(conn: sqlite3.Connection) -> None:
+    # Varsler av samme type (kind) til samme bruker slås sammen mens de er
+    # uleste og yngre enn NOTIFICATION_COALESCE_MINUTES (se db.notify_many):
+    # raden får count + 1, siste melding/lenke og ny updated_at i stedet for
+    # en ny rad. Eldre rader har kind = NULL og slås aldri sammen.
+    add_column(conn, "notifications", "kind", "TEXT")
+    add_column(conn, "notifications", "count", "INTEGER NOT NULL DEFAULT 1")
+    add_column(conn, "notifications", "updated_at", "TEXT")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_notifications_coalesce
+        ON notifications(user, kind, updated_at) WHERE read = 0
+    """)
+
+
+def _m016_webhooks(conn: sqlite3.Connection) -> None:
+    # Utgående webhooks (webhooks.py). Hver hendelse gir én rad i
+    # webhook_deliveries per abonnement som vil ha den, i samme transaksjon
+    # som endringen. Leverte rader slettes; etter WEBHOOK_MAX_ATTEMPTS
+    # forsøk flyttes de til webhook_dead_letters.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            secret TEXT NOT NULL,
+            events TEXT NOT NULL DEFAULT '*',
+            active INTEGER NOT NULL DEFAULT 1,
+            created_by TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscription_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL DEFAULT (datetime('now')),
+            last_error TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_due
+        ON webhook_deliveries(next_attempt_at)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_subscription
+        ON webhook_deliveries(subscription_id)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscription_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            failed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_webhook_subscriptions_delete AFTER DELETE ON webhook_subscriptions
+        BEGIN
+            DELETE FROM webhook_deliveries WHERE subscription_id = OLD.id;
+        END
+    """)
+
+
+def _m017_attachment_blobs(conn: sqlite3.Connection) -> None:
+    # Vedlegg lagres innholdsadressert (blobstore.py): filen ligger én gang
+    # under uploads/blobs/ab/cd/<sha256>, og hvert vedlegg peker på den med
+    # blob_sha256. refcount holdes oppdatert av triggerne under, så alle
+    # stedene som sletter vedlegg (også bulk-slettingen) teller ned; blober
+    # med refcount = 0 ryddes av blobstore.collect_garbage(). Eldre vedlegg
+    # har blob_sha256 = NULL og ligger som før direkte i uploads/.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced
+        ON blobs(sha256) WHERE refcount = 0
+    """)
+    add_column(conn, "attachments", "blob_sha256", "TEXT")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_attachments_blob_insert AFTER INSERT ON attachments
+        WHEN NEW.blob_sha256 IS NOT NULL
+        BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = NEW.blob_sha256;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_attachments_blob_delete AFTER DELETE ON attachments
+        WHEN OLD.blob_sha256 IS NOT NULL
+        BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = OLD.blob_sha256;
+        END
+    """)
+
+
+def _m018_ticket_drafts(conn: sqlite3.Connection) -> None:
+    # Utkastet som vises når en ny sak ligner på åpne saker (dedup.py). Før
+    # lå hele utkastet i session-cookien (som blir for stor med en lang
+    # beskrivelse), og vedleggene ble borte. Cookien har nå bare id-en, og
+    # vedleggene lagres som blober med referanse fra ticket_draft_files til
+    # saken opprettes eller utkastet går ut (TICKET_DRAFT_TTL_HOURS).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_drafts (
+            id TEXT PRIMARY KEY,
+            user TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ticket_drafts_created ON ticket_drafts(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ticket_drafts_user ON ticket_drafts(user)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_draft_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            draft_id TEXT NOT NULL,
+            blob_sha256 TEXT NOT NULL,
+            original_filename TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ticket_draft_files_draft ON ticket_draft_files(draft_id)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_ticket_draft_files_insert AFTER INSERT ON ticket_draft_files
+        BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = NEW.blob_sha256;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_ticket_draft_files_delete AFTER DELETE ON ticket_draft_files
+        BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = OLD.blob_sha256;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_ticket_drafts_delete AFTER DELETE ON ticket_drafts
+        BEGIN
+            DELETE FROM ticket_draft_files WHERE draft_id = OLD.id;
+        END
+    """)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "base_schema", _m001_base_schema),
+    Migration(2, "article_cover_and_ticket_assignee", _m002_article_cover_and_ticket_assignee),
+    Migration(3, "hot_path_indexes", _m003_hot_path_indexes),
+    Migration(4, "unread_notification_counter", _m004_unread_notification_counter),
+    Migration(5, "ticket_stats_rollups", _m005_ticket_stats_rollups),
+    Migration(6, "ticket_sla_due_at", _m006_ticket_sla_due_at, batched=True),
+    Migration(7, "articles_fts", _m007_articles_fts),
+    Migration(8, "tickets_fts", _m008_tickets_fts),
+    Migration(9, "ticket_duplicates", _m009_ticket_duplicates, batched=True),
+    Migration(10, "articles_fts_vocab", _m010_articles_fts_vocab),
+    Migration(11, "chat_conversations", _m011_chat_conversations),
+    Migration(12, "chatbot_kb_versions", _m012_chatbot_kb_versions),
+    Migration(13, "email_outbox", _m013_email_outbox),
+    Migration(14, "email_digests", _m014_email_digests),
+    Migration(15, "notification_coalescing", _m015_notification_coalescing),
+    Migration(16, "webhooks", _m016_webhooks),
+    Migration(17, "attachment_blobs", _m017_attachment_blobs),
+    Migration(18, "ticket_drafts", _m018_ticket_drafts),
+]
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+def _ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.commit()
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return int(row[0] or 0)
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """
+    Kjører alle ventende migreringer i rekkefølge. Trygt å kalle fra flere
+    prosesser samtidig: hvert steg tar skrivelåsen (BEGIN IMMEDIATE) og
+    sjekker versjonen på nytt før det kjøres. Returnerer versjonene som ble kjørt.
+    """
+    applied: List[int] = []
+    _ensure_version_table(conn)
+
+    for migration in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute(
+                "SELECT 1 FROM schema_version WHERE version = ?", (migration.version,)
+            ).fetchone()
+            if done:
+                conn.rollback()
+                continue
+
+            if migration.batched:
+                conn.rollback()
+                migration.apply(conn)
+                conn.execute("BEGIN IMMEDIATE")
+            else:
+                migration.apply(conn)
+
+            conn.execute(
+                "INSERT OR IGNORE INTO schema_version (version, name) VALUES (?, ?)",
+                (migration.version, migration.name),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migrering {migration.version} ({migration.name}) feilet")
+            raise
+
+        applied.append(migration.version)
+        logger.info(f"Migrering {migration.version} ({migration.name}) kjørt.")
+
+    return applied
+
+
+def init_app(app) -> None:
+    """Registrerer `flask migrate-db`."""
+    import click
+
+    @app.cli.command("migrate-db")
+    @click.option("--status", is_flag=True, help="Vis skjemaversjon uten å migrere.")
+    def migrate_db_command(status: bool) -> None:
+        from .db import _conn, init_db
+
+        if status:
+            conn = _conn()
+            version = current_version(conn)
+            conn.close()
+            click.echo(f"Skjemaversjon {version} av {MIGRATIONS[-1].version}")
+            return
+
+        init_db()
+        click.echo("Databasen er oppdatert.")
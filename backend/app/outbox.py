@@ -0,0 +1,300 @@
+"""
+E-post sendes fra en utboks i databasen (email_outbox, migrering 13).
+
+Før sendte tickets() e-postene selv, og _send_message() åpnet en ny
+SMTP/TLS-økt per melding, så en treg SMTP-server gjorde hver ny sak like
+treg. Nå legger email_service bare en rad i utboksen, og EMAIL_WORKERS
+bakgrunnstråder per prosess henter opptil EMAIL_BATCH_SIZE e-poster om
+gangen og sender dem over én tilkobling (mail.connect()).
+
+Feil håndteres på to nivåer:
+- en e-post som avvises (4xx) prøves igjen etter EMAIL_RETRY_SECONDS, doblet
+  for hvert forsøk; 5xx eller EMAIL_MAX_ATTEMPTS forsøk gir status 'failed'
+- får vi ikke kontakt med serveren, legges batchen tilbake uten å telle
+  forsøk. Etter EMAIL_BREAKER_THRESHOLD slike feil på rad åpnes bryteren, og
+  ingenting sendes på EMAIL_BREAKER_COOLDOWN sekunder. Deretter får én batch
+  prøve; går den bra, sendes det som normalt igjen.
+
+Radene leies (next_attempt_at skyves fram) mens de sendes, så flere
+prosesser kan dele utboksen, og en prosess som dør mister ingenting.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import smtplib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Om en batch kan sendes nå. Når pausen er over slipper bare én batch gjennom."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self._clock() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Ingenting ble sendt (tom utboks); neste batch får prøve i stedet."""
+        with self._lock:
+            self._probing = False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    self.opens += 1
+                self.state = OPEN
+                self.opened_at = self._clock()
+
+    def seconds_until_retry(self) -> float:
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (self._clock() - self.opened_at))
+
+
+def _smtp_code(error: Exception) -> Optional[int]:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return min(codes) if codes else None
+    return getattr(error, "smtp_code", None)
+
+
+def _connection_error(error: Exception) -> bool:
+    """Feil med tilkoblingen (hele batchen legges tilbake), ikke med én e-post."""
+    if isinstance(error, smtplib.SMTPServerDisconnected) or _smtp_code(error) == 421:
+        return True
+    # SMTPException arver fra OSError; de andre er socket-feil og tidsavbrudd
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class OutboxSender:
+    def __init__(
+        self,
+        app=None,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_seconds: Optional[float] = None,
+        retry_seconds: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.app = app
+        self.workers = workers or Config.EMAIL_WORKERS
+        self.batch_size = batch_size or Config.EMAIL_BATCH_SIZE
+        self.poll_interval = poll_seconds if poll_seconds is not None else Config.EMAIL_POLL_SECONDS
+        self.retry_seconds = retry_seconds if retry_seconds is not None else Config.EMAIL_RETRY_SECONDS
+        self.breaker = breaker or CircuitBreaker(Config.EMAIL_BREAKER_THRESHOLD, Config.EMAIL_BREAKER_COOLDOWN)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self.stats: Dict[str, Any] = {
+            "sent": 0, "retried": 0, "failed": 0, "batches": 0, "connections": 0, "connection_errors": 0,
+            "send_seconds": 0.0, "last_batch_ms": 0.0, "max_batch_ms": 0.0,
+        }
+
+    def _count(self, **deltas: float) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def metrics(self) -> Dict[str, Any]:
+        from . import db
+
+        with self._lock:
+            stats = dict(self.stats)
+        seconds = stats.pop("send_seconds")
+        return dict(
+            stats,
+            messages_per_sec=round(stats["sent"] / seconds, 1) if seconds else 0.0,
+            breaker=self.breaker.state,
+            breaker_opens=self.breaker.opens,
+            workers=self.workers,
+            outbox=db.get_email_outbox_stats(),
+        )
+
+    def notify(self) -> None:
+        """Vekker trådene (kalles når noe er lagt i utboksen)."""
+        self._wakeup.set()
+
+    # -- sending -----------------------------------------------------------
+    def run_once(self) -> int:
+        """Sender én batch. Returnerer antall e-poster som ble hentet fra utboksen."""
+        from . import db
+
+        if not self.breaker.allow():
+            return 0
+        try:
+            rows = db.claim_emails(self.batch_size, Config.EMAIL_LEASE_SECONDS)
+        except Exception:
+            self.breaker.release()
+            raise
+        if not rows:
+            self.breaker.release()
+            return 0
+        self._send_batch(rows)
+        return len(rows)
+
+    def run_pending(self) -> int:
+        """Sender til utboksen er tom (eller bryteren åpner). Returnerer antall sendt."""
+        before = self.stats["sent"]
+        while self.run_once():
+            pass
+        return self.stats["sent"] - before
+
+    def _send_batch(self, rows: List[Dict[str, Any]]) -> None:
+        from . import db
+        from .email_service import Message, mail
+
+        if self.app is None or mail is None or Message is None:
+            logger.warning("E-post kan ikke sendes (flask_mail mangler eller er ikke init).")
+            db.release_emails([r["id"] for r in rows], self.retry_seconds)
+            self.breaker.release()
+            return
+
+        start = time.perf_counter()
+        remaining = list(rows)
+        sent: List[int] = []
+        error: Optional[Exception] = None
+        try:
+            with self.app.app_context():
+                with mail.connect() as connection:
+                    self._count(connections=1)
+                    while remaining:
+                        row = remaining[0]
+                        try:
+                            connection.send(Message(subject=row["subject"], recipients=row["recipients"], body=row["body"]))
+                        except Exception as e:
+                            # Avvist adresse, BadHeaderError fra en adresse med
+                            # linjeskift, tegn som ikke kan kodes osv. gjelder
+                            # bare denne e-posten
+                            if _connection_error(e):
+                                raise
+                            remaining.pop(0)
+                            self._message_failed(row, e)
+                            continue
+                        remaining.pop(0)
+                        sent.append(row["id"])
+        except Exception as e:
+            # QUIT som feiler etter at alt er sendt er ingen feil
+            error = e if remaining else None
+        finally:
+            if sent:
+                db.mark_emails_sent(sent)
+
+        elapsed = time.perf_counter() - start
+        self._count(sent=len(sent), batches=1, send_seconds=elapsed)
+        with self._lock:
+            self.stats["last_batch_ms"] = round(elapsed * 1000, 3)
+            self.stats["max_batch_ms"] = max(self.stats["max_batch_ms"], self.stats["last_batch_ms"])
+
+        if error is None:
+            self.breaker.success()
+            return
+        logger.error(f"SMTP-feil, {len(remaining)} e-poster legges tilbake i utboksen: {error}")
+        self._count(connection_errors=1)
+        db.release_emails([r["id"] for r in remaining], self.retry_seconds)
+        self.breaker.failure()
+
+    def _message_failed(self, row: Dict[str, Any], error: Exception) -> None:
+        from . import db
+
+        code = _smtp_code(error) or 500
+        attempts = row["attempts"] + 1
+        if code >= 500 or attempts >= Config.EMAIL_MAX_ATTEMPTS:
+            logger.error(f"E-post #{row['id']} gis opp etter {attempts} forsøk: {error}")
+            db.fail_email(row["id"], str(error))
+            self._count(failed=1)
+            return
+        delay = min(self.retry_seconds * 2 ** row["attempts"], Config.EMAIL_RETRY_MAX_SECONDS)
+        db.fail_email(row["id"], str(error), retry_in_seconds=delay)
+        self._count(retried=1)
+
+    # -- tråder ------------------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                logger.error(f"E-post-senderen feilet: {e}")
+                claimed = 0
+            if claimed:
+                continue
+            # Åpen bryter: vent til pausen er over i stedet for å spørre databasen
+            self._wakeup.wait(timeout=self.breaker.seconds_until_retry() or self.poll_interval)
+            self._wakeup.clear()
+
+    def _alive(self) -> bool:
+        return bool(self._threads) and all(t.is_alive() for t in self._threads) and self._pid == os.getpid()
+
+    def ensure_started(self) -> None:
+        # pid-sjekk som i SlaTimer: tråder overlever ikke fork
+        if self._alive():
+            return
+        with self._lock:
+            if self._alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+
+sender = OutboxSender()
+
+
+def init_app(app) -> None:
+    """Starter senderen i hver worker-prosess ved første request."""
+    sender.app = app
+    if not app.config.get("EMAIL_OUTBOX_ENABLED", True):
+        return
+
+    @app.before_request
+    def _start_outbox_sender():
+        sender.ensure_started()
@@ -4,35 +4,61 @@ from flask import (
     Blueprint, render_template, request, redirect, url_for, session,
     flash, jsonify, abort, send_from_directory
 )
+from markupsafe import Markup, escape
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
+import copy
+import json
 import logging
 import os
+import random
 import re
-import uuid
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from .email_service import send_email
 from .db import create_reset_code, verify_reset_code, consume_reset_code, set_password_hash
 
+from .cache import TTLCache
 from .config import Config
+from .textmatch import AhoCorasick, required_literals
+from . import activity, blobstore, dedup, digest, outbox, sla, webhooks
 from .db import (
-    init_db,
     # Users
     user_exists, create_user, get_user, update_last_login, update_preferences, get_support_users,
     # Tickets
-    add_ticket, get_tickets, get_ticket, close_ticket,
+    add_ticket, get_tickets, get_tickets_page, get_ticket, close_ticket, search_tickets,
     # Notifications
-    add_notification, get_notifications, mark_all_notifications_read, count_notifications,
+    notify_many, get_notifications_page, mark_all_notifications_read, count_notifications,
     # Ratings
     add_rating, get_rating,
     # Activity
     log_activity, get_activity,
+    # Chat-samtaler
+    create_chat_conversation, get_chat_conversation, save_chat_turn, get_chat_conversations,
+    # Saksutkast (forslag om duplikater)
+    get_ticket_draft, delete_ticket_draft,
+    # Chatbot-kunnskapsbase
+    save_chatbot_kb, get_chatbot_kb, get_chatbot_kb_versions,
     # Knowledge base
-    get_articles, get_article, create_article, update_article, delete_article_db,
+    get_articles_page, get_article, create_article, update_article, delete_article_db,
+    search_articles, suggest_articles, HL_START, HL_END,
     # Attachments
     add_attachment, get_attachments, get_attachment,
+    get_attachments_for_tickets, count_attachments_for_tickets,
+    # Bulk-operasjoner (admin)
+    close_tickets, delete_tickets, assign_tickets, update_tickets_priority,
+    # Statistikk
+    get_dashboard_stats, get_resolution_histogram,
+    # SLA
+    get_sla_queue_page,
+    # Webhooks
+    create_webhook_subscription, get_webhook_subscriptions, delete_webhook_subscription,
+    get_webhook_dead_letters, requeue_webhook_dead_letter,
 )
 
 # E-postvarsling
@@ -51,41 +77,58 @@ def current_role():
     return session.get("role")
 
 
+def page_args() -> dict:
+    """Cursor-parametre (?after=/?before=) for keyset-paginerte lister."""
+    return {
+        "after": request.args.get("after", type=int),
+        "before": request.args.get("before", type=int),
+    }
+
+
+# Én adresse uten mellomrom eller linjeskift (brukes i e-posthodene, se outbox.py)
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+TICKET_STATUSES = ("Åpen", "Lukket")
+TICKET_PRIORITIES = ("Lav", "Middels", "Høy", "Kritisk")
+
+
 # -----------------------------
 # Upload helpers
 # -----------------------------
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
 
-def save_upload(file_storage, ticket_id: int) -> tuple[str, str]:
-    """
-    Lagrer fil på disk med unikt navn.
-    Returnerer (stored_filename, original_filename)
-    """
+def upload_filename(file_storage) -> str:
+    """Trygt filnavn for opplastingen. ValueError hvis det er tomt eller filtypen ikke er lov."""
     original_filename = secure_filename(file_storage.filename or "")
     if not original_filename:
         raise ValueError("Tomt filnavn")
 
     if not allowed_file(original_filename):
         raise ValueError("Ugyldig filtype")
+    return original_filename
 
-    os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-
-    ext = original_filename.rsplit(".", 1)[1].lower()
-    stored_filename = f"ticket_{ticket_id}_{uuid.uuid4().hex}.{ext}"
-    path = os.path.join(Config.UPLOAD_FOLDER, stored_filename)
 
-    file_storage.save(path)
-    return stored_filename, original_filename
+def save_upload(file_storage, ticket_id: int, uploaded_by: str) -> int:
+    """
+    Lagrer filen innholdsadressert (blobstore.py) og legger den ved saken;
+    samme fil lagt ved mange saker ligger bare én gang på disk.
+    Returnerer vedleggets id.
+    """
+    original_filename = upload_filename(file_storage)
+    return blobstore.save(file_storage.stream, ticket_id, original_filename, uploaded_by)
 
 
-@bp.before_app_request
-def ensure_db():
+def collect_unused_uploads() -> None:
+    """Fjerner filer som bare hørte til slettede saker. Feil her skal ikke stoppe slettingen."""
     try:
-        init_db()
+        blobstore.collect_garbage()
     except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
+        logger.error(f"Could not remove unused attachment files: {e}")
 
 
 @bp.context_processor
@@ -200,11 +243,56 @@ def kb():
         return redirect(url_for("main.login"))
 
     try:
-        articles = get_articles()
+        page = get_articles_page(**page_args())
     except Exception:
-        articles = []
+        page = {"rows": [], "next": None, "prev": None}
+
+    return render_template("kb.html", articles=page["rows"], page=page, role=current_role())
+
 
-    return render_template("kb.html", articles=articles, role=current_role())
+def highlight_html(text: Optional[str]) -> Markup:
+    """Escaper tekst fra FTS-søk og gjør treffmarkørene om til <mark>."""
+    escaped = str(escape(text or ""))
+    return Markup(escaped.replace(HL_START, "<mark>").replace(HL_END, "</mark>"))
+
+
+@bp.route("/kb/search")
+def kb_search():
+    if not current_user():
+        if request.args.get("format") == "json":
+            return jsonify({"error": "Ikke innlogget"}), 401
+        return redirect(url_for("main.login"))
+
+    q = (request.args.get("q") or "").strip()[:200]
+    results = {"rows": [], "next": None}
+    if q:
+        try:
+            results = search_articles(q, after=request.args.get("after") or None)
+        except Exception as e:
+            logger.error(f"KB search failed for {q!r}: {e}")
+
+    for r in results["rows"]:
+        r["title_html"] = highlight_html(r.pop("title_hl"))
+        r["snippet_html"] = highlight_html(r.pop("snippet"))
+
+    if request.args.get("format") == "json":
+        return jsonify({
+            "query": q,
+            "results": [
+                {
+                    "id": r["id"],
+                    "title": r["title"],
+                    "title_html": str(r["title_html"]),
+                    "snippet_html": str(r["snippet_html"]),
+                    "score": r["score"],
+                    "url": url_for("main.view_article", article_id=r["id"]),
+                }
+                for r in results["rows"]
+            ],
+            "next": results["next"],
+        })
+
+    return render_template("kb_search.html", q=q, results=results["rows"], next_cursor=results["next"])
 
 
 @bp.route("/notifications")
@@ -213,14 +301,14 @@ def notifications_page():
     if not user:
         return redirect(url_for("main.login"))
 
+    page = {"rows": [], "next": None, "prev": None}
     try:
-        notifs = get_notifications(user)
+        page = get_notifications_page(user, **page_args())
         mark_all_notifications_read(user)
     except Exception as e:
         logger.error(f"Notifications error: {e}")
-        notifs = []
 
-    return render_template("notifications.html", notifications=notifs)
+    return render_template("notifications.html", notifications=page["rows"], page=page)
 
 
 @bp.route("/settings", methods=["GET", "POST"])
@@ -238,6 +326,12 @@ def settings():
         notify_sms = 1 if request.form.get("notify_sms") else 0
         phone = request.form.get("phone", "").strip() or None
         email = request.form.get("email", "").strip() or None
+        if email and (len(email) > 254 or not EMAIL_RE.fullmatch(email)):
+            flash("Ugyldig e-postadresse. Innstillingene ble ikke lagret.")
+            return redirect(url_for("main.settings"))
+        email_digest = request.form.get("email_digest")
+        if email_digest not in digest.FREQUENCIES:
+            email_digest = None
 
         try:
             update_preferences(
@@ -245,7 +339,8 @@ def settings():
                 notify_email,
                 notify_inapp,
                 notify_sms,
-                phone
+                phone,
+                email_digest,
             )
             # Update email separately if provided
             if email:
@@ -267,7 +362,7 @@ def settings():
 
         return redirect(url_for("main.settings"))
 
-    return render_template("settings.html", preferences=u)
+    return render_template("settings.html", preferences=u, digest_frequencies=digest.FREQUENCY_LABELS)
 
 
 @bp.route("/admin/activity")
@@ -309,70 +404,167 @@ def tickets():
 
     if request.method == "POST":
         try:
-            title = request.form.get("title", "").strip()
-            desc = request.form.get("desc", "").strip()
-            category = request.form.get("category", "Annet").strip()
-            priority = request.form.get("priority", "Middels").strip()
-            device = request.form.get("device", "").strip()
+            # Utkastet fra forrige innsending (når det fantes lignende saker)
+            # har tekstfeltene og vedleggene; feltene i skjemaet går foran.
+            draft_id = request.form.get("draft_id", "")
+            draft = get_ticket_draft(draft_id, user) if draft_id else None
+            fields = {**(draft or {}), **request.form.to_dict()}
+            title = fields.get("title", "").strip()
+            desc = fields.get("desc", "").strip()
+            category = fields.get("category", "Annet").strip()
+            priority = fields.get("priority", "Middels").strip()
+            device = fields.get("device", "").strip()
+
+            try:
+                files = [f for f in request.files.getlist("files") if f and getattr(f, "filename", "")]
+            except Exception:
+                files = []
 
             if not title or not desc:
                 flash("Du må fylle ut tittel og beskrivelse.")
-            else:
-                ticket_id = add_ticket(
-                    owner=user,
-                    title=title,
-                    desc=desc,
-                    category=category,
-                    priority=priority,
-                    device=device
-                )
-                logger.info(f"Ticket created: #{ticket_id} by {user} (owner field should be: {user})")
+                return redirect(url_for("main.tickets"))
+
+            # Nesten like åpne saker (dedup.py): første innsending viser forslag,
+            # og brukeren velger å koble saken til en av dem (duplicate_of) eller
+            # å opprette en ny likevel (force_new).
+            sig = dedup.signature(title, desc)
+            duplicate_of = request.form.get("duplicate_of", type=int)
+            original = get_ticket(duplicate_of) if duplicate_of else None
+            if not original or original.get("status") == "Lukket":
+                duplicate_of = None
+
+            if duplicate_of is None and not request.form.get("force_new"):
                 try:
+                    similar = dedup.index.find_similar(sig)
+                except Exception as e:
+                    logger.error(f"Duplicate lookup failed: {e}")
+                    similar = []
+                if similar:
+                    # Utkastet og vedleggene lagres på serveren; cookien får bare id-en
+                    uploads = []
+                    for f in files:
+                        try:
+                            uploads.append((f.stream, upload_filename(f)))
+                        except ValueError:
+                            flash(f"Kunne ikke laste opp fil '{getattr(f, 'filename', '')}'.", "danger")
+                    session["ticket_draft"] = blobstore.save_draft(
+                        user,
+                        {
+                            "title": title, "desc": desc, "category": category,
+                            "priority": priority, "device": device,
+                            "similar": [
+                                {"id": t["id"], "title": t["title"], "created_at": t["created_at"],
+                                 "percent": int(round(t["similarity"] * 100))}
+                                for t in similar
+                            ],
+                        },
+                        uploads,
+                        kept=draft["files"] if draft else (),
+                    )
+                    flash("Det finnes allerede åpne saker som ligner. Koble saken din til en av dem, eller opprett en ny.")
+                    return redirect(url_for("main.tickets"))
+
+            ticket_id = add_ticket(
+                owner=user,
+                title=title,
+                desc=desc,
+                category=category,
+                priority=priority,
+                device=device,
+                duplicate_of=duplicate_of,
+            )
+            logger.info(f"Ticket created: #{ticket_id} by {user} (owner field should be: {user})")
+            webhooks.emit("ticket.created", {
+                "ticket_id": ticket_id, "owner": user, "actor": user, "title": title,
+                "category": category, "priority": priority, "duplicate_of": duplicate_of,
+            })
+            try:
+                if duplicate_of:
+                    log_activity(user, f"Opprettet sak #{ticket_id} – '{title}' (duplikat av #{duplicate_of})")
+                else:
                     log_activity(user, f"Opprettet sak #{ticket_id} – '{title}'")
-                except Exception:
-                    pass
-
-                # --- NYTT: håndter vedlegg ---
-                try:
-                    files = request.files.getlist("files")
-                except Exception:
-                    files = []
+            except Exception:
+                pass
 
-                for f in files:
-                    if not f or not getattr(f, "filename", ""):
-                        continue
+            # --- NYTT: håndter vedlegg ---
+            if draft:
+                for f in draft["files"]:
                     try:
-                        stored_name, original_name = save_upload(f, ticket_id)
-                        add_attachment(ticket_id, stored_name, original_name, user)
+                        add_attachment(
+                            ticket_id, blobstore.relative_path(f["blob_sha256"]), f["original_filename"], user,
+                            blob_sha256=f["blob_sha256"], size=f["size"],
+                        )
                     except Exception as e:
                         logger.error(f"File upload error (ticket #{ticket_id}): {e}")
-                        flash(f"Kunne ikke laste opp fil '{getattr(f, 'filename', '')}'.", "danger")
+                        flash(f"Kunne ikke laste opp fil '{f['original_filename']}'.", "danger")
+                try:
+                    delete_ticket_draft(draft["id"])
+                except Exception as e:
+                    logger.error(f"Could not delete ticket draft: {e}")
 
+            for f in files:
                 try:
-                    for sup in get_support_users():
-                        add_notification(
-                            sup["username"],
-                            f"Ny sak opprettet av {user}: {title}",
-                            url_for("main.tickets")
-                        )
-                except Exception:
-                    pass
+                    save_upload(f, ticket_id, user)
+                except Exception as e:
+                    logger.error(f"File upload error (ticket #{ticket_id}): {e}")
+                    flash(f"Kunne ikke laste opp fil '{getattr(f, 'filename', '')}'.", "danger")
+
+            ticket = {
+                "id": ticket_id,
+                "title": title,
+                "owner": user,
+                "category": category,
+                "priority": priority,
+                "description": desc,
+            }
 
-                ticket = {
-                    "id": ticket_id,
-                    "title": title,
-                    "owner": user,
-                    "category": category,
-                    "priority": priority,
-                    "description": desc,
-                }
+            if duplicate_of:
+                # Ingen ny kringkasting til hele support; bare den som har
+                # originalsaken får beskjed. Har ingen den, varsles support som
+                # for en vanlig ny sak.
                 try:
+                    if original.get("assigned_to"):
+                        if original["assigned_to"] != user:
+                            notify_many(
+                                [original["assigned_to"]],
+                                f"Sak #{ticket_id} fra {user} er koblet til sak #{duplicate_of}: {original['title']}",
+                                url_for("main.tickets"),
+                            )
+                    else:
+                        notify_many(
+                            [sup["username"] for sup in get_support_users()],
+                            f"Ny sak opprettet av {user}: {title} (koblet til sak #{duplicate_of})",
+                            url_for("main.tickets"),
+                            kind="ticket_created",
+                        )
                     send_ticket_created_email(ticket, user_email=None)
-                    notify_support_new_ticket(ticket)
                 except Exception:
                     pass
+                flash(f"Saken er registrert og koblet til sak #{duplicate_of}, som support allerede jobber med.")
+                return redirect(url_for("main.tickets"))
+
+            try:
+                dedup.index.remember(ticket_id, sig)
+            except Exception as e:
+                logger.error(f"Could not index ticket #{ticket_id} for duplicates: {e}")
 
-                flash("Saken er sendt til support. Du finner den i oversikten under.")
+            try:
+                notify_many(
+                    [sup["username"] for sup in get_support_users()],
+                    f"Ny sak opprettet av {user}: {title}",
+                    url_for("main.tickets"),
+                    kind="ticket_created",
+                )
+            except Exception:
+                pass
+
+            try:
+                send_ticket_created_email(ticket, user_email=None)
+                notify_support_new_ticket(ticket)
+            except Exception:
+                pass
+
+            flash("Saken er sendt til support. Du finner den i oversikten under.")
 
         except Exception as e:
             logger.error(f"Error creating ticket: {e}")
@@ -380,31 +572,44 @@ def tickets():
 
         return redirect(url_for("main.tickets"))
 
+    page = {"rows": [], "next": None, "prev": None}
     try:
         if role == "support":
-            visible = get_tickets()
-            logger.info(f"Support user {user} fetched all tickets: {len(visible)} total")
+            page = get_tickets_page(**page_args())
+            logger.info(f"Support user {user} fetched a page of tickets: {len(page['rows'])} shown")
         else:
-            visible = get_tickets(owner=user)
-            logger.info(f"User {user} fetched their own tickets: {len(visible)} visible")
+            page = get_tickets_page(owner=user, **page_args())
+            logger.info(f"User {user} fetched their own tickets: {len(page['rows'])} shown")
     except Exception as e:
         logger.error(f"Error fetching tickets for {user} (role={role}): {e}")
-        visible = []
         flash("Kunne ikke hente saker. Prøv igjen senere.")
+    visible = page["rows"]
 
-    # --- NYTT: legg ved vedlegg på hver ticket for visning i template ---
+    # Bare antall vedlegg her (én spørring for hele siden); selve listen hentes
+    # fra tickets_attachments_json når brukeren åpner vedleggene på en sak.
+    try:
+        counts = count_attachments_for_tickets([t["id"] for t in visible])
+    except Exception as e:
+        logger.error(f"Error counting attachments: {e}")
+        counts = {}
     for t in visible:
-        try:
-            t["attachments"] = get_attachments(t["id"])
-        except Exception:
-            t["attachments"] = []
-    
+        t["attachment_count"] = counts.get(t["id"], 0)
+
     # DEBUG: log owner field på første sak hvis det finnes
     if visible and len(visible) > 0:
         first_ticket = visible[0]
         logger.debug(f"First ticket keys: {list(first_ticket.keys())} | owner={first_ticket.get('owner', 'MISSING')}")
 
-    return render_template("_tickets.html", tickets=visible, role=role)
+    # Utkast med forslag til duplikater fra forrige innsending (se POST over)
+    draft = None
+    draft_id = session.pop("ticket_draft", None)
+    if isinstance(draft_id, str):
+        try:
+            draft = get_ticket_draft(draft_id, user)
+        except Exception as e:
+            logger.error(f"Could not load ticket draft: {e}")
+
+    return render_template("_tickets.html", tickets=visible, page=page, role=role, draft=draft)
 
 
 @bp.route("/tickets/<int:ticket_id>/close", methods=["POST"])
@@ -420,22 +625,24 @@ def close_ticket_view(ticket_id: int):
 
     try:
         t = get_ticket(ticket_id)
-        close_ticket(ticket_id)
+        if not t or not close_ticket(ticket_id):
+            flash(f"Sak #{ticket_id} finnes ikke eller er allerede lukket.")
+            return redirect(url_for("main.tickets"))
 
         try:
             log_activity(user, f"Lukket sak #{ticket_id}")
         except Exception:
             pass
+        webhooks.emit("ticket.closed", {"ticket_id": ticket_id, "owner": t["owner"], "actor": user})
 
-        if t:
-            try:
-                add_notification(
-                    t["owner"],
-                    f"Sak #{ticket_id} ble lukket av support ({user}).",
-                    url_for("main.tickets")
-                )
-            except Exception:
-                pass
+        try:
+            notify_many(
+                [t["owner"]],
+                f"Sak #{ticket_id} ble lukket av support ({user}).",
+                url_for("main.tickets")
+            )
+        except Exception:
+            pass
 
         logger.info(f"Ticket #{ticket_id} closed by {user}")
         flash(f"Sak #{ticket_id} er lukket.")
@@ -474,18 +681,21 @@ def rate_ticket(ticket_id: int):
     try:
         add_rating(ticket_id, user, stars, feedback)
         log_activity(user, f"Ga {stars}★ til sak #{ticket_id}")
+        webhooks.emit("ticket.rated", {
+            "ticket_id": ticket_id, "owner": user, "actor": user, "stars": stars, "feedback": feedback,
+        })
     except Exception as e:
         logger.error(f"Rating error: {e}")
         flash("Kunne ikke lagre vurdering. Prøv igjen.")
         return redirect(url_for("main.tickets"))
 
     try:
-        for sup in get_support_users():
-            add_notification(
-                sup["username"],
-                f"Sak #{ticket_id} fikk {stars}★ fra {user}",
-                url_for("main.tickets")
-            )
+        notify_many(
+            [sup["username"] for sup in get_support_users()],
+            f"Sak #{ticket_id} fikk {stars}★ fra {user}",
+            url_for("main.tickets"),
+            kind="ticket_rated",
+        )
     except Exception:
         pass
 
@@ -523,6 +733,37 @@ def download_attachment(attachment_id: int):
     )
 
 
+# Vedleggslister som JSON (lastes når en sak ekspanderes i /tickets)
+@bp.route("/tickets/attachments.json")
+def tickets_attachments_json():
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Ikke innlogget"}), 401
+
+    try:
+        ids = [int(i) for i in request.args.get("ids", "").split(",") if i.strip()]
+    except ValueError:
+        abort(400)
+    if not ids or len(ids) > 100:
+        abort(400)
+
+    # tilgangskontroll: support ser alt, andre bare egne saker (filtreres i spørringen)
+    owner = None if current_role() == "support" else user
+    grouped = get_attachments_for_tickets(ids, owner=owner)
+
+    def _item(att):
+        return {
+            "id": att["id"],
+            "filename": att["original_filename"],
+            "uploaded_at": att["uploaded_at"],
+            "is_image": att["original_filename"].lower().endswith(IMAGE_EXTENSIONS),
+            "view_url": url_for("main.view_attachment", attachment_id=att["id"]),
+            "download_url": url_for("main.download_attachment", attachment_id=att["id"]),
+        }
+
+    return jsonify({str(tid): [_item(a) for a in atts] for tid, atts in grouped.items()})
+
+
 # Vis vedlegg inline (for bilder)
 @bp.route("/attachments/<int:attachment_id>/view")
 def view_attachment(attachment_id: int):
@@ -596,8 +837,7 @@ def upload_attachment(ticket_id: int):
         return redirect(url_for("main.tickets"))
 
     try:
-        stored_name, original_name = save_upload(file, ticket_id)
-        add_attachment(ticket_id, stored_name, original_name, user)
+        save_upload(file, ticket_id, user)
         log_activity(user, f"Lastet opp vedlegg til sak #{ticket_id}")
         flash("Vedlegg lastet opp")
     except Exception as e:
@@ -612,25 +852,27 @@ def dashboard():
     if not current_user():
         return redirect(url_for("main.login"))
 
-    # Hent saker fra DB (for support: alle, for user: egne)
+    # Nøkkeltall fra rollup-tabellene (support) eller brukerens egne saker;
+    # tabellen viser bare første side, ikke alle saker.
     role = current_role()
     user = current_user()
-    visible = get_tickets() if role == "support" else get_tickets(owner=user)
-
-    # Enkle “stats” (demo). Kan forbedres senere.
-    total_active = sum(1 for t in visible if (t.get("status") or "").lower() != "lukket")
-    critical = sum(1 for t in visible if (t.get("priority") or "").lower() in ["kritisk", "critical", "høy", "high"])
-    closed_today = 0
-    avg_time = "2.4t"
-
-    stats = {
-        "total_active": total_active,
-        "critical": critical,
-        "closed_today": closed_today,
-        "avg_time": avg_time,
-    }
+    owner = None if role == "support" else user
+
+    stats = {"total_active": 0, "critical": 0, "closed_today": 0, "avg_hours": None}
+    histogram = []
+    visible = []
+    try:
+        stats = get_dashboard_stats(owner=owner)
+        if role == "support":
+            histogram = get_resolution_histogram()
+        visible = get_tickets_page(owner=owner)["rows"]
+    except Exception as e:
+        logger.error(f"Error fetching dashboard stats: {e}")
 
-    return render_template("dashboard.html", tickets=visible, stats=stats)
+    avg_hours = stats.get("avg_hours")
+    stats["avg_time"] = f"{avg_hours:.1f}t" if avg_hours is not None else "–"
+
+    return render_template("dashboard.html", tickets=visible, stats=stats, histogram=histogram)
 
 
 
@@ -647,14 +889,19 @@ def admin_users():
     if not user or current_role() != "support":
         abort(403)
 
-    from .db import get_all_users
+    from .db import get_users_page, count_users_by_role
+    page = {"rows": [], "next": None, "prev": None}
+    role_counts: Dict[str, int] = {}
     try:
-        users = get_all_users()
+        page = get_users_page(
+            after=request.args.get("after") or None,
+            before=request.args.get("before") or None,
+        )
+        role_counts = count_users_by_role()
     except Exception as e:
         logger.error(f"Error fetching users: {e}")
-        users = []
 
-    return render_template("admin_users.html", users=users)
+    return render_template("admin_users.html", users=page["rows"], page=page, role_counts=role_counts)
 
 
 @bp.route("/admin/users/<username>/promote", methods=["POST"])
@@ -795,13 +1042,45 @@ def admin_tickets():
     if not user or current_role() != "support":
         abort(403)
 
+    # ?q=...: fulltekstsøk (nyeste først), kan kombineres med status/prioritet.
+    # ?sort=sla: åpne saker med kortest tid igjen først (cursor er "due_at|id").
+    q = (request.args.get("q") or "").strip()[:200]
+    status = request.args.get("status") if request.args.get("status") in TICKET_STATUSES else None
+    priority = request.args.get("priority") if request.args.get("priority") in TICKET_PRIORITIES else None
+    sort = "sla" if request.args.get("sort") == "sla" and not q else "id"
+
+    # Parametrene som skal være med i pager-lenkene
+    list_args = {k: v for k, v in (("q", q), ("status", status), ("priority", priority)) if v}
+    if sort == "sla":
+        list_args["sort"] = "sla"
+
+    page = {"rows": [], "next": None, "prev": None}
     try:
-        all_tickets = get_tickets()
+        if q:
+            page = search_tickets(q, status=status, priority=priority, **page_args())
+        elif sort == "sla":
+            page = get_sla_queue_page(
+                after=request.args.get("after") or None,
+                before=request.args.get("before") or None,
+            )
+        else:
+            page = get_tickets_page(status=status, priority=priority, **page_args())
     except Exception as e:
         logger.error(f"Error fetching tickets: {e}")
-        all_tickets = []
 
-    return render_template("admin_tickets.html", tickets=all_tickets)
+    now = sla.utcnow()
+    for t in page["rows"]:
+        t["sla_remaining"] = sla.format_remaining(t.get("due_at"), now) if t.get("status") != "Lukket" else "–"
+        t["sla_breached"] = bool(t.get("due_at")) and t.get("status") != "Lukket" and t["due_at"] < sla.format_ts(now)
+        if "snippet" in t:
+            t["snippet_html"] = highlight_html(t.pop("snippet"))
+
+    return render_template(
+        "admin_tickets.html",
+        tickets=page["rows"], page=page, sort=sort,
+        q=q, status=status, priority=priority, list_args=list_args,
+        statuses=TICKET_STATUSES, priorities=TICKET_PRIORITIES,
+    )
 
 
 @bp.route("/tickets/<int:ticket_id>/assign", methods=["POST"])
@@ -818,9 +1097,12 @@ def assign_ticket_to_support(ticket_id: int):
         log_activity(user, f"Tildelte sak #{ticket_id} til {assigned_to}")
 
         t = get_ticket(ticket_id)
+        webhooks.emit("ticket.assigned", {
+            "ticket_id": ticket_id, "owner": t["owner"] if t else None, "actor": user, "assigned_to": assigned_to,
+        })
         if t:
-            add_notification(
-                t["owner"],
+            notify_many(
+                [t["owner"]],
                 f"Sak #{ticket_id} er tildelt {assigned_to}",
                 url_for("main.tickets")
             )
@@ -840,10 +1122,13 @@ def change_ticket_priority(ticket_id: int):
         abort(403)
 
     new_priority = request.form.get("priority", "Middels")
+    if new_priority not in TICKET_PRIORITIES:
+        abort(400)
 
     from .db import update_ticket_priority
     try:
         update_ticket_priority(ticket_id, new_priority)
+        sla.timer.reload()  # fristen kan ha blitt flyttet fram
         log_activity(user, f"Endret prioritet på sak #{ticket_id} til {new_priority}")
         flash(f"Prioritet endret til {new_priority}.")
     except Exception as e:
@@ -862,6 +1147,7 @@ def delete_ticket_permanently(ticket_id: int):
     from .db import delete_ticket_db
     try:
         delete_ticket_db(ticket_id)
+        collect_unused_uploads()
         log_activity(user, f"Slettet sak #{ticket_id} permanent")
         flash(f"Sak #{ticket_id} slettet permanent.")
     except Exception as e:
@@ -903,11 +1189,11 @@ def admin_kb():
         abort(403)
 
     try:
-        articles = get_articles()
+        page = get_articles_page(**page_args())
     except Exception:
-        articles = []
+        page = {"rows": [], "next": None, "prev": None}
 
-    return render_template("admin_kb.html", articles=articles)
+    return render_template("admin_kb.html", articles=page["rows"], page=page)
 
 
 @bp.route("/admin/kb/new", methods=["GET", "POST"])
@@ -927,6 +1213,7 @@ def create_article_view():
             try:
                 article_id = create_article(title, content, user, cover_url or None)
                 log_activity(user, f"Opprettet KB-artikkel #{article_id}: {title}")
+                get_bot().reply_cache.clear()  # svarene foreslår artikler
                 flash("Artikkel opprettet.")
                 return redirect(url_for("main.view_article", article_id=article_id))
             except Exception as e:
@@ -981,6 +1268,7 @@ def edit_article_view(article_id: int):
             try:
                 update_article(article_id, title, content, cover_url or None)
                 log_activity(user, f"Redigerte KB-artikkel #{article_id}")
+                get_bot().reply_cache.clear()
                 flash("Artikkel oppdatert.")
                 return redirect(url_for("main.view_article", article_id=article_id))
             except Exception as e:
@@ -999,6 +1287,7 @@ def delete_article(article_id: int):
     try:
         delete_article_db(article_id)
         log_activity(user, f"Slettet KB-artikkel #{article_id}")
+        get_bot().reply_cache.clear()
         flash("Artikkel slettet.")
     except Exception as e:
         logger.error(f"Error deleting article: {e}")
@@ -1010,24 +1299,29 @@ def delete_article(article_id: int):
 # -----------------------------
 # ADMIN: Bulk Actions
 # -----------------------------
+def _bulk_ticket_ids() -> List[int]:
+    ids = []
+    for tid in request.form.getlist("ticket_ids[]"):
+        try:
+            ids.append(int(tid))
+        except ValueError:
+            pass
+    return ids
+
+
 @bp.route("/admin/tickets/bulk-close", methods=["POST"])
 def bulk_close_tickets():
     user = current_user()
     if not user or current_role() != "support":
         abort(403)
 
-    ticket_ids = request.form.getlist("ticket_ids[]")
-
-    closed_count = 0
-    for tid in ticket_ids:
-        try:
-            close_ticket(int(tid))
-            closed_count += 1
-        except Exception:
-            pass
-
-    log_activity(user, f"Lukket {closed_count} saker samtidig (bulk)")
-    flash(f"{closed_count} saker lukket.")
+    try:
+        closed_count = close_tickets(_bulk_ticket_ids(), user, link=url_for("main.tickets"))
+        webhooks.dispatcher.notify()
+        flash(f"{closed_count} saker lukket.")
+    except Exception as e:
+        logger.error(f"Bulk close failed: {e}")
+        flash("Kunne ikke lukke sakene. Ingen saker ble endret.")
 
     return redirect(url_for("main.admin_tickets"))
 
@@ -1038,19 +1332,51 @@ def bulk_delete_tickets():
     if not user or current_role() != "support":
         abort(403)
 
-    ticket_ids = request.form.getlist("ticket_ids[]")
+    try:
+        deleted_count = delete_tickets(_bulk_ticket_ids(), user)
+        collect_unused_uploads()
+        flash(f"{deleted_count} saker slettet.")
+    except Exception as e:
+        logger.error(f"Bulk delete failed: {e}")
+        flash("Kunne ikke slette sakene. Ingen saker ble endret.")
 
-    from .db import delete_ticket_db
-    deleted_count = 0
-    for tid in ticket_ids:
-        try:
-            delete_ticket_db(int(tid))
-            deleted_count += 1
-        except Exception:
-            pass
+    return redirect(url_for("main.admin_tickets"))
+
+
+@bp.route("/admin/tickets/bulk-assign", methods=["POST"])
+def bulk_assign_tickets():
+    user = current_user()
+    if not user or current_role() != "support":
+        abort(403)
+
+    assigned_to = request.form.get("assigned_to", user).strip() or user
+    try:
+        count = assign_tickets(_bulk_ticket_ids(), assigned_to, user, link=url_for("main.tickets"))
+        webhooks.dispatcher.notify()
+        flash(f"{count} saker tildelt {assigned_to}.")
+    except Exception as e:
+        logger.error(f"Bulk assign failed: {e}")
+        flash("Kunne ikke tildele sakene. Ingen saker ble endret.")
+
+    return redirect(url_for("main.admin_tickets"))
+
+
+@bp.route("/admin/tickets/bulk-priority", methods=["POST"])
+def bulk_priority_tickets():
+    user = current_user()
+    if not user or current_role() != "support":
+        abort(403)
 
-    log_activity(user, f"Slettet {deleted_count} saker permanent (bulk)")
-    flash(f"{deleted_count} saker slettet.")
+    new_priority = request.form.get("bulk_priority", "Middels")
+    if new_priority not in TICKET_PRIORITIES:
+        abort(400)
+    try:
+        count = update_tickets_priority(_bulk_ticket_ids(), new_priority, user)
+        sla.timer.reload()
+        flash(f"Prioritet endret til {new_priority} på {count} saker.")
+    except Exception as e:
+        logger.error(f"Bulk priority change failed: {e}")
+        flash("Kunne ikke endre prioritet. Ingen saker ble endret.")
 
     return redirect(url_for("main.admin_tickets"))
 
@@ -1076,9 +1402,60 @@ def admin_users_alias():
 # -----------------------------
 # Chat (NY: AI-bot)
 # -----------------------------
+# Emner, fraser, feilmønstre og løsninger ligger som data, ikke i koden.
+# Filen er første versjon; nye versjoner lagres i chatbot_kb_versions.
+CHATBOT_KB_FILE = os.path.join(os.path.dirname(__file__), "data", "chatbot_kb.json")
+CHATBOT_KB_FORMAT = 1
+SOLUTION_LEVELS = ("basic", "intermediate", "advanced")
+
+
+def load_chatbot_kb_file(path: str = CHATBOT_KB_FILE) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def validate_chatbot_kb(kb: Dict) -> None:
+    """ValueError med forklaring hvis boten ikke kan bruke kunnskapsbasen."""
+    def texts(value, where):
+        if not isinstance(value, list) or not all(isinstance(v, str) and v for v in value):
+            raise ValueError(f"{where} må være en liste med tekster")
+
+    if not isinstance(kb, dict) or kb.get("format") != CHATBOT_KB_FORMAT:
+        raise ValueError(f'Ukjent format (forventet "format": {CHATBOT_KB_FORMAT})')
+    topics = kb.get("topics")
+    if not isinstance(topics, dict) or not topics:
+        raise ValueError('"topics" mangler eller er tom')
+
+    for name, topic in topics.items():
+        if not isinstance(topic, dict):
+            raise ValueError(f"{name} må være et objekt")
+        for field in ("keywords", "natural_phrases", "questions"):
+            texts(topic.get(field), f"{name}.{field}")
+        solutions = topic.get("solutions")
+        if not isinstance(solutions, dict):
+            raise ValueError(f"{name}.solutions mangler")
+        for level in SOLUTION_LEVELS:
+            texts(solutions.get(level), f"{name}.solutions.{level}")
+        error_patterns = topic.get("error_patterns", [])
+        if not isinstance(error_patterns, list):
+            raise ValueError(f"{name}.error_patterns må være en liste")
+        for i, entry in enumerate(error_patterns):
+            where = f"{name}.error_patterns[{i}]"
+            if not isinstance(entry, list) or len(entry) != 2:
+                raise ValueError(f"{where} må være [mønster, forklaring]")
+            texts(entry, where)
+            try:
+                re.compile(entry[0])
+            except re.error as e:
+                raise ValueError(f"{where}: ugyldig regulært uttrykk ({e})") from None
+
+    patterns = kb.get("conversation_patterns")
+    urgency = patterns.get("urgency") if isinstance(patterns, dict) else None
+    if not isinstance(urgency, dict):
+        raise ValueError("conversation_patterns.urgency mangler")
+    for kind in ("high", "frustrated", "confused"):
+        texts(urgency.get(kind), f"conversation_patterns.urgency.{kind}")
 
-import json
-from typing import List
 
 class IntelligentHelpdeskAI:
     """
@@ -1086,292 +1463,172 @@ class IntelligentHelpdeskAI:
     learns from context, and thinks like a real support agent.
     """
 
-    def __init__(self):
-        self.knowledge_base = self._init_knowledge_base()
-        self.conversation_patterns = self._init_conversation_patterns()
+    # Ordlister som før lå inne i metodene; rekkefølgen avgjør hvilket treff som vinner
+    OS_MAP = {
+        "windows": ["windows", "win10", "win11", "pc", "laptop"],
+        "macos": ["mac", "macos", "macbook", "imac", "apple"],
+        "ios": ["iphone", "ipad", "ios"],
+        "android": ["android", "samsung", "pixel"],
+        "linux": ["linux", "ubuntu"]
+    }
+    BROWSER_MAP = {
+        "Chrome": ["chrome", "google chrome"],
+        "Edge": ["edge", "microsoft edge"],
+        "Safari": ["safari"],
+        "Firefox": ["firefox", "mozilla"]
+    }
+    APP_MAP = {
+        "Teams": ["teams", "microsoft teams"],
+        "Outlook": ["outlook"],
+        "Word": ["word", "word document"],
+        "Excel": ["excel", "spreadsheet"],
+        "PowerPoint": ["powerpoint", "ppt", "presentasjon"],
+        "OneDrive": ["onedrive"]
+    }
+    ERROR_MESSAGE_PATTERNS = [
+        re.compile(r'"([^"]+)"', re.IGNORECASE),
+        re.compile(r'feilmelding[:\s]+([^\n\.]+)', re.IGNORECASE),
+        re.compile(r'får[:\s]+([^\n\.]+)', re.IGNORECASE),
+        re.compile(r'sier[:\s]+([^\n\.]+)', re.IGNORECASE),
+    ]
+    ACTION_KEYWORDS = ["prøvd", "forsøkt", "restartet", "startet på nytt", "tømt cache",
+                       "logget ut", "reinstallert", "sjekket", "testet"]
+    HUMAN_REQUEST_PHRASES = ["snakke med", "menneske", "ekte person", "support", "menneskelig"]
+    POSITIVE_PHRASES = ["takk", "fungerte", "virket", "løst", "fikset", "bra", "perfekt"]
+    FOLLOW_UP_PHRASES = ["nei", "fungerer ikke", "virker ikke", "fortsatt", "samme problem", "hjelper ikke"]
+    NOISE_WORDS = frozenset(["jeg", "du", "det", "har", "er", "på", "med", "til", "og", "i"])
+    URGENCY_OPENERS = [
+        " **Jeg ser dette haster!** La meg hjelpe deg raskt.",
+        " **Forstår at dette er viktig.** La oss løse det nå.",
+        " **OK, dette må fikses fort.** Jeg skal hjelpe deg umiddelbart."
+    ]
+    SUCCESS_MESSAGES = [
+        " **Fantastisk!** Jeg er så glad jeg kunne hjelpe deg!\n\nHvis du får andre problemer, er jeg her. Ha en fin dag! ",
+        " **Perfekt!** Det var akkurat det jeg håpet på!\n\nHusk at jeg alltid er her hvis du trenger hjelp igjen. Lykke til! ",
+        " **Supert!** Kjempe bra at det virket!\n\nFøl deg fri til å spørre meg igjen hvis du trenger noe. God dag videre! "
+    ]
+    # Plassholdere for tekst som velges tilfeldig. De byttes ut først når
+    # svaret sendes, så et svar fra cachen får en ny tilfeldig åpning.
+    URGENCY_SLOT = "\x00urgency\x00"
+    SUCCESS_SLOT = "\x00success\x00"
+
+    def __init__(self, kb: Optional[Dict] = None, version: int = 0):
+        """
+        kb har formatet i app/data/chatbot_kb.json (standard: filen selv).
+        Ugyldig innhold gir ValueError før noe tas i bruk.
+        """
+        if kb is None:
+            kb = load_chatbot_kb_file()
+        validate_chatbot_kb(kb)
+        self.kb_version = version
+        self.knowledge_base = kb["topics"]
+        self.conversation_patterns = kb["conversation_patterns"]
         self.intent_classifiers = self._init_intent_classifiers()
-
-    def _init_knowledge_base(self) -> Dict:
-        """Comprehensive knowledge with real-world understanding"""
-        return {
-            "feide": {
-                "description": "Feide authentication and login system",
-                "keywords": ["feide", "innlogging", "login", "autentisering", "bruker", "konto"],
-                "natural_phrases": [
-                    "kan ikke logge inn", "får ikke tilgang", "innlogging fungerer ikke",
-                    "kommer ikke inn", "kan ikke få tilgang", "login problem",
-                    "får ikke logget meg inn", "klarer ikke å komme inn"
-                ],
-                "error_patterns": [
-                    (r"timeout|time out|tidsavbrudd", "Feide-tjenesten bruker for lang tid. Dette kan skyldes høy trafikk eller nettverksproblemer."),
-                    (r"feil brukernavn|wrong username|ugyldig bruker", "Brukernavnet er ikke riktig. Sjekk at du bruker formatet: fornavn.etternavn@skole.no"),
-                    (r"feil passord|wrong password|incorrect password", "Passordet er feil. Husk at passord er case-sensitive (store/små bokstaver betyr noe)."),
-                    (r"session.*utløpt|session expired|økten.*utløpt", "Innloggingsøkten har utløpt. Dette skjer etter 30 minutter med inaktivitet."),
-                    (r"ingen tilgang|no access|access denied", "Du mangler tilgang. Kontakt support for å sjekke brukerrettigheter."),
-                    (r"organisasjon|institution|skole", "Feil organisasjon valgt. Velg riktig skole/institusjon fra nedtrekksmenyen."),
-                ],
-                "solutions": {
-                    "basic": [
-                        "Sjekk at brukernavn er riktig format: fornavn.etternavn@skole.no",
-                        "Kontroller at passordet er riktig (Caps Lock av)",
-                        "Velg riktig organisasjon/skole fra nedtrekksmenyen",
-                        "Prøv i et inkognito-vindu (Ctrl+Shift+N)"
-                    ],
-                    "intermediate": [
-                        "Tøm nettleserens cache og cookies (Ctrl+Shift+Del)",
-                        "Prøv en annen nettleser (Chrome, Firefox, Edge)",
-                        "Sjekk at system-klokken er riktig (viktig for Feide-autentisering)",
-                        "Deaktiver VPN hvis du har det påslått"
-                    ],
-                    "advanced": [
-                        "Test med mobil data i stedet for Wi-Fi (isolerer nettverksproblemer)",
-                        "Sjekk status.feide.no for driftsmeldinger",
-                        "Kontroller at nettleseren er oppdatert til siste versjon",
-                        "Prøv å logge inn fra en annen enhet for å teste om problemet følger deg"
-                    ]
-                },
-                "questions": [
-                    "Får du en feilmelding? I så fall, hva står det?",
-                    "Hvilken nettleser bruker du?",
-                    "Skjer dette på flere enheter eller bare én?",
-                    "Har du prøvd i et inkognito-vindu?"
-                ]
-            },
-            "wifi": {
-                "description": "Wireless network connectivity issues",
-                "keywords": ["wifi", "wi-fi", "nett", "internett", "nettverk", "tilkobling", "trådløst"],
-                "natural_phrases": [
-                    "får ikke nett", "ingen internett", "nettverket fungerer ikke",
-                    "kan ikke koble til", "wifi virker ikke", "internett er nede",
-                    "kommer ikke på nett", "nettverket er tregt"
-                ],
-                "error_patterns": [
-                    (r"ingen internett|no internet|not connected", "Du er koblet til Wi-Fi, men har ingen internett-tilgang. Dette kan være DNS-problem eller ISP-problem."),
-                    (r"begrensa.*tilkobling|limited connectivity|begrenset", "Windows melder 'Begrenset tilkobling' som betyr at du er koblet til Wi-Fi, men ikke kan nå internett."),
-                    (r"finner ikke|cannot find|not found", "Nettverket vises ikke i listen. Dette kan skyldes at du er for langt unna, eller at nettverket er skjult."),
-                    (r"feil passord|wrong password|incorrect password", "Wi-Fi-passordet er feil. Dobbeltsjekk passordet, spesielt spesialtegn."),
-                    (r"ip.*adresse|ip.*address|dhcp", "Kan ikke få IP-adresse fra nettverket. Dette er et DHCP-problem på ruteren."),
-                ],
-                "solutions": {
-                    "basic": [
-                        "Slå Wi-Fi av og på igjen på enheten",
-                        "Start enheten på nytt",
-                        "Flytt nærmere Wi-Fi-routeren",
-                        "Sjekk at du kobler til riktig nettverk (ikke naboen sitt)"
-                    ],
-                    "intermediate": [
-                        "Start routeren på nytt (trekk ut strømmen i 30 sekunder)",
-                        "Glem nettverket og koble til på nytt",
-                        "Test på en annen enhet - fungerer det der? (isolerer om det er enheten eller nettverket)",
-                        "Sjekk at flymodus ikke er på"
-                    ],
-                    "advanced": [
-                        "Sjekk IP-innstillinger - sørg for at DHCP er aktivert",
-                        "Prøv å sette DNS manuelt til 8.8.8.8 og 8.8.4.4 (Google DNS)",
-                        "Sjekk om MAC-filtrering er aktivert på routeren",
-                        "Test med Ethernet-kabel hvis mulig (isolerer Wi-Fi-problemet)"
-                    ]
-                },
-                "questions": [
-                    "Ser du nettverket i listen over tilgjengelige nettverk?",
-                    "Er du koblet til, men uten internett? Eller kan du ikke koble til i det hele tatt?",
-                    "Fungerer det på andre enheter (mobil, PC)?",
-                    "Er signalstyrken god (full stripe)?"
-                ]
-            },
-            "utskrift": {
-                "description": "Printer and printing problems",
-                "keywords": ["utskrift", "skriver", "printer", "print", "skrive ut"],
-                "natural_phrases": [
-                    "kan ikke skrive ut", "skriveren fungerer ikke", "får ikke printet",
-                    "printer ikke", "utskrift virker ikke", "skriveren svarer ikke"
-                ],
-                "error_patterns": [
-                    (r"ikke funnet|not found|cannot find", "Skriveren finnes ikke i systemet. Driver mangler eller skriver er ikke på nettverket."),
-                    (r"offline|ikke.*tilkoblet|disconnected", "Skriveren viser som offline. Sjekk tilkobling og strøm."),
-                    (r"papir|paper.*jam|papirstopp", "Papirstopp i skriveren. Åpne skriveren og fjern papir forsiktig."),
-                    (r"toner|blekk|ink|cartridge", "Toner/blekk er tom eller lav. Bytt patron."),
-                    (r"kø|queue|venter", "Utskriftskøen er blokkert. Gamle dokumenter hindrer nye utskrifter."),
-                    (r"driver|drivere", "Skriverdriver er korrupt eller utdatert."),
-                ],
-                "solutions": {
-                    "basic": [
-                        "Sjekk at skriveren er slått på og koblet til strøm",
-                        "Kontroller at riktig skriver er valgt i utskriftsdialogen",
-                        "Sjekk papir - er det papir i skuffen?",
-                        "Start både skriver og PC på nytt"
-                    ],
-                    "intermediate": [
-                        "Åpne utskriftskøen og slett gamle/ventende dokumenter",
-                        "Sjekk at skriveren ikke viser feilmodus (blinkende lys/feilmelding)",
-                        "Test å printe en testside direkte fra skriveren",
-                        "Prøv å skrive ut fra et annet program (f.eks. Notisblokk)"
-                    ],
-                    "advanced": [
-                        "Reinstaller skriverdriver fra produsentens nettside",
-                        "For nettverksskriver: ping skriverens IP-adresse",
-                        "Sjekk Windows Print Spooler-tjenesten (services.msc)",
-                        "Opprett ny skriver med samme driver (fjern gammel først)"
-                    ]
-                },
-                "questions": [
-                    "Skjer det noe når du trykker print? Kommer dokumentet i køen?",
-                    "Er det en lokal skriver (USB) eller nettverksskriver?",
-                    "Viser skriveren noen feilmeldinger eller blinkende lys?",
-                    "Har det fungert før, eller er dette første gang?"
-                ]
-            },
-            "passord": {
-                "description": "Password and account access issues",
-                "keywords": ["passord", "password", "glemt", "reset", "låst", "konto"],
-                "natural_phrases": [
-                    "har glemt passordet", "kan ikke huske passordet", "passord fungerer ikke",
-                    "kontoen er låst", "må bytte passord", "feil passord"
-                ],
-                "error_patterns": [
-                    (r"låst|locked|blocked", "Kontoen din er låst etter flere feilede innloggingsforsøk. Den låses vanligvis opp automatisk etter 30 minutter."),
-                    (r"utløpt|expired|gamle", "Passordet har utløpt. De fleste systemer krever passordbytte hver 90-180 dag."),
-                    (r"kompleksitet|complexity|krav|requirements", "Det nye passordet oppfyller ikke sikkerhetskrav (lengde, tegn, etc)."),
-                    (r"brukt før|used before|previously used", "Du kan ikke gjenbruke gamle passord."),
-                    (r"ikke synk|not sync|forskjellig", "Passordet er ikke synkronisert mellom systemer ennå. Vent 5-10 minutter."),
-                ],
-                "solutions": {
-                    "basic": [
-                        "Sjekk at Caps Lock er AV (passord er case-sensitive)",
-                        "Kontroller tastaturspråk (norsk vs engelsk layout)",
-                        "Bruk 'Glemt passord'-lenken hvis tilgjengelig",
-                        "Vent 5-10 minutter hvis du nettopp har byttet passord (synkronisering)"
-                    ],
-                    "intermediate": [
-                        "Prøv å logge inn på en annen enhet (isolerer om problemet er lokalt)",
-                        "Sjekk at du bruker riktig brukernavn-format",
-                        "For låst konto: vent 30 minutter for automatisk opplåsing",
-                        "Test passordet i Notisblokk først (for å se hva du faktisk skriver)"
-                    ],
-                    "advanced": [
-                        "Husk passordkrav: Minimum 8-12 tegn, store og små bokstaver, tall, spesialtegn",
-                        "Bruk en passordbehandler (LastPass, 1Password, Bitwarden)",
-                        "For AD/domenekonto: prøv å låse og låse opp PC (Ctrl+Alt+Del)",
-                        "Kontakt support hvis kontoen fortsatt er låst etter 30 min"
-                    ]
-                },
-                "questions": [
-                    "Er kontoen låst, eller er det bare feil passord?",
-                    "Har du byttet passord nylig (siste 10 minutter)?",
-                    "Virker passordet på andre systemer/tjenester?",
-                    "Får du en spesifikk feilmelding?"
-                ]
-            },
-            "m365": {
-                "description": "Microsoft 365 applications and services",
-                "keywords": ["teams", "outlook", "onedrive", "word", "excel", "powerpoint", "office", "m365", "365"],
-                "natural_phrases": [
-                    "teams fungerer ikke", "outlook krasjer", "kan ikke åpne word",
-                    "onedrive synkroniserer ikke", "kan ikke sende epost", "teams-møte virker ikke"
-                ],
-                "error_patterns": [
-                    (r"synk.*ikke|not sync|synkronisering", "OneDrive synkroniserer ikke filer. Dette kan skyldes nettverksproblemer eller konflikt."),
-                    (r"kan ikke.*åpne|cannot open|won't open", "Kan ikke åpne Office-filer. Dette kan være lisens-, tilgangs- eller fil-problem."),
-                    (r"teams.*krasj|teams.*crash|teams freeze", "Teams krasjer eller fryser. Ofte cache-relatert."),
-                    (r"mikrofon|kamera|audio|video|lyd|bilde", "Lyd/video fungerer ikke i Teams. Dette er vanligvis en tillatelse- eller driver-issue."),
-                    (r"lisens|license|activation", "Office er ikke aktivert eller lisens mangler."),
-                    (r"epost|email|mail.*send|kan ikke sende", "Kan ikke sende/motta e-post i Outlook."),
-                ],
-                "solutions": {
-                    "basic": [
-                        "Logg helt ut og inn igjen i programmet/appen",
-                        "Start programmet på nytt",
-                        "Sjekk internettforbindelsen",
-                        "Prøv web-versjonen (office.com) - fungerer det der?"
-                    ],
-                    "intermediate": [
-                        "For Teams: Tøm cache (%appdata%\\Microsoft\\Teams\\Cache)",
-                        "For OneDrive: Pause og fortsett synkronisering",
-                        "For Outlook: Kjør i safe mode (outlook.exe /safe)",
-                        "Sjekk at du har siste versjon (Fil > Konto > Oppdateringsalternativer)"
-                    ],
-                    "advanced": [
-                        "Reparer Office-installasjonen (Kontrollpanel > Programmer)",
-                        "Tilbakestill Teams: Avinstaller fullstendig og installer på nytt",
-                        "Sjekk OneDrive-status: høyreklikk OneDrive-ikon > Innstillinger",
-                        "For Teams lyd/video: Sjekk nettleser-tillatelser og Windows personvern"
-                    ]
-                },
-                "questions": [
-                    "Hvilket program har du problemer med (Teams/Outlook/Word/etc)?",
-                    "Får du en feilmelding? Hva står det?",
-                    "Fungerer det i web-versjonen (office.com)?",
-                    "Er dette et nytt problem eller har det vært lenge?"
-                ]
-            },
-            "nettleser": {
-                "description": "Web browser issues and problems",
-                "keywords": ["chrome", "edge", "safari", "firefox", "nettleser", "browser", "nettside", "webside"],
-                "natural_phrases": [
-                    "nettleseren krasjer", "siden laster ikke", "nettleser er treg",
-                    "nettsider fungerer ikke", "browser virker ikke"
-                ],
-                "error_patterns": [
-                    (r"laster ikke|won't load|not loading", "Nettsider laster ikke. Dette kan være cache, DNS, eller nettverksproblem."),
-                    (r"treg|slow|langsom", "Nettleseren er veldig treg. Sannsynligvis for mange åpne faner eller utvidelser."),
-                    (r"krasj|crash|frys|freeze", "Nettleseren krasjer. Dette kan være korrupt cache, dårlig utvidelse, eller minne-problem."),
-                    (r"err_|dns|ssl|certificate|sertifikat", "Nettverksfeil i nettleseren (DNS, SSL, eller tilkoblingsproblem)."),
-                    (r"cookies|cache", "Cache/cookie-problemer som hindrer riktig lasting."),
-                ],
-                "solutions": {
-                    "basic": [
-                        "Oppdater siden (Ctrl+R eller F5)",
-                        "Hard refresh: Ctrl+Shift+R (tømmer cache for den siden)",
-                        "Prøv inkognito-modus (Ctrl+Shift+N)",
-                        "Test en annen nettside - er problemet generelt eller spesifikt?"
-                    ],
-                    "intermediate": [
-                        "Tøm cache og cookies: Ctrl+Shift+Del > velg 'All tid'",
-                        "Deaktiver alle utvidelser midlertidig (sjekk om én av dem er problemet)",
-                        "Test i en annen nettleser - fungerer det der?",
-                        "Oppdater nettleseren til siste versjon"
-                    ],
-                    "advanced": [
-                        "Opprett ny nettleserprofil (for å teste om profilen er korrupt)",
-                        "Tøm DNS-cache: åpne CMD og kjør 'ipconfig /flushdns'",
-                        "Deaktiver hardware-akselerasjon (Innstillinger > System)",
-                        "Reset nettleserinnstillinger til standard"
-                    ]
-                },
-                "questions": [
-                    "Hvilken nettleser bruker du?",
-                    "Er det alle nettsider eller bare én bestemt?",
-                    "Fungerer det i inkognito-modus?",
-                    "Har du mange utvidelser installert?"
-                ]
-            }
+        self._compile_matchers()
+        self._slots = {
+            self.URGENCY_SLOT: self.URGENCY_OPENERS,
+            self.SUCCESS_SLOT: self.SUCCESS_MESSAGES,
+        }
+        self._plain_slots = {
+            slot: [sanitize_chat_reply(text) for text in choices] for slot, choices in self._slots.items()
         }
+        # Ferdige svar på vanlige spørsmål (se respond())
+        self.reply_cache = TTLCache(ttl=Config.CHAT_REPLY_CACHE_TTL, maxsize=Config.CHAT_REPLY_CACHE_SIZE)
 
-    def _init_conversation_patterns(self) -> Dict:
-        """Patterns that indicate user intent and emotion"""
+    @staticmethod
+    def new_conversation_state() -> Dict:
         return {
-            "urgency": {
-                "high": ["haster", "akutt", "kritisk", "nå", "umiddelbart", "snarest", "raskt",
-                         "deadline", "eksamen", "presentasjon", "møte om", "fort", "emergency"],
-                "frustrated": ["irritert", "frustrert", "lei", "gir opp", "funker aldri",
-                               "dritt", "faen", "pokker", "ugh", "argh"],
-                "confused": ["forstår ikke", "skjønner ikke", "confused", "forvirret",
-                             "hva mener du", "hva betyr", "hvordan"]
-            },
-            "progress": {
-                "tried": ["har prøvd", "prøvd", "forsøkt", "tested", "gjort"],
-                "not_working": ["fungerer ikke", "virker ikke", "hjelper ikke", "samme feil",
-                                "fortsatt problem", "fremdeles"],
-                "worked": ["fungerte", "virket", "løst", "fikset", "fixed", "takk", "tusen takk"]
-            },
-            "questions": {
-                "how": ["hvordan", "how", "how do i"],
-                "why": ["hvorfor", "why", "how come"],
-                "what": ["hva", "what", "what is"],
-                "where": ["hvor", "where"]
-            }
+            "message_count": 0,
+            "last_topic": None,
+            "solutions_given": None,
+            "context_entities": {},
+            "user_requested_human": False
         }
 
+    def _compile_matchers(self) -> None:
+        """
+        Samler alle nøkkelord og fraser (kunnskapsbase, sentiment, entiteter,
+        eskalering) i én Aho-Corasick-automat, så hver melding leses én gang
+        i _scan() i stedet for med én `in`-sjekk per ord.
+
+        Feilmønstrene kompileres her. Faste strenger som må finnes for at et
+        mønster skal treffe, legges også i automaten; re.search() kjøres da
+        bare for mønstre der automaten har sett en av dem.
+        """
+        ac = AhoCorasick()
+        urgency = self.conversation_patterns["urgency"]
+        for kind in ("high", "frustrated", "confused"):
+            for i, word in enumerate(urgency[kind]):
+                ac.add(word, (kind, i))
+        for kind, mapping in (("os", self.OS_MAP), ("browser", self.BROWSER_MAP), ("app", self.APP_MAP)):
+            for order, keywords in enumerate(mapping.values()):
+                for keyword in keywords:
+                    ac.add(keyword, (kind, order))
+        for kind, phrases in (
+            ("action", self.ACTION_KEYWORDS),
+            ("human", self.HUMAN_REQUEST_PHRASES),
+            ("positive", self.POSITIVE_PHRASES),
+            ("follow_up", self.FOLLOW_UP_PHRASES),
+        ):
+            for i, phrase in enumerate(phrases):
+                ac.add(phrase, (kind, i))
+
+        # Delstrenger (minst 3 tegn) av hvert nøkkelord, for "ord i nøkkelord"
+        self._keyword_parts: Dict[str, set] = defaultdict(set)
+        # (topic, i) -> kompilert feilmønster; mønstre uten faste strenger sjekkes alltid
+        self._error_regexes: Dict[Tuple[str, int], "re.Pattern"] = {}
+        self._always_check_errors: List[Tuple[str, int]] = []
+
+        for topic, data in self.knowledge_base.items():
+            for i, keyword in enumerate(data["keywords"]):
+                key = (topic, i)
+                ac.add(keyword, ("kw", key))
+                for a in range(len(keyword)):
+                    for b in range(a + 3, len(keyword) + 1):
+                        self._keyword_parts[keyword[a:b]].add(key)
+            for i, phrase in enumerate(data["natural_phrases"]):
+                ac.add(phrase, ("phrase", (topic, i)))
+            for i, (pattern, _) in enumerate(data.get("error_patterns", [])):
+                key = (topic, i)
+                self._error_regexes[key] = re.compile(pattern)
+                literals = required_literals(pattern)
+                if literals is None:
+                    self._always_check_errors.append(key)
+                else:
+                    for literal in literals:
+                        ac.add(literal, ("error_literal", key))
+
+        self._matcher = ac.build()
+
+    def _scan(self, text_lower: str) -> Dict[str, set]:
+        """
+        Alle treff i meldingen, gruppert på type: {"high": {0}, "kw": {("wifi", 2)}, ...}.
+
+        "kw_word" er nøkkelord der et ord i meldingen (ikke støyord, lengre
+        enn 2 tegn) inneholder nøkkelordet eller er en del av det; det som
+        tidligere var en løkke over nøkkelord × ord i _classify_topic.
+        """
+        hits: Dict[str, set] = defaultdict(set)
+
+        spans = [(m.start(), m.end()) for m in re.finditer(r"\S+", text_lower)]
+        starts = [start for start, _ in spans]
+        eligible = [
+            (end - start) > 2 and text_lower[start:end] not in self.NOISE_WORDS
+            for start, end in spans
+        ]
+
+        for start, end, (kind, key) in self._matcher.finditer(text_lower):
+            hits[kind].add(key)
+            if kind == "kw":
+                t = bisect_right(starts, start) - 1
+                if t >= 0 and end <= spans[t][1] and eligible[t]:
+                    hits["kw_word"].add(key)
+
+        for (start, end), ok in zip(spans, eligible):
+            if ok:
+                hits["kw_word"].update(self._keyword_parts.get(text_lower[start:end], ()))
+        return hits
+
     def _init_intent_classifiers(self) -> Dict:
         """AI intent classification rules"""
         return {
@@ -1383,9 +1640,10 @@ class IntelligentHelpdeskAI:
             "has_error_message": lambda text: '"' in text or "feilmelding" in text.lower()
         }
 
-    def _analyze_sentiment(self, text: str) -> Dict:
+    def _analyze_sentiment(self, text: str, hits: Optional[Dict[str, set]] = None) -> Dict:
         """Analyze user's emotional state and urgency"""
-        text_lower = text.lower()
+        if hits is None:
+            hits = self._scan(text.lower())
 
         sentiment = {
             "urgency": "normal",
@@ -1393,20 +1651,19 @@ class IntelligentHelpdeskAI:
             "frustration_level": 0
         }
 
-        if any(word in text_lower for word in self.conversation_patterns["urgency"]["high"]):
+        if hits["high"]:
             sentiment["urgency"] = "high"
 
-        frustrated_words = [w for w in self.conversation_patterns["urgency"]["frustrated"] if w in text_lower]
-        if frustrated_words:
+        if hits["frustrated"]:
             sentiment["emotion"] = "frustrated"
-            sentiment["frustration_level"] = len(frustrated_words)
+            sentiment["frustration_level"] = len(hits["frustrated"])
 
-        if any(word in text_lower for word in self.conversation_patterns["urgency"]["confused"]):
+        if hits["confused"]:
             sentiment["emotion"] = "confused"
 
         return sentiment
 
-    def _extract_entities(self, text: str) -> Dict:
+    def _extract_entities(self, text: str, hits: Optional[Dict[str, set]] = None) -> Dict:
         """Extract key information from user message (NER-like)"""
         entities = {
             "os": None,
@@ -1417,95 +1674,55 @@ class IntelligentHelpdeskAI:
             "actions_tried": []
         }
 
-        text_lower = text.lower()
-
-        os_map = {
-            "windows": ["windows", "win10", "win11", "pc", "laptop"],
-            "macos": ["mac", "macos", "macbook", "imac", "apple"],
-            "ios": ["iphone", "ipad", "ios"],
-            "android": ["android", "samsung", "pixel"],
-            "linux": ["linux", "ubuntu"]
-        }
-        for os_name, keywords in os_map.items():
-            if any(k in text_lower for k in keywords):
-                entities["os"] = os_name
-                break
-
-        browser_map = {
-            "Chrome": ["chrome", "google chrome"],
-            "Edge": ["edge", "microsoft edge"],
-            "Safari": ["safari"],
-            "Firefox": ["firefox", "mozilla"]
-        }
-        for browser, keywords in browser_map.items():
-            if any(k in text_lower for k in keywords):
-                entities["browser"] = browser
-                break
-
-        app_map = {
-            "Teams": ["teams", "microsoft teams"],
-            "Outlook": ["outlook"],
-            "Word": ["word", "word document"],
-            "Excel": ["excel", "spreadsheet"],
-            "PowerPoint": ["powerpoint", "ppt", "presentasjon"],
-            "OneDrive": ["onedrive"]
-        }
-        for app, keywords in app_map.items():
-            if any(k in text_lower for k in keywords):
-                entities["application"] = app
-                break
-
-        error_patterns = [
-            r'"([^"]+)"',
-            r'feilmelding[:\s]+([^\n\.]+)',
-            r'får[:\s]+([^\n\.]+)',
-            r'sier[:\s]+([^\n\.]+)'
-        ]
-        for pattern in error_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                entities["error_message"] = match.group(1).strip()
-                break
-
-        action_keywords = ["prøvd", "forsøkt", "restartet", "startet på nytt", "tømt cache",
-                          "logget ut", "reinstallert", "sjekket", "testet"]
-        entities["actions_tried"] = [k for k in action_keywords if k in text_lower]
-
-        return entities
-
-    def _classify_topic(self, text: str, entities: Dict) -> Tuple[str, float]:
-        text_lower = text.lower()
-        scores = {}
+        if hits is None:
+            hits = self._scan(text.lower())
 
-        noise_words = ["jeg", "du", "det", "har", "er", "på", "med", "til", "og", "i"]
-        words = [w for w in text_lower.split() if w not in noise_words and len(w) > 2]
+        # Første i ordlistens rekkefølge vinner, som før
+        if hits["os"]:
+            entities["os"] = list(self.OS_MAP)[min(hits["os"])]
+        if hits["browser"]:
+            entities["browser"] = list(self.BROWSER_MAP)[min(hits["browser"])]
+        if hits["app"]:
+            entities["application"] = list(self.APP_MAP)[min(hits["app"])]
 
-        for topic, data in self.knowledge_base.items():
-            score = 0
+        entities["error_message"] = self._error_message(text)
 
-            for keyword in data["keywords"]:
-                if keyword in text_lower:
-                    score += 3
+        entities["actions_tried"] = [self.ACTION_KEYWORDS[i] for i in sorted(hits["action"])]
 
-            for phrase in data["natural_phrases"]:
-                if phrase in text_lower:
-                    score += 5
+        return entities
 
-            for keyword in data["keywords"]:
-                if any(keyword in word or word in keyword for word in words):
-                    score += 1
+    def _error_message(self, text: str) -> Optional[str]:
+        # Eneste del av analysen som bruker originalteksten (store/små bokstaver)
+        for pattern in self.ERROR_MESSAGE_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                return match.group(1).strip()
+        return None
 
-            if topic == "m365" and entities.get("application"):
-                score += 4
-            if topic == "nettleser" and entities.get("browser"):
-                score += 4
+    def _classify_topic(self, text: str, entities: Dict, hits: Optional[Dict[str, set]] = None) -> Tuple[str, float]:
+        text_lower = text.lower()
+        if hits is None:
+            hits = self._scan(text_lower)
+
+        # Samme poeng som før: 3 per nøkkelord, 5 per frase, 1 per nøkkelord
+        # som overlapper et ord, 6 per feilmønster som treffer
+        totals = dict.fromkeys(self.knowledge_base, 0)
+        for topic, _ in hits["kw"]:
+            totals[topic] += 3
+        for topic, _ in hits["phrase"]:
+            totals[topic] += 5
+        for topic, _ in hits["kw_word"]:
+            totals[topic] += 1
+        for key in hits["error_literal"].union(self._always_check_errors):
+            if self._error_regexes[key].search(text_lower):
+                totals[key[0]] += 6
 
-            for error_pattern, _ in data.get("error_patterns", []):
-                if re.search(error_pattern, text_lower):
-                    score += 6
+        if entities.get("application"):
+            totals["m365"] = totals.get("m365", 0) + 4
+        if entities.get("browser"):
+            totals["nettleser"] = totals.get("nettleser", 0) + 4
 
-            if score > 0:
-                scores[topic] = score
+        scores = {topic: totals[topic] for topic in self.knowledge_base if totals[topic] > 0}
 
         if not scores:
             return "unknown", 0.0
@@ -1522,8 +1739,8 @@ class IntelligentHelpdeskAI:
         topic_data = self.knowledge_base[topic]
         error_lower = error_msg.lower()
 
-        for pattern, explanation in topic_data.get("error_patterns", []):
-            if re.search(pattern, error_lower):
+        for i, (_, explanation) in enumerate(topic_data.get("error_patterns", [])):
+            if self._error_regexes[(topic, i)].search(error_lower):
                 return explanation
 
         return None
@@ -1616,13 +1833,7 @@ class IntelligentHelpdeskAI:
 
     def _generate_opening(self, topic: str, sentiment: Dict, entities: Dict) -> str:
         if sentiment["urgency"] == "high":
-            urgency_openers = [
-                " **Jeg ser dette haster!** La meg hjelpe deg raskt.",
-                " **Forstår at dette er viktig.** La oss løse det nå.",
-                " **OK, dette må fikses fort.** Jeg skal hjelpe deg umiddelbart."
-            ]
-            import random
-            return random.choice(urgency_openers)
+            return self.URGENCY_SLOT
 
         if sentiment["emotion"] == "frustrated":
             if sentiment["frustration_level"] > 1:
@@ -1693,28 +1904,69 @@ class IntelligentHelpdeskAI:
         )
 
     def process_message(self, user_msg: str, conversation_state: Dict = None) -> Tuple[str, Dict]:
+        reply, conversation_state = self._process_message(user_msg, conversation_state)
+        return self._fill_slots(reply, self._slots), conversation_state
+
+    def respond(self, user_msg: str, conversation_state: Dict = None) -> Tuple[str, Dict]:
+        """
+        Som process_message, men uten markdown (svaret til /chat), og med cache.
+
+        De fleste meldinger er de samme få spørsmålene, og svaret avhenger bare
+        av meldingen og tilstanden i samtalen. Ferdig svar og ny tilstand
+        caches derfor på normalisert melding + tilstanden (antall meldinger
+        gruppert 1, 2, 3, 4+, der svaret endrer seg). Tilfeldige åpninger
+        ligger som plassholdere i cachen og velges på nytt for hvert svar.
+        """
         if conversation_state is None:
-            conversation_state = {
-                "message_count": 0,
-                "last_topic": None,
-                "solutions_given": None,
-                "context_entities": {},
-                "user_requested_human": False
-            }
+            conversation_state = self.new_conversation_state()
+
+        # Bare nøkkelen normaliseres; feilmeldingen hentes fra originalteksten
+        # siden mønstrene stopper ved linjeskift
+        text = " ".join(user_msg.split())
+        count = conversation_state.get("message_count", 0) + 1
+        rest = {k: v for k, v in conversation_state.items() if k != "message_count"}
+        key = (text.lower(), self._error_message(user_msg), min(count, 4), json.dumps(rest, sort_keys=True))
+
+        cached = self.reply_cache.get(key)
+        if cached is None:
+            reply, state = self._process_message(user_msg, copy.deepcopy(conversation_state))
+            state.pop("message_count")
+            cached = (sanitize_chat_reply(reply), state)
+            self.reply_cache.set(key, cached)
+
+        reply, state = cached
+        conversation_state.update(copy.deepcopy(state))
+        conversation_state["message_count"] = count
+        return self._fill_slots(reply, self._plain_slots), conversation_state
+
+    def cache_stats(self) -> Dict[str, int]:
+        return dict(self.reply_cache.stats, size=len(self.reply_cache))
+
+    @staticmethod
+    def _fill_slots(reply: str, slots: Dict[str, List[str]]) -> str:
+        for slot, choices in slots.items():
+            if slot in reply:
+                reply = reply.replace(slot, random.choice(choices))
+        return reply
+
+    def _process_message(self, user_msg: str, conversation_state: Dict = None) -> Tuple[str, Dict]:
+        if conversation_state is None:
+            conversation_state = self.new_conversation_state()
 
         conversation_state["message_count"] += 1
 
-        human_request_phrases = ["snakke med", "menneske", "ekte person", "support", "menneskelig"]
-        if any(phrase in user_msg.lower() for phrase in human_request_phrases):
+        # Én gjennomgang av meldingen gir alle treff som trengs under
+        hits = self._scan(user_msg.lower())
+
+        if hits["human"]:
             conversation_state["user_requested_human"] = True
             return self._generate_human_escalation_message(), conversation_state
 
-        positive_phrases = ["takk", "fungerte", "virket", "løst", "fikset", "bra", "perfekt"]
-        if any(phrase in user_msg.lower() for phrase in positive_phrases) and conversation_state["message_count"] > 1:
+        if hits["positive"] and conversation_state["message_count"] > 1:
             return self._generate_success_message(), conversation_state
 
-        sentiment = self._analyze_sentiment(user_msg)
-        entities = self._extract_entities(user_msg)
+        sentiment = self._analyze_sentiment(user_msg, hits)
+        entities = self._extract_entities(user_msg, hits)
 
         previous_entities = conversation_state.get("context_entities", {})
         for key, value in entities.items():
@@ -1722,11 +1974,10 @@ class IntelligentHelpdeskAI:
                 previous_entities[key] = value
         conversation_state["context_entities"] = previous_entities
 
-        topic, confidence = self._classify_topic(user_msg, previous_entities)
+        topic, confidence = self._classify_topic(user_msg, previous_entities, hits)
 
-        follow_up_phrases = ["nei", "fungerer ikke", "virker ikke", "fortsatt", "samme problem", "hjelper ikke"]
         if (topic == "unknown" or confidence < 0.3) and conversation_state.get("last_topic"):
-            if any(phrase in user_msg.lower() for phrase in follow_up_phrases):
+            if hits["follow_up"]:
                 topic = conversation_state["last_topic"]
                 confidence = 0.8
 
@@ -1744,16 +1995,43 @@ class IntelligentHelpdeskAI:
             conversation_state
         )
 
+        articles = self._related_articles(user_msg, conversation_state)
+        if articles:
+            lines = ["", "**Artikler i kunnskapsbasen som kan hjelpe:**"]
+            lines += [f"• {a['title']}: /kb/{a['id']}" for a in articles]
+            response += "\n".join(lines)
+
         return response, conversation_state
 
-    def _generate_success_message(self) -> str:
-        import random
-        messages = [
-            " **Fantastisk!** Jeg er så glad jeg kunne hjelpe deg!\n\nHvis du får andre problemer, er jeg her. Ha en fin dag! ",
-            " **Perfekt!** Det var akkurat det jeg håpet på!\n\nHusk at jeg alltid er her hvis du trenger hjelp igjen. Lykke til! ",
-            " **Supert!** Kjempe bra at det virket!\n\nFøl deg fri til å spørre meg igjen hvis du trenger noe. God dag videre! "
+    def _related_articles(self, user_msg: str, conversation_state: Dict) -> List[Dict]:
+        """
+        De mest relevante KB-artiklene for meldingen (FTS5/bm25, se
+        db.suggest_articles), uten artikler som alt er foreslått i samtalen.
+        """
+        words = [
+            w for w in re.findall(r"\w+", user_msg.lower())
+            if len(w) > 2 and w not in self.NOISE_WORDS and w not in dedup.STOPWORDS
         ]
-        return random.choice(messages)
+        if not words:
+            return []
+
+        shown = conversation_state.get("suggested_articles") or []
+        try:
+            found = suggest_articles(
+                words,
+                limit=Config.CHAT_ARTICLE_SUGGESTIONS + len(shown),
+                max_candidates=Config.CHAT_ARTICLE_MAX_CANDIDATES,
+            )
+        except Exception as e:
+            logger.error(f"Article suggestions failed: {e}")
+            return []
+
+        articles = [a for a in found if a["id"] not in shown][:Config.CHAT_ARTICLE_SUGGESTIONS]
+        conversation_state["suggested_articles"] = shown + [a["id"] for a in articles]
+        return articles
+
+    def _generate_success_message(self) -> str:
+        return self.SUCCESS_SLOT
 
     def _generate_escalation_message(self, topic: str, entities: Dict) -> str:
         parts = []
@@ -1795,16 +2073,46 @@ class IntelligentHelpdeskAI:
         )
 
 
-# Global bot instance
-_bot_instance = None
+# Global bot instance. En ny versjon av kunnskapsbasen gir en ny instans som
+# byttes inn i én tilordning; en melding bruker hele tiden instansen den fikk.
+_bot_instance: Optional[IntelligentHelpdeskAI] = None
+_bot_checked_at = 0.0
+_bot_lock = threading.Lock()
 
 
 def get_bot() -> IntelligentHelpdeskAI:
-    """Get or create AI bot instance"""
-    global _bot_instance
-    if _bot_instance is None:
-        _bot_instance = IntelligentHelpdeskAI()
-    return _bot_instance
+    """Boten for nyeste versjon av kunnskapsbasen (sjekkes hvert CHATBOT_KB_RELOAD_SECONDS)."""
+    global _bot_instance, _bot_checked_at
+    bot = _bot_instance
+    if bot is not None and time.monotonic() < _bot_checked_at:
+        return bot
+
+    with _bot_lock:
+        bot = _bot_instance
+        if bot is not None and time.monotonic() < _bot_checked_at:
+            return bot
+        try:
+            latest = get_chatbot_kb(after_version=bot.kb_version if bot else 0)
+            if latest is None and bot is None:
+                # Tom tabell: første versjon er datafilen
+                kb = load_chatbot_kb_file()
+                latest = {"version": save_chatbot_kb(kb, "system"), "data": kb}
+            if latest is not None:
+                bot = IntelligentHelpdeskAI(latest["data"], latest["version"])
+        except Exception as e:
+            logger.error(f"Could not load chatbot knowledge base: {e}")
+            if bot is None:
+                bot = IntelligentHelpdeskAI()
+        _bot_instance = bot
+        _bot_checked_at = time.monotonic() + Config.CHATBOT_KB_RELOAD_SECONDS
+    return bot
+
+
+def _install_bot(bot: IntelligentHelpdeskAI) -> None:
+    global _bot_instance, _bot_checked_at
+    with _bot_lock:
+        _bot_instance = bot
+        _bot_checked_at = time.monotonic() + Config.CHATBOT_KB_RELOAD_SECONDS
 
 
 def sanitize_chat_reply(text: str) -> str:
@@ -1835,25 +2143,21 @@ def chat():
         if not user_msg:
             return jsonify({"reply": "Skriv hva du trenger hjelp med, så hjelper jeg deg!"})
 
-        if "ai_chat_state" not in session:
-            session["ai_chat_state"] = {
-                "message_count": 0,
-                "last_topic": None,
-                "solutions_given": None,
-                "context_entities": {},
-                "user_requested_human": False
-            }
-
-        conversation_state = session["ai_chat_state"]
-
+        # Cookien har bare samtale-id-en; tilstand og historikk ligger i databasen
+        user = current_user()
+        session.pop("ai_chat_state", None)  # gammel tilstand i cookien
+        conv_id = session.get("chat_id")
+        conversation_state = get_chat_conversation(conv_id, user) if conv_id else None
         bot = get_bot()
-        reply, updated_state = bot.process_message(user_msg, conversation_state)
+        if conversation_state is None:
+            conversation_state = bot.new_conversation_state()
+            conv_id = create_chat_conversation(user, conversation_state)
+            session["chat_id"] = conv_id
 
-        # Remove markdown from reply
-        reply = sanitize_chat_reply(reply)
+        # Svar uten markdown; vanlige spørsmål kommer fra cachen
+        reply, updated_state = bot.respond(user_msg, conversation_state)
 
-        session["ai_chat_state"] = updated_state
-        session.modified = True
+        save_chat_turn(conv_id, updated_state, user_msg, reply)
 
         try:
             log_activity(
@@ -1884,9 +2188,10 @@ def reset_chat():
     if not current_user():
         return jsonify({"status": "error"}), 401
 
+    # Ny samtale ved neste melding; den gamle blir liggende for support til den går ut
+    session.pop("chat_id", None)
     session.pop("ai_chat_state", None)
     session.pop("chat_history", None)
-    session.modified = True
 
     try:
         log_activity(current_user(), "Reset chat-samtale")
@@ -1898,6 +2203,117 @@ def reset_chat():
         "message": "Samtalen er tilbakestilt. Jeg husker ikke vår tidligere dialog nå! "
     })
 
+@bp.route("/admin/chats/<username>")
+def admin_chats(username):
+    """Brukerens siste chat-samtaler, så support ser hva boten har foreslått"""
+    if not current_user() or current_role() != "support":
+        abort(403)
+    return jsonify({"user": username, "conversations": get_chat_conversations(username)})
+
+
+@bp.route("/admin/chatbot/stats")
+def chatbot_stats():
+    """Treff/bom i svar-cachen til chatboten (denne prosessen)"""
+    if not current_user() or current_role() != "support":
+        abort(403)
+    return jsonify({"reply_cache": get_bot().cache_stats()})
+
+
+@bp.route("/admin/activity/stats")
+def activity_stats():
+    """Kødybde og skrivetid for aktivitetsloggen (denne prosessen, se activity.py)"""
+    if not current_user() or current_role() != "support":
+        abort(403)
+    return jsonify(activity.writer.metrics())
+
+
+@bp.route("/admin/email/stats")
+def email_stats():
+    """Utboksen, e-post-senderen og sammendragsjobben (denne prosessen, se outbox.py og digest.py)"""
+    if not current_user() or current_role() != "support":
+        abort(403)
+    return jsonify(dict(outbox.sender.metrics(), digest=digest.job.stats))
+
+
+@bp.route("/admin/webhooks", methods=["GET", "POST"])
+def admin_webhooks():
+    """
+    Webhook-abonnementer, køen og de siste døde leveransene. POST oppretter et
+    abonnement (url, events[] = ticket.created/closed/assigned/rated, tom =
+    alle); hemmeligheten for signaturen vises bare i svaret på POST.
+    """
+    user = current_user()
+    if not user or current_role() != "support":
+        abort(403)
+
+    if request.method == "POST":
+        url = (request.form.get("url") or "").strip()
+        events = [e for e in request.form.getlist("events[]") if e]
+        if not url.startswith(("http://", "https://")):
+            return jsonify({"status": "error", "error": "URL må starte med http:// eller https://"}), 400
+        unknown = sorted(set(events) - set(webhooks.EVENTS))
+        if unknown:
+            return jsonify({"status": "error", "error": f"Ukjente hendelser: {', '.join(unknown)}"}), 400
+        sub = create_webhook_subscription(url, events, user)
+        log_activity(user, f"Opprettet webhook #{sub['id']} til {url}")
+        return jsonify({"status": "ok", "subscription": sub}), 201
+
+    return jsonify({
+        "subscriptions": get_webhook_subscriptions(),
+        "dead_letters": get_webhook_dead_letters(),
+        "stats": webhooks.dispatcher.metrics(),
+    })
+
+
+@bp.route("/admin/webhooks/<int:sub_id>/delete", methods=["POST"])
+def delete_webhook(sub_id: int):
+    user = current_user()
+    if not user or current_role() != "support":
+        abort(403)
+    if not delete_webhook_subscription(sub_id):
+        abort(404)
+    log_activity(user, f"Slettet webhook #{sub_id}")
+    return jsonify({"status": "ok"})
+
+
+@bp.route("/admin/webhooks/dead/<int:dead_id>/retry", methods=["POST"])
+def retry_dead_webhook(dead_id: int):
+    """Legger en død leveranse tilbake i køen (abonnementet må finnes)."""
+    if not current_user() or current_role() != "support":
+        abort(403)
+    if not requeue_webhook_dead_letter(dead_id):
+        abort(404)
+    webhooks.dispatcher.notify()
+    return jsonify({"status": "ok"})
+
+
+@bp.route("/admin/chatbot/kb", methods=["GET", "POST"])
+def chatbot_kb():
+    """
+    Versjoner av chatbotens kunnskapsbase. POST lagrer en ny versjon fra en
+    opplastet JSON-fil (kb_file) eller fra app/data/chatbot_kb.json, men bare
+    hvis boten kan bygges av den. Andre prosesser bytter innen
+    CHATBOT_KB_RELOAD_SECONDS, uten omstart.
+    """
+    user = current_user()
+    if not user or current_role() != "support":
+        abort(403)
+
+    if request.method == "POST":
+        upload = request.files.get("kb_file")
+        try:
+            kb = json.load(upload.stream) if upload and upload.filename else load_chatbot_kb_file()
+            bot = IntelligentHelpdeskAI(kb)
+        except (OSError, ValueError) as e:
+            return jsonify({"status": "error", "error": str(e)}), 400
+
+        bot.kb_version = save_chatbot_kb(kb, user)
+        _install_bot(bot)
+        log_activity(user, f"Ny versjon av chatbot-kunnskapsbasen: v{bot.kb_version}")
+
+    return jsonify({"version": get_bot().kb_version, "versions": get_chatbot_kb_versions()})
+
+
 @bp.route("/forgot-password", methods=["GET", "POST"])
 def forgot_password():
     if request.method == "POST":
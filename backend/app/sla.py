@@ -0,0 +1,232 @@
+"""
+SLA-frister for saker.
+
+Hver sak får `due_at` = opprettet + Config.SLA_* timer for prioriteten
+(settes i add_ticket og regnes ut på nytt når prioriteten endres).
+SlaTimer holder de nærmeste fristene i en min-heap og sender varsel når
+en sak nærmer seg fristen (SLA_WARNING_MINUTES før) og når den er brutt.
+
+Timeren leser aldri hele tickets-tabellen: hvert SLA_RELOAD_SECONDS henter
+den bare åpne saker med frist innenfor et kort vindu, via indeksen
+idx_tickets_sla (status, due_at). Flere worker-prosesser kan kjøre hver sin
+timer; mark_sla_notified() er en betinget UPDATE, så bare én sender varselet.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Samme format som SQLite sin datetime('now') (UTC), så strengene kan sammenlignes
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# sla_notified-nivåer
+WARNED = 1
+BREACHED = 2
+
+_PRIORITY_SLA = {
+    "kritisk": "SLA_CRITICAL",
+    "critical": "SLA_CRITICAL",
+    "høy": "SLA_HIGH",
+    "high": "SLA_HIGH",
+    "middels": "SLA_MEDIUM",
+    "medium": "SLA_MEDIUM",
+    "lav": "SLA_LOW",
+    "low": "SLA_LOW",
+}
+
+
+def sla_hours(priority: Optional[str]) -> int:
+    """Antall timer support har på seg for en prioritet (ukjent = Middels)."""
+    attr = _PRIORITY_SLA.get((priority or "").strip().lower(), "SLA_MEDIUM")
+    return int(getattr(Config, attr))
+
+
+def due_modifier(priority: Optional[str]) -> str:
+    """SQLite-modifikator for datetime(), f.eks. '+8 hours'."""
+    return f"+{sla_hours(priority)} hours"
+
+
+def utcnow() -> datetime:
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def parse_ts(value: str) -> datetime:
+    return datetime.strptime(value, TS_FORMAT)
+
+
+def format_ts(value: datetime) -> str:
+    return value.strftime(TS_FORMAT)
+
+
+def format_remaining(due_at: Optional[str], now: Optional[datetime] = None) -> str:
+    """Tid igjen til fristen som '3t 20m', eller '-1t 5m' når den er passert."""
+    if not due_at:
+        return "–"
+    seconds = int((parse_ts(due_at) - (now or utcnow())).total_seconds())
+    sign = "-" if seconds < 0 else ""
+    hours, rest = divmod(abs(seconds), 3600)
+    return f"{sign}{hours}t {rest // 60}m"
+
+
+# (fire_at, ticket_id, nivå, due_at)
+_Event = Tuple[datetime, int, int, str]
+
+
+class SlaTimer:
+    def __init__(
+        self,
+        reload_seconds: Optional[float] = None,
+        warning_minutes: Optional[float] = None,
+        clock: Callable[[], datetime] = utcnow,
+    ):
+        self.reload_interval = timedelta(seconds=reload_seconds or Config.SLA_RELOAD_SECONDS)
+        self.warning = timedelta(minutes=warning_minutes if warning_minutes is not None else Config.SLA_WARNING_MINUTES)
+        self._clock = clock
+        self._heap: List[_Event] = []
+        self._queued: Set[Tuple[int, int, str]] = set()
+        self._reload_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.stats: Dict[str, int] = {"loads": 0, "loaded": 0, "warnings": 0, "breaches": 0}
+
+    # -- heap --------------------------------------------------------------
+    def _push(self, fire_at: datetime, ticket_id: int, level: int, due_at: str) -> None:
+        key = (ticket_id, level, due_at)
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        heapq.heappush(self._heap, (fire_at, ticket_id, level, due_at))
+
+    def _load(self, now: datetime) -> None:
+        from . import db
+
+        # Hent alt som kan fyre før neste innlasting (+ varselvinduet)
+        until = now + 2 * self.reload_interval + self.warning
+        rows = db.get_sla_deadlines(format_ts(until))
+        for r in rows:
+            due = parse_ts(r["due_at"])
+            if r["sla_notified"] < WARNED:
+                self._push(due - self.warning, r["id"], WARNED, r["due_at"])
+            self._push(due, r["id"], BREACHED, r["due_at"])
+
+        self._reload_at = now + self.reload_interval
+        self.stats["loads"] += 1
+        self.stats["loaded"] += len(rows)
+
+    def reload(self) -> None:
+        """Tving ny innlasting (f.eks. etter at en frist er flyttet fram) og vekk tråden."""
+        with self._lock:
+            self._reload_at = None
+        self._wakeup.set()
+
+    def run_pending(self, now: Optional[datetime] = None) -> int:
+        """Laster inn ved behov og sender alle varsler som har forfalt. Returnerer antall sendt."""
+        now = now or self._clock()
+        due: List[_Event] = []
+        with self._lock:
+            if self._reload_at is None or now >= self._reload_at:
+                self._load(now)
+            while self._heap and self._heap[0][0] <= now:
+                event = heapq.heappop(self._heap)
+                self._queued.discard((event[1], event[2], event[3]))
+                due.append(event)
+
+        sent = 0
+        for _, ticket_id, level, due_at in due:
+            try:
+                sent += self._fire(ticket_id, level, due_at, now)
+            except Exception as e:
+                logger.error(f"SLA-varsel for sak #{ticket_id} feilet: {e}")
+        return sent
+
+    def _seconds_until_next(self, now: datetime) -> float:
+        with self._lock:
+            candidates = [t for t in (self._reload_at, self._heap[0][0] if self._heap else None) if t]
+        if not candidates:
+            return self.reload_interval.total_seconds()
+        return max(0.0, (min(candidates) - now).total_seconds())
+
+    # -- varsling ----------------------------------------------------------
+    def _fire(self, ticket_id: int, level: int, due_at: str, now: datetime) -> int:
+        from . import db
+
+        if level == WARNED and now >= parse_ts(due_at):
+            return 0  # allerede brutt – bare bruddvarselet sendes
+
+        # Betinget UPDATE: feiler hvis saken er lukket, fristen er flyttet
+        # eller en annen prosess allerede har sendt varselet
+        if not db.mark_sla_notified(ticket_id, level, due_at):
+            return 0
+
+        t = db.get_ticket(ticket_id)
+        if not t:
+            return 0
+
+        if t.get("assigned_to"):
+            recipients = [t["assigned_to"]]
+        else:
+            recipients = [u["username"] for u in db.get_support_users()]
+
+        if level == BREACHED:
+            message = f"SLA brutt: sak #{ticket_id} ({t['priority']}) skulle vært løst innen {due_at} UTC."
+            self.stats["breaches"] += 1
+        else:
+            message = f"SLA-frist nærmer seg: sak #{ticket_id} ({t['priority']}) må løses innen {due_at} UTC."
+            self.stats["warnings"] += 1
+
+        db.notify_many(recipients, message, "/tickets")
+        return 1
+
+    # -- tråd --------------------------------------------------------------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"SLA-timer feilet: {e}")
+            self._wakeup.wait(timeout=min(self._seconds_until_next(self._clock()), self.reload_interval.total_seconds()))
+            self._wakeup.clear()
+
+    def ensure_started(self) -> None:
+        # pid-sjekk: tråder overlever ikke fork (gunicorn --preload), så hver
+        # worker-prosess starter sin egen
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sla-timer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+
+timer = SlaTimer()
+
+
+def init_app(app) -> None:
+    """Starter SLA-timeren i hver worker-prosess ved første request."""
+    if not app.config.get("SLA_TIMER_ENABLED", True):
+        return
+
+    @app.before_request
+    def _start_sla_timer():
+        timer.ensure_started()
@@ -14,11 +14,26 @@
   const inputEl = document.getElementById("chatInput");
   const sendEl = document.getElementById("chatSend");
 
+  // Lenker til KB-artikler (/kb/<id>) i svaret gjøres klikkbare; resten er ren tekst
+  function appendWithLinks(el, text) {
+    const re = /\/kb\/\d+/g;
+    let last = 0, m;
+    while ((m = re.exec(text))) {
+      el.appendChild(document.createTextNode(text.slice(last, m.index)));
+      const a = document.createElement("a");
+      a.href = m[0];
+      a.textContent = m[0];
+      el.appendChild(a);
+      last = m.index + m[0].length;
+    }
+    el.appendChild(document.createTextNode(text.slice(last)));
+  }
+
   function addMsg(who, text) {
     const wrap = document.createElement("div");
     wrap.style.margin = "8px 0";
     wrap.innerHTML = `<strong>${who}:</strong> <span style="white-space:pre-wrap;"></span>`;
-    wrap.querySelector("span").textContent = text;
+    appendWithLinks(wrap.querySelector("span"), text);
     logEl.appendChild(wrap);
     logEl.scrollTop = logEl.scrollHeight;
   }
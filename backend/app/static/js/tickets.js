@@ -0,0 +1,71 @@
+// Laster vedleggslisten for en sak første gang den ekspanderes i /tickets.
+(function () {
+  const script = document.currentScript;
+  const url = script && script.dataset.attachmentsUrl;
+  if (!url) return;
+
+  function shorten(name, max) {
+    return name.length > max ? name.slice(0, max) + '...' : name;
+  }
+
+  function renderItem(att) {
+    const item = document.createElement('div');
+    item.className = 'attachment-item';
+
+    if (att.is_image) {
+      const link = document.createElement('a');
+      link.href = att.view_url;
+      link.target = '_blank';
+      const img = document.createElement('img');
+      img.src = att.view_url;
+      img.className = 'attachment-thumb';
+      img.alt = att.filename;
+      img.loading = 'lazy';
+      link.appendChild(img);
+
+      const label = document.createElement('div');
+      label.className = 'attachment-label';
+      label.textContent = shorten(att.filename, 15);
+
+      const download = document.createElement('a');
+      download.href = att.download_url;
+      download.style.fontSize = '11px';
+      download.style.color = '#60a5fa';
+      download.textContent = 'Last ned';
+
+      item.append(link, label, download);
+    } else {
+      const file = document.createElement('div');
+      file.className = 'attachment-file';
+      const link = document.createElement('a');
+      link.href = att.download_url;
+      link.textContent = shorten(att.filename, 20);
+      file.append(document.createElement('span'), link);
+      item.appendChild(file);
+    }
+    return item;
+  }
+
+  document.querySelectorAll('details.attachments-section').forEach(function (section) {
+    section.addEventListener('toggle', function () {
+      if (!section.open || section.dataset.loaded) return;
+      section.dataset.loaded = '1';
+
+      const id = section.dataset.ticketId;
+      const grid = section.querySelector('.attachments-grid');
+
+      fetch(url + '?ids=' + encodeURIComponent(id), { credentials: 'same-origin' })
+        .then(function (res) {
+          if (!res.ok) throw new Error(res.status);
+          return res.json();
+        })
+        .then(function (data) {
+          grid.replaceChildren(...(data[id] || []).map(renderItem));
+        })
+        .catch(function () {
+          delete section.dataset.loaded;
+          grid.textContent = 'Kunne ikke hente vedlegg.';
+        });
+    });
+  });
+})();
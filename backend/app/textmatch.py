@@ -0,0 +1,108 @@
+"""
+Flermønster-søk i tekst for chatboten.
+
+AhoCorasick finner alle forekomster av et sett med faste strenger i én
+gjennomgang av teksten, uansett hvor mange strenger det er. Chatboten bygger
+én automat av alle nøkkelord og fraser når den opprettes (i stedet for én
+`in`-sjekk per ord per melding).
+
+required_literals() henter ut faste strenger som må finnes i teksten for at
+et enkelt regulært uttrykk skal kunne treffe. Da kjøres re.search() bare for
+mønstre der automaten har sett en av dem.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Metategn required_literals() ikke prøver å tolke
+_UNSUPPORTED = set("\\[](){}^$+")
+
+
+class AhoCorasick:
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def add(self, needle: str, value: Any) -> None:
+        """Legger til en streng; samme streng kan ha flere verdier."""
+        if not needle:
+            raise ValueError("Tom streng kan ikke legges i automaten")
+        if self._built:
+            raise RuntimeError("Automaten er allerede bygget")
+        state = 0
+        for ch in needle:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state].append((len(needle), value))
+
+    def build(self) -> "AhoCorasick":
+        """Regner ut fail-lenkene (bredde først) og arver utdata fra dem."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """(start, slutt, verdi) for alle forekomster, også overlappende."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for length, value in out[state]:
+                    yield end - length, end, value
+
+
+def required_literals(pattern: str) -> Optional[List[str]]:
+    """
+    Én fast streng per alternativ i `pattern` som må finnes i teksten for at
+    re.search(pattern, tekst) skal treffe, eller None hvis mønsteret bruker
+    syntaks som ikke tolkes her (grupper, klasser, escapes, +, {} osv.).
+
+    Bare enkle mønstre som "timeout|time out" og "session.*utløpt" støttes:
+    tegn før * og ? er valgfrie, og . deler opp strengen.
+    """
+    if not pattern or _UNSUPPORTED & set(pattern):
+        return None
+
+    literals = []
+    for branch in pattern.split("|"):
+        runs, current = [], ""
+        for ch in branch:
+            if ch == ".":
+                runs.append(current)
+                current = ""
+            elif ch in "*?":
+                runs.append(current[:-1])
+                current = ""
+            else:
+                current += ch
+        runs.append(current)
+        best = max(runs, key=len)
+        if not best:
+            return None
+        literals.append(best)
+    return literals
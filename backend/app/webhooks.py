@@ -0,0 +1,281 @@
+"""
+Utgående webhooks for sakshendelser (opprettet, lukket, tildelt, vurdert).
+
+Der saken endres og brukerne varsles, legges det også en rad i
+webhook_deliveries per aktivt abonnement som vil ha hendelsen (emit(), og
+i samme transaksjon for bulk-endringene i db.py). Requesten venter aldri på
+mottakeren.
+
+WebhookDispatcher er én bakgrunnstråd per prosess som henter opptil
+WEBHOOK_BATCH_SIZE leveranser, grupperer dem per abonnement og sender én
+POST per endepunkt med alle hendelsene, fra en begrenset trådpool
+(WEBHOOK_WORKERS). Hver POST fullføres (slettes, prøves igjen eller
+flyttes til dead letters) så snart endepunktet har svart, og neste henting
+venter ikke på de andre: den hopper bare over abonnementer som har en POST
+underveis. Et tregt endepunkt holder dermed av én arbeider, ikke alle.
+
+Kroppen er {"deliveries": [{"id", "event", "occurred_at", "data"}, ...]},
+signert med HMAC-SHA256 over "<timestamp>.<kropp>" med abonnementets
+hemmelighet:
+
+    X-Helpdesk-Timestamp: 1700000000
+    X-Helpdesk-Signature: sha256=<hex>
+
+Mottakeren må tåle samme leveranse flere ganger (id-en er stabil).
+Feiler en POST, prøves leveransene igjen etter WEBHOOK_RETRY_SECONDS, doblet
+for hvert forsøk. 4xx (unntatt 408/429) eller WEBHOOK_MAX_ATTEMPTS forsøk
+flytter dem til webhook_dead_letters, der support kan legge dem tilbake.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ("ticket.created", "ticket.closed", "ticket.assigned", "ticket.rated")
+
+# HTTP-statuser som kan gå bra ved et nytt forsøk; andre 4xx gis opp med en gang
+_RETRYABLE_CLIENT_ERRORS = {408, 429}
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    mac = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256)
+    return "sha256=" + mac.hexdigest()
+
+
+def emit(event: str, data: Dict[str, Any]) -> int:
+    """Legger hendelsen i køen for alle abonnenter. Feil logges; requesten skal ikke feile av dette."""
+    from . import db
+
+    try:
+        created = db.enqueue_webhook_events([(event, data)])
+    except Exception as e:
+        logger.error(f"Kunne ikke legge webhook-hendelse {event} i køen: {e}")
+        return 0
+    if created:
+        dispatcher.notify()
+    return created
+
+
+class WebhookDispatcher:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_seconds: Optional[float] = None,
+        retry_seconds: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.workers = workers or Config.WEBHOOK_WORKERS
+        self.batch_size = batch_size or Config.WEBHOOK_BATCH_SIZE
+        self.poll_interval = poll_seconds if poll_seconds is not None else Config.WEBHOOK_POLL_SECONDS
+        self.retry_seconds = retry_seconds if retry_seconds is not None else Config.WEBHOOK_RETRY_SECONDS
+        self.timeout = timeout or Config.WEBHOOK_TIMEOUT
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._in_flight: Set[int] = set()  # abonnementer med en POST underveis
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.stats: Dict[str, Any] = {
+            "delivered": 0, "requests": 0, "failed_requests": 0, "retried": 0, "dead": 0,
+            "batches": 0, "last_request_ms": 0.0, "max_request_ms": 0.0,
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        from . import db
+
+        with self._lock:
+            stats = dict(self.stats, in_flight=len(self._in_flight))
+        return dict(stats, workers=self.workers, queue=db.get_webhook_queue_stats())
+
+    def _count(self, **deltas: float) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # Ny pool etter fork, som trådene
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="webhook")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    # -- levering ----------------------------------------------------------
+    def _submit(self) -> Tuple[int, List[Future]]:
+        """
+        Henter en batch for abonnementer uten POST underveis og legger én
+        POST per endepunkt i poolen. Returnerer (antall hentet, futures).
+        """
+        from . import db
+
+        with self._lock:
+            busy = sorted(self._in_flight)
+        rows = db.claim_webhook_deliveries(self.batch_size, Config.WEBHOOK_LEASE_SECONDS, exclude_subscriptions=busy)
+        if not rows:
+            return 0, []
+
+        rows.sort(key=lambda r: r["subscription_id"])
+        groups = [list(g) for _, g in groupby(rows, key=lambda r: r["subscription_id"])]
+        with self._lock:
+            self._in_flight.update(g[0]["subscription_id"] for g in groups)
+            self.stats["batches"] += 1
+        pool = self._executor()
+        return len(rows), [pool.submit(self._deliver, group) for group in groups]
+
+    def _deliver(self, group: List[Dict[str, Any]]) -> None:
+        """Sender én POST og fullfører leveransene med en gang endepunktet har svart."""
+        from . import db
+
+        start = time.perf_counter()
+        try:
+            error, permanent = self._post(group)
+            if error is None:
+                db.complete_webhook_deliveries([r["id"] for r in group])
+                self._count(delivered=len(group))
+            else:
+                self._failed(group, error, permanent)
+        except Exception as e:
+            # Leveransene sendes på nytt når leasen går ut
+            logger.error(f"Webhook-leveringen til {group[0]['url']} feilet: {e}")
+        finally:
+            elapsed = round((time.perf_counter() - start) * 1000, 3)
+            with self._lock:
+                self._in_flight.discard(group[0]["subscription_id"])
+                self.stats["requests"] += 1
+                self.stats["last_request_ms"] = elapsed
+                self.stats["max_request_ms"] = max(self.stats["max_request_ms"], elapsed)
+            self._wakeup.set()  # abonnementet kan hentes igjen
+
+    def run_once(self) -> int:
+        """Sender én batch og venter til alle endepunktene har svart. Returnerer antall leveranser som ble hentet."""
+        claimed, futures = self._submit()
+        for future in as_completed(futures):
+            future.result()
+        return claimed
+
+    def run_pending(self) -> int:
+        """Sender til køen ikke har flere leveranser som kan sendes nå. Returnerer antall levert."""
+        before = self.stats["delivered"]
+        while self.run_once():
+            pass
+        return self.stats["delivered"] - before
+
+    def _post(self, group: List[Dict[str, Any]]) -> Tuple[Optional[str], bool]:
+        """Sender én POST. Returnerer (feil, permanent); (None, False) når mottakeren svarte 2xx."""
+        body = json.dumps({
+            "deliveries": [
+                {"id": r["id"], "event": r["event"], "occurred_at": r["created_at"], "data": r["payload"]}
+                for r in group
+            ]
+        }).encode()
+        timestamp = str(int(time.time()))
+        request = urllib.request.Request(
+            group[0]["url"],
+            data=body,
+            method="POST",
+            headers={
+                "Content-Type": "application/json",
+                "User-Agent": "helpdesk-webhooks",
+                "X-Helpdesk-Timestamp": timestamp,
+                "X-Helpdesk-Signature": sign(group[0]["secret"], timestamp, body),
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            return None, False
+        except urllib.error.HTTPError as e:
+            permanent = 400 <= e.code < 500 and e.code not in _RETRYABLE_CLIENT_ERRORS
+            return f"HTTP {e.code}", permanent
+        except Exception as e:
+            return str(getattr(e, "reason", e)), False
+
+    def _failed(self, group: List[Dict[str, Any]], error: str, permanent: bool) -> None:
+        from . import db
+
+        self._count(failed_requests=1)
+        logger.warning(f"Webhook til {group[0]['url']} feilet ({error}), {len(group)} leveranser")
+        dead = {r["id"] for r in group if permanent or r["attempts"] + 1 >= Config.WEBHOOK_MAX_ATTEMPTS}
+        if dead:
+            db.dead_letter_webhook_deliveries(sorted(dead), error)
+            self._count(dead=len(dead))
+
+        retry = sorted((r for r in group if r["id"] not in dead), key=lambda r: r["attempts"])
+        for attempts, rows in groupby(retry, key=lambda r: r["attempts"]):
+            delay = min(self.retry_seconds * 2 ** attempts, Config.WEBHOOK_RETRY_MAX_SECONDS)
+            ids = [r["id"] for r in rows]
+            db.retry_webhook_deliveries(ids, error, delay)
+            self._count(retried=len(ids))
+
+    # -- tråd --------------------------------------------------------------
+    def _run(self) -> None:
+        # Venter ikke på POST-ene: neste henting skjer med en gang, og når
+        # alle arbeiderne er opptatt, til en av dem er ferdig (_wakeup)
+        while not self._stop.is_set():
+            with self._lock:
+                busy = len(self._in_flight) >= self.workers
+            claimed = 0
+            if not busy:
+                try:
+                    claimed, _ = self._submit()
+                except Exception as e:
+                    logger.error(f"Webhook-leveringen feilet: {e}")
+            if claimed:
+                continue
+            self._wakeup.wait(timeout=self.poll_interval)
+            self._wakeup.clear()
+
+    def ensure_started(self) -> None:
+        # pid-sjekk som i SlaTimer: tråder overlever ikke fork
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="webhook-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+dispatcher = WebhookDispatcher()
+
+
+def init_app(app) -> None:
+    """Starter webhook-leveringen i hver worker-prosess ved første request."""
+    if not app.config.get("WEBHOOKS_ENABLED", True):
+        return
+
+    @app.before_request
+    def _start_webhook_dispatcher():
+        dispatcher.ensure_started()
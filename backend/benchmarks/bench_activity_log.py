@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: aktivitetsloggen med og uten write-behind (activity.py).
+
+Kjør fra backend/:
+    python benchmarks/bench_activity_log.py --threads 8 --entries 2000
+
+Flere tråder logger samtidig, som requests i en worker. Direkte skriving
+gir én commit per rad og kø på skrivelåsen; write-behind legger raden i en
+kø og skriver i batch fra én tråd.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import activity, db  # noqa: E402
+from app.config import Config  # noqa: E402
+
+
+def run(threads: int, entries: int) -> list:
+    timings = []
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        local = []
+        for i in range(entries):
+            t0 = time.perf_counter()
+            db.log_activity(f"user{n}", f"Handling {i}")
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            timings.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--entries", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    for label, write_behind in (("direkte", False), ("write-behind", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = Path(tmp) / "bench.db"
+            db.init_db()
+            Config.ACTIVITY_WRITE_BEHIND = write_behind
+            activity.writer = activity.ActivityWriter()
+
+            start = time.perf_counter()
+            timings = run(args.threads, args.entries)
+            activity.writer.stop()
+            elapsed = time.perf_counter() - start
+
+            total = args.threads * args.entries
+            timings.sort()
+            p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+            print(f"{label}: {total / elapsed:.0f} rader/s, per kall p50 {statistics.median(timings):.3f} ms, "
+                  f"p99 {p99:.3f} ms, {activity.writer.stats['flushes']} commits")
+            assert len(db.get_activity(limit=total)) == total
+
+
+if __name__ == "__main__":
+    main()
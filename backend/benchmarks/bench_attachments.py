@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: samme vedlegg lagt ved mange saker, flat lagring mot blobstore.py.
+
+Kjør fra backend/:
+    python benchmarks/bench_attachments.py --tickets 50 --size-kb 2048
+
+Under et driftsavbrudd legges samme skjermbilde eller logg ved mange saker.
+"Flat" er den gamle save_upload: én ny ticket_<id>_<uuid>.<ext> per
+opplasting. Med blobstore lagres innholdet én gang; senere opplastinger av
+samme fil koster én SHA-256 og ingen skriving. Måler tid per opplasting og
+hvor mye som ligger på disk etterpå.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import blobstore, db  # noqa: E402
+from app.config import Config  # noqa: E402
+
+
+def disk_usage(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(folder) for f in files)
+
+
+def report(label: str, timings: list, folder: str) -> None:
+    print(
+        f"{label:<10} per opplasting p50 {statistics.median(timings):7.3f} ms, "
+        f"maks {max(timings):7.3f} ms | {disk_usage(folder) / 1024 / 1024:8.1f} MiB på disk"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=50)
+    parser.add_argument("--size-kb", type=int, default=2048)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    content = os.urandom(args.size_kb * 1024)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        ids = [db.add_ticket("kari", f"Nettet er nede {i}", "d", "Nettverk", "Høy", "") for i in range(args.tickets)]
+
+        # Flat: slik save_upload gjorde det før (FileStorage.save til nytt navn)
+        Config.UPLOAD_FOLDER = os.path.join(tmp, "flat")
+        os.makedirs(Config.UPLOAD_FOLDER)
+        timings = []
+        for ticket_id in ids:
+            stream = io.BytesIO(content)
+            t0 = time.perf_counter()
+            stored = f"ticket_{ticket_id}_{uuid.uuid4().hex}.png"
+            with open(os.path.join(Config.UPLOAD_FOLDER, stored), "wb") as out:
+                out.write(stream.read())
+            db.add_attachment(ticket_id, stored, "skjerm.png", "kari")
+            timings.append((time.perf_counter() - t0) * 1000)
+        report("flat", timings, Config.UPLOAD_FOLDER)
+
+        Config.UPLOAD_FOLDER = os.path.join(tmp, "blobs")
+        timings = []
+        for ticket_id in ids:
+            stream = io.BytesIO(content)
+            t0 = time.perf_counter()
+            blobstore.save(stream, ticket_id, "skjerm.png", "kari")
+            timings.append((time.perf_counter() - t0) * 1000)
+        report("blobstore", timings, Config.UPLOAD_FOLDER)
+        print(f"første opplasting {timings[0]:.3f} ms, deretter p50 {statistics.median(timings[1:]):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk-lukking/-tildeling/-prioritet/-sletting av mange saker,
+én sak om gangen (gammel løkke i routes.py) mot én transaksjon med executemany.
+
+Kjør fra backend/:
+    python benchmarks/bench_bulk_tickets.py --tickets 10000
+
+Løkken kjøres bare for lukking (den dominerende kostnaden er én commit per
+sak); de andre operasjonene måles bare i bulk-varianten.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db  # noqa: E402
+
+
+def seed(n_tickets: int) -> list[int]:
+    conn = db._conn()
+    conn.execute("DELETE FROM tickets")
+    conn.execute("DELETE FROM notifications")
+    conn.execute("DELETE FROM activity")
+    conn.executemany(
+        "INSERT INTO tickets (title, desc, owner, category, priority, device) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"Sak {i}", "Beskrivelse", f"bench_user{i % 50}", "Annet", "Middels", "PC") for i in range(n_tickets)],
+    )
+    conn.commit()
+    ids = [r[0] for r in conn.execute("SELECT id FROM tickets ORDER BY id")]
+    conn.close()
+    return ids
+
+
+def close_one_by_one(ids: list[int]) -> int:
+    # Slik bulk_close_tickets gjorde det før: close + varsel + logg per sak
+    for tid in ids:
+        t = db.get_ticket(tid)
+        db.close_ticket(tid)
+        db.log_activity("bench_support", f"Lukket sak #{tid}")
+        db.add_notification(t["owner"], f"Sak #{tid} ble lukket av support (bench_support).", "/tickets")
+    return len(ids)
+
+
+def timed(fn, *args) -> tuple[int, float]:
+    start = time.perf_counter()
+    count = fn(*args)
+    return count, (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=10_000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        conn = db._conn()
+        conn.executemany(
+            "INSERT INTO users (username, pw_hash) VALUES (?, 'x')",
+            [(f"bench_user{i}",) for i in range(50)],
+        )
+        conn.commit()
+        conn.close()
+
+        print(f"{args.tickets} saker")
+        print(f"{'operasjon':<28}{'rader':>8}{'ms':>12}{'saker/s':>12}")
+
+        def report(label: str, count: int, ms: float) -> None:
+            print(f"{label:<28}{count:>8}{ms:>12.1f}{count / (ms / 1000):>12.0f}")
+
+        ids = seed(args.tickets)
+        report("lukk, én om gangen", *timed(close_one_by_one, ids))
+
+        ids = seed(args.tickets)
+        report("close_tickets", *timed(db.close_tickets, ids, "bench_support", "/tickets"))
+        report("assign_tickets", *timed(db.assign_tickets, ids, "bench_support", "bench_support", "/tickets"))
+        report("update_tickets_priority", *timed(db.update_tickets_priority, ids, "Høy", "bench_support"))
+        report("delete_tickets", *timed(db.delete_tickets, ids, "bench_support"))
+
+
+if __name__ == "__main__":
+    main()
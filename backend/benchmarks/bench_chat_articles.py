@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: artikkelforslag i chatboten (db.suggest_articles) med mange artikler.
+
+Kjør fra backend/:
+    python benchmarks/bench_chat_articles.py --articles 50000 --messages 500
+
+Chatmeldinger er fritekst med mange vanlige ord. Uten budsjettet for
+dokumentfrekvens (max_candidates) må bm25 regnes ut for nesten hele
+kunnskapsbasen; --max-candidates 0 viser tiden uten budsjett.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db  # noqa: E402
+from app.routes import IntelligentHelpdeskAI  # noqa: E402
+from bench_kb_search import FILLER, seed  # noqa: E402
+
+MESSAGES = [
+    "feide passord virker ikke etter oppdatering",
+    "skriveren skriver ut blanke ark, toner er byttet",
+    "får ikke koblet til wifi eduroam på mac",
+    "teams lyd forsvinner når jeg deler skjerm",
+    "vpn kobler fra hele tiden på windows pc",
+    "onedrive deling av mappe gir ikke tilgang",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=50_000)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--max-candidates", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    rng = random.Random(42)
+    max_candidates = args.max_candidates or 10 ** 9
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        start = time.perf_counter()
+        seed(args.articles, rng)
+        print(f"{args.articles} artikler indeksert på {time.perf_counter() - start:.1f} s")
+
+        # Meldingene får også noen vanlige fyllord, som ekte fritekst
+        messages = [f"{m} {' '.join(rng.sample(FILLER[:20], 3))}" for m in MESSAGES]
+        bot = IntelligentHelpdeskAI()
+
+        timings, empty = [], 0
+        for i in range(args.messages):
+            words = messages[i % len(messages)].split()
+            t0 = time.perf_counter()
+            found = db.suggest_articles(words, limit=3, max_candidates=max_candidates)
+            timings.append((time.perf_counter() - t0) * 1000)
+            empty += not found
+
+        reply_timings = []
+        for i in range(min(args.messages, 200)):
+            t0 = time.perf_counter()
+            bot.process_message(messages[i % len(messages)])
+            reply_timings.append((time.perf_counter() - t0) * 1000)
+
+        for label, values in (("suggest_articles", timings), ("process_message", reply_timings)):
+            values.sort()
+            p99 = values[max(0, int(len(values) * 0.99) - 1)]
+            print(f"{label}: {len(values)} kall, snitt {statistics.mean(values):.2f} ms, "
+                  f"p50 {statistics.median(values):.2f} ms, p99 {p99:.2f} ms")
+        print(f"uten forslag: {empty}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chatbot-svar med og uten svar-cachen (IntelligentHelpdeskAI.respond).
+
+Kjør fra backend/:
+    python benchmarks/bench_chat_reply_cache.py --articles 2000 --messages 5000
+
+Meldingene trekkes Zipf-fordelt fra et lite sett vanlige spørsmål, som i ekte
+chattrafikk. Uten cache kjøres hele analysen og sanitize_chat_reply hver gang.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db  # noqa: E402
+from app.routes import IntelligentHelpdeskAI, sanitize_chat_reply  # noqa: E402
+from bench_kb_search import seed  # noqa: E402
+
+QUESTIONS = [
+    "glemt passord", "får ikke nett", "Får ikke nett", "wifi virker ikke", "skriveren skriver ikke ut",
+    "kommer ikke inn på feide", "teams krasjer", "outlook synker ikke", "passord utløpt",
+    "eduroam virker ikke på mac", "chrome laster ikke nettsider", "onedrive synker ikke",
+    "glemt passord, haster", "papirstopp i skriveren", "kontoen er låst", "fortsatt samme problem",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        seed(args.articles, rng)
+        bot = IntelligentHelpdeskAI()
+
+        weights = [1 / (i + 1) for i in range(len(QUESTIONS))]
+        messages = rng.choices(QUESTIONS, weights, k=args.messages)
+
+        uncached, cached = [], []
+        for msg in messages:
+            t0 = time.perf_counter()
+            reply, _ = bot.process_message(msg)
+            sanitize_chat_reply(reply)
+            uncached.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            bot.respond(msg)
+            cached.append((time.perf_counter() - t0) * 1000)
+
+        for label, timings in (("uten cache", uncached), ("med cache", cached)):
+            timings.sort()
+            p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+            print(f"{label}: snitt {statistics.mean(timings):.3f} ms, "
+                  f"p50 {statistics.median(timings):.3f} ms, p99 {p99:.3f} ms")
+        print(f"cache: {bot.cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Treffsikkerhet og hastighet for chatboten (IntelligentHelpdeskAI.process_message).
+
+Kjør fra backend/:
+    python benchmarks/bench_chatbot_eval.py
+    python benchmarks/bench_chatbot_eval.py --update-baseline   # etter en bevisst endring
+
+Korpuset (chatbot_corpus.json) har merkede meldinger på norsk og engelsk og
+samtaler over flere meldinger. For hver melding sammenlignes emnet boten
+setter (last_topic) og om svaret sender brukeren videre til support med
+fasiten. Deretter måles meldinger/s og p50/p99 per kall.
+
+Skriptet avslutter med kode 1 hvis treffsikkerheten er lavere enn i
+baseline-filen, eller hvis boten er mer enn --max-slowdown tregere. Hastighet
+varierer mellom maskiner, så baseline bør lages på maskinen som sjekker.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db  # noqa: E402
+from app.routes import IntelligentHelpdeskAI  # noqa: E402
+
+HERE = Path(__file__).resolve().parent
+CORPUS = HERE / "chatbot_corpus.json"
+BASELINE = HERE / "chatbot_baseline.json"
+
+
+def load_corpus(path: Path) -> List[Dict[str, Any]]:
+    """Alle samtaler; en enkeltmelding er en samtale med én melding."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    conversations = [{"lang": m["lang"], "turns": [m]} for m in data["messages"]]
+    return conversations + data["conversations"]
+
+
+def is_escalation(bot: IntelligentHelpdeskAI, reply: str) -> bool:
+    header = bot._generate_escalation_message("unknown", {}).split("\n")[0]
+    return reply == bot._generate_human_escalation_message() or reply.startswith(header)
+
+
+def evaluate(bot: IntelligentHelpdeskAI, conversations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    topic_ok: Dict[str, List[bool]] = defaultdict(list)
+    escalation_ok: List[bool] = []
+    errors = []
+
+    for conv in conversations:
+        state = None
+        for turn in conv["turns"]:
+            reply, state = bot.process_message(turn["message"], state)
+            topic = state.get("last_topic") or "unknown"
+            escalated = is_escalation(bot, reply)
+            topic_ok[conv["lang"]].append(topic == turn["topic"])
+            escalation_ok.append(escalated == turn["escalate"])
+            if topic != turn["topic"] or escalated != turn["escalate"]:
+                errors.append((turn["message"], turn["topic"], topic, turn["escalate"], escalated))
+
+    every = [ok for results in topic_ok.values() for ok in results]
+    return {
+        "messages": len(every),
+        "topic_accuracy": sum(every) / len(every),
+        "topic_accuracy_by_lang": {lang: sum(r) / len(r) for lang, r in sorted(topic_ok.items())},
+        "escalation_accuracy": sum(escalation_ok) / len(escalation_ok),
+        "errors": errors,
+    }
+
+
+def measure(bot: IntelligentHelpdeskAI, conversations: List[Dict[str, Any]], rounds: int) -> Dict[str, float]:
+    timings = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for conv in conversations:
+            state = None
+            for turn in conv["turns"]:
+                t0 = time.perf_counter()
+                _, state = bot.process_message(turn["message"], state)
+                timings.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    return {
+        "messages_per_sec": len(timings) / elapsed,
+        "p50_ms": statistics.median(timings),
+        "p99_ms": timings[max(0, int(len(timings) * 0.99) - 1)],
+    }
+
+
+def check(result: Dict[str, Any], baseline: Dict[str, Any], max_slowdown: float) -> List[str]:
+    failures = []
+    for key in ("topic_accuracy", "escalation_accuracy"):
+        if result[key] < baseline[key] - 1e-9:
+            failures.append(f"{key} {result[key]:.3f} < baseline {baseline[key]:.3f}")
+    floor = baseline["messages_per_sec"] * (1 - max_slowdown)
+    if result["messages_per_sec"] < floor:
+        failures.append(f"messages_per_sec {result['messages_per_sec']:.0f} < {floor:.0f} "
+                        f"(baseline {baseline['messages_per_sec']:.0f} - {max_slowdown:.0%})")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--rounds", type=int, default=50, help="ganger korpuset kjøres for tidsmålingen")
+    parser.add_argument("--max-slowdown", type=float, default=0.3, help="tillatt nedgang i meldinger/s (0.3 = 30 %%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("-v", "--verbose", action="store_true", help="vis meldingene som får feil svar")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    conversations = load_corpus(args.corpus)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Svarene slår opp KB-artikler; tom database så det ikke påvirker tidene
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        bot = IntelligentHelpdeskAI()
+        quality = evaluate(bot, conversations)
+        speed = measure(bot, conversations, args.rounds)
+
+    result = {
+        "topic_accuracy": quality["topic_accuracy"],
+        "escalation_accuracy": quality["escalation_accuracy"],
+        **speed,
+    }
+    by_lang = ", ".join(f"{lang} {acc:.1%}" for lang, acc in quality["topic_accuracy_by_lang"].items())
+    print(f"{quality['messages']} meldinger i {len(conversations)} samtaler")
+    print(f"emne: {quality['topic_accuracy']:.1%} ({by_lang})")
+    print(f"eskalering: {quality['escalation_accuracy']:.1%}")
+    print(f"{speed['messages_per_sec']:.0f} meldinger/s, p50 {speed['p50_ms']:.3f} ms, p99 {speed['p99_ms']:.3f} ms")
+
+    if args.verbose:
+        for message, want, got, want_esc, got_esc in quality["errors"]:
+            print(f"  {message!r}: emne {got} (fasit {want}), eskalering {got_esc} (fasit {want_esc})")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"baseline skrevet til {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"fant ikke {args.baseline}; kjør med --update-baseline først")
+        sys.exit(1)
+    failures = check(result, json.loads(args.baseline.read_text()), args.max_slowdown)
+    for failure in failures:
+        print(f"REGRESJON: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
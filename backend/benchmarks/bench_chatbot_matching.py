@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: klassifisering av chatmeldinger med Aho-Corasick (én gjennomgang
+av meldingen) mot de gamle `in`-sjekkene og nøkkelord × ord-løkken.
+
+Kjør fra backend/:
+    python benchmarks/bench_chatbot_matching.py --messages 5000
+
+Den gamle varianten ligger her (NaiveMatching) så resultatene kan sjekkes
+mot hverandre; skriptet feiler hvis de ikke er identiske.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.routes import IntelligentHelpdeskAI  # noqa: E402
+
+MESSAGES = [
+    'Jeg får ikke logget meg inn på Feide, det står "session expired"',
+    "wifi virker ikke på macbook, har prøvd å starte på nytt",
+    "Skriveren svarer ikke, papirstopp igjen!! haster, har eksamen om en time",
+    "glemt passord og kontoen er låst etter flere forsøk",
+    "Teams krasjer når jeg deler skjerm i møte, mikrofon virker heller ikke",
+    "chrome laster ikke nettsider, ERR_NAME_NOT_RESOLVED på alle sider jeg prøver",
+    "hei",
+    "forstår ikke hvordan jeg skal koble til eduroam på iphone",
+    "har prøvd å restartet og tømt cache, fortsatt samme feil",
+    "Onedrive synker ikke på windows laptop etter oppdateringen i går",
+]
+
+
+class NaiveMatching(IntelligentHelpdeskAI):
+    """Slik klassifiseringen var før: én `in`-sjekk per ord og re.search per mønster."""
+
+    def _analyze_sentiment(self, text: str, hits=None) -> Dict:
+        text_lower = text.lower()
+        sentiment = {"urgency": "normal", "emotion": "neutral", "frustration_level": 0}
+        if any(word in text_lower for word in self.conversation_patterns["urgency"]["high"]):
+            sentiment["urgency"] = "high"
+        frustrated_words = [w for w in self.conversation_patterns["urgency"]["frustrated"] if w in text_lower]
+        if frustrated_words:
+            sentiment["emotion"] = "frustrated"
+            sentiment["frustration_level"] = len(frustrated_words)
+        if any(word in text_lower for word in self.conversation_patterns["urgency"]["confused"]):
+            sentiment["emotion"] = "confused"
+        return sentiment
+
+    def _extract_entities(self, text: str, hits=None) -> Dict:
+        entities = {"os": None, "browser": None, "application": None, "device": None,
+                    "error_message": None, "actions_tried": []}
+        text_lower = text.lower()
+        for key, mapping in (("os", self.OS_MAP), ("browser", self.BROWSER_MAP), ("application", self.APP_MAP)):
+            for name, keywords in mapping.items():
+                if any(k in text_lower for k in keywords):
+                    entities[key] = name
+                    break
+        for pattern in (r'"([^"]+)"', r'feilmelding[:\s]+([^\n\.]+)', r'får[:\s]+([^\n\.]+)', r'sier[:\s]+([^\n\.]+)'):
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                entities["error_message"] = match.group(1).strip()
+                break
+        entities["actions_tried"] = [k for k in self.ACTION_KEYWORDS if k in text_lower]
+        return entities
+
+    def _classify_topic(self, text: str, entities: Dict, hits=None) -> Tuple[str, float]:
+        text_lower = text.lower()
+        scores = {}
+        words = [w for w in text_lower.split() if w not in self.NOISE_WORDS and len(w) > 2]
+        for topic, data in self.knowledge_base.items():
+            score = 0
+            for keyword in data["keywords"]:
+                if keyword in text_lower:
+                    score += 3
+            for phrase in data["natural_phrases"]:
+                if phrase in text_lower:
+                    score += 5
+            for keyword in data["keywords"]:
+                if any(keyword in word or word in keyword for word in words):
+                    score += 1
+            if topic == "m365" and entities.get("application"):
+                score += 4
+            if topic == "nettleser" and entities.get("browser"):
+                score += 4
+            for error_pattern, _ in data.get("error_patterns", []):
+                if re.search(error_pattern, text_lower):
+                    score += 6
+            if score > 0:
+                scores[topic] = score
+        if not scores:
+            return "unknown", 0.0
+        best_topic = max(scores.items(), key=lambda x: x[1])
+        return best_topic[0], min(best_topic[1] / 10.0, 1.0)
+
+
+def classify(bot: IntelligentHelpdeskAI, msg: str):
+    if isinstance(bot, NaiveMatching):
+        sentiment = bot._analyze_sentiment(msg)
+        entities = bot._extract_entities(msg)
+        return sentiment, entities, bot._classify_topic(msg, entities)
+    hits = bot._scan(msg.lower())
+    sentiment = bot._analyze_sentiment(msg, hits)
+    entities = bot._extract_entities(msg, hits)
+    return sentiment, entities, bot._classify_topic(msg, entities, hits)
+
+
+def run(bot: IntelligentHelpdeskAI, messages: list[str]) -> list[float]:
+    timings = []
+    for msg in messages:
+        t0 = time.perf_counter()
+        classify(bot, msg)
+        timings.append((time.perf_counter() - t0) * 1e6)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+    messages = [rng.choice(MESSAGES) for _ in range(args.messages)]
+
+    new, old = IntelligentHelpdeskAI(), NaiveMatching()
+    mismatches = [m for m in MESSAGES if classify(new, m) != classify(old, m)]
+    if mismatches:
+        sys.exit(f"Ulike resultater for: {mismatches}")
+
+    print(f"{args.messages} meldinger")
+    results = {}
+    for label, bot in (("in-sjekker (før)", old), ("Aho-Corasick", new)):
+        timings = sorted(run(bot, messages))
+        results[label] = statistics.mean(timings)
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        print(f"{label:<20}snitt {results[label]:7.1f} µs  p50 {statistics.median(timings):7.1f} µs  p99 {p99:7.1f} µs")
+    print(f"speedup: {results['in-sjekker (før)'] / results['Aho-Corasick']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
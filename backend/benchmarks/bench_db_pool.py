@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tilkoblinger og responstid per /tickets-request, med og uten pool.
+
+Kjør fra backend/:
+    python benchmarks/bench_db_pool.py --tickets 500 --requests 50
+
+Pool size 0 tilsvarer gammel oppførsel (ny sqlite3.connect per db-kall).
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import create_app, db, db_pool  # noqa: E402
+
+
+def seed(n_tickets: int) -> None:
+    db.init_db()
+    db.create_user("bench_support", "x", role="support")
+    db.create_user("bench_user", "x", role="user")
+    conn = db._conn()
+    conn.executemany(
+        "INSERT INTO tickets (title, desc, owner, category, priority, device) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"Sak {i}", "Beskrivelse", "bench_user", "Annet", "Middels", "PC") for i in range(n_tickets)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(pool_size: int, n_requests: int, db_path: Path) -> dict:
+    db.Config.DB_POOL_SIZE = pool_size
+    db_pool._pools.pop(str(db_path), None)
+
+    app = create_app()
+    app.config.update(TESTING=True, SECRET_KEY="bench")
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = "bench_support"
+        sess["role"] = "support"
+
+    client.get("/tickets")  # oppvarming
+    before = db_pool.pool_stats(db_path)
+
+    timings = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        res = client.get("/tickets")
+        timings.append((time.perf_counter() - start) * 1000)
+        assert res.status_code == 200
+
+    after = db_pool.pool_stats(db_path)
+    return {
+        "connects_per_request": (after["connects"] - before["connects"]) / n_requests,
+        "db_calls_per_request": (after["checkouts"] - before["checkouts"]) / n_requests,
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": statistics.median(timings),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        seed(args.tickets)
+
+        print(f"/tickets med {args.tickets} saker, {args.requests} requests")
+        print(f"{'modus':<16}{'connects/req':>14}{'db-kall/req':>13}{'snitt ms':>10}{'p50 ms':>10}")
+        for label, size in (("uten pool", 0), ("pool", 8)):
+            r = run(size, args.requests, db.DB_PATH)
+            print(
+                f"{label:<16}{r['connects_per_request']:>14.1f}{r['db_calls_per_request']:>13.1f}"
+                f"{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
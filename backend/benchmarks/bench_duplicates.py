@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: oppslag etter nesten like saker (MinHash + LSH, se app/dedup.py)
+med mange åpne saker i indeksen.
+
+Kjør fra backend/:
+    python benchmarks/bench_duplicates.py --tickets 20000 --queries 1000
+
+Måler signaturberegning for den nye saken, oppslaget i LSH-bøttene (ingen
+I/O) og hele find_similar() inkludert databasesjekken av kandidatene.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db, dedup  # noqa: E402
+
+TOPIC_WORDS = (
+    "wifi nett eduroam feide passord skriver toner teams outlook vpn mac pc skjerm "
+    "lyd kamera lisens office onedrive mappe tilgang tastatur mus lader batteri "
+    "rom etasje møte lunsj morgen krasjer treg virker fungerer logge inn kobler"
+).split()
+SYLLABLES = "ba be bi bo ka ke ki ko la le li lo ma me mi mo na ne ni no ra re ri ro sa se si so ta te ti to".split()
+
+
+def vocabulary(rng: random.Random, n: int) -> list[str]:
+    # Tilfeldige ord (2–4 stavelser) som fylltekst, så ikke alt deler trigrammer
+    return ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(n)]
+
+
+def report(label: str, timings: list[float]) -> None:
+    timings.sort()
+    p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+    print(f"{label:<22}snitt {statistics.mean(timings):7.3f} ms  "
+          f"p50 {statistics.median(timings):7.3f} ms  p99 {p99:7.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    rng = random.Random(42)
+
+    filler = vocabulary(rng, 5000)
+    weights = [1 / (i + 1) for i in range(len(filler))]  # Zipf-aktig fordeling
+
+    def text() -> tuple[str, str]:
+        title = " ".join(rng.sample(TOPIC_WORDS, 2) + rng.choices(filler, weights, k=2))
+        desc = " ".join(rng.choices(filler, weights, k=rng.randint(8, 30)) + rng.sample(TOPIC_WORDS, 2))
+        return title, desc
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+
+        tickets = [text() for _ in range(args.tickets)]
+        conn = db._conn()
+        conn.executemany(
+            "INSERT INTO tickets (title, desc, owner, status) VALUES (?, ?, 'bench', 'Åpen')",
+            tickets,
+        )
+        conn.commit()
+        conn.close()
+
+        start = time.perf_counter()
+        dedup.index.sync()  # regner ut og lagrer signaturer for alle åpne saker
+        print(f"{len(dedup.index)} åpne saker indeksert på {time.perf_counter() - start:.1f} s")
+
+        sig_ms, lookup_ms, full_ms, hits = [], [], [], 0
+        for i in range(args.queries):
+            # Halvparten er nesten-kopier av en eksisterende sak
+            if i % 2:
+                title, desc = rng.choice(tickets)
+                title = title.upper() + "!!"
+            else:
+                title, desc = text()
+
+            t0 = time.perf_counter()
+            sig = dedup.signature(title, desc)
+            t1 = time.perf_counter()
+            dedup.index.candidates(sig)
+            t2 = time.perf_counter()
+            hits += bool(dedup.index.find_similar(sig))
+            t3 = time.perf_counter()
+            sig_ms.append((t1 - t0) * 1000)
+            lookup_ms.append((t2 - t1) * 1000)
+            full_ms.append((t3 - t2) * 1000)
+
+        report("signatur", sig_ms)
+        report("LSH-oppslag", lookup_ms)
+        report("find_similar", full_ms)
+        print(f"{hits} av {args.queries} innsendinger fikk forslag")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark: e-postsammendrag (digest.py) for en travel periode.
+
+Kjør fra backend/:
+    python benchmarks/bench_email_digest.py --users 200 --events 100
+
+Hver hendelse varsler alle brukerne (som "Ny sak opprettet" til hele
+support-teamet). Én e-post per varsel ville gitt users × events e-poster;
+med sammendrag blir det én per bruker. Måler tiden notify_many() bruker
+(nå også med digest_items) og tiden jobben bruker på å lage sammendragene.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db, digest  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--events", type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        names = [f"support{i}" for i in range(args.users)]
+        for name in names:
+            db.create_user(name, "x", role="support", email=f"{name}@skole.no")
+            db.update_preferences(name, 1, 1, email_digest="immediate")
+
+        timings = []
+        for i in range(args.events):
+            t0 = time.perf_counter()
+            db.notify_many(names, f"Ny sak opprettet av bruker{i}: Printer virker ikke", f"/tickets/{i}")
+            timings.append((time.perf_counter() - t0) * 1000)
+
+        job = digest.DigestJob()
+        t0 = time.perf_counter()
+        emails = job.run_pending()
+        elapsed = time.perf_counter() - t0
+
+    print(f"notify_many til {args.users} brukere: p50 {statistics.median(timings):.3f} ms, maks {max(timings):.3f} ms")
+    print(
+        f"{args.users * args.events} varsler -> {emails} e-poster "
+        f"(uten sammendrag: {args.users * args.events}); jobben brukte {elapsed * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: e-post sendt direkte (én SMTP-økt per melding) mot utboksen (outbox.py).
+
+Kjør fra backend/:
+    python benchmarks/bench_email_outbox.py --emails 200 --connect-ms 20
+
+SMTP-serveren er stubben fra tests/conftest.py på localhost, med
+--connect-ms forsinkelse før hilsenen (som TCP + TLS mot en ekte server).
+"Direkte" er det gamle mail.send() per e-post, slik tickets() gjorde det.
+For utboksen måles både tiden requesten bruker (enqueue) og hvor lang tid
+senderen bruker på å tømme utboksen.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import create_app, db, email_service, outbox  # noqa: E402
+from app.config import Config  # noqa: E402
+from tests.conftest import SmtpStub  # noqa: E402
+
+
+def report(label: str, timings: list, total: float, emails: int) -> None:
+    timings.sort()
+    print(
+        f"{label:<18} per kall p50 {statistics.median(timings):7.3f} ms, "
+        f"p99 {timings[int(len(timings) * 0.99) - 1]:7.3f} ms | "
+        f"{emails / total:7.0f} e-poster/s levert"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--connect-ms", type=float, default=20)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    smtp = SmtpStub()
+    smtp.connect_delay = args.connect_ms / 1000
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+
+    Config.EMAIL_OUTBOX_ENABLED = False
+    Config.SLA_TIMER_ENABLED = False
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        app = create_app()
+        state = app.extensions["mail"]
+        state.server, state.port, state.use_tls = "127.0.0.1", smtp.server_address[1], False
+
+        # Direkte: mail.send() åpner og lukker en tilkobling per e-post
+        timings = []
+        start = time.perf_counter()
+        with app.app_context():
+            for i in range(args.emails):
+                t0 = time.perf_counter()
+                email_service.mail.send(email_service.Message(subject="Emne", recipients=[f"u{i}@skole.no"], body="Hei"))
+                timings.append((time.perf_counter() - t0) * 1000)
+        report("direkte", timings, time.perf_counter() - start, args.emails)
+        direct_connections = smtp.connections
+
+        # Utboks: requesten legger bare en rad i tabellen
+        sender = outbox.OutboxSender(app=app, workers=args.workers, batch_size=args.batch, poll_seconds=0.05)
+        timings = []
+        start = time.perf_counter()
+        for i in range(args.emails):
+            t0 = time.perf_counter()
+            email_service.send_email("Emne", "Hei", f"u{i}@skole.no", app=app)
+            timings.append((time.perf_counter() - t0) * 1000)
+        enqueued = time.perf_counter()
+        sender.ensure_started()
+        sender.notify()
+        while db.get_email_outbox_stats()["pending"]:
+            time.sleep(0.005)
+        sender.stop()
+        report("utboks (enqueue)", timings, time.perf_counter() - start, args.emails)
+        drain = time.perf_counter() - enqueued
+
+    metrics = sender.metrics()
+    print(
+        f"utboksen tømt på {drain * 1000:.0f} ms: {metrics['sent']} sendt over "
+        f"{smtp.connections - direct_connections} tilkoblinger (direkte: {direct_connections}), "
+        f"{metrics['messages_per_sec']:.0f} e-poster/s i senderen"
+    )
+    smtp.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: søk i kunnskapsbasen (FTS5 + bm25) med mange artikler.
+
+Kjør fra backend/:
+    python benchmarks/bench_kb_search.py --articles 50000 --queries 500
+
+Målet er enkeltsifret antall millisekunder per søk (p99) ved 50k artikler.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db  # noqa: E402
+
+# Syntetisk korpus som ligner en ekte kunnskapsbase: hver artikkel handler om
+# ett av mange emner (med egne nøkkelord) og har ellers vanlig fylltekst.
+FILLER = [f"ord{i}" for i in range(5000)]
+TOPIC_WORDS = (
+    "feide passord innlogging wifi eduroam nettverk skriver toner papir utskrift "
+    "teams outlook epost konto mfa app mobil pc mac windows oppdatering vpn "
+    "lisens office onedrive deling mappe tilgang kamera lyd skjerm tastatur "
+    "batteri lader brannmur virus sikkerhet kryptering backup gjenoppretting"
+).split()
+QUERIES = ["feide mfa", "passord", "wifi eduroam", "skri", '"toner papir"', "vpn mac", "teams lyd", "batt"]
+
+
+def seed(n_articles: int, rng: random.Random) -> None:
+    db.init_db()
+    topics = [rng.sample(TOPIC_WORDS, 3) + [f"emne{i}"] for i in range(400)]
+    weights = [1 / (i + 1) for i in range(len(FILLER))]  # Zipf-aktig fordeling
+
+    conn = db._conn()
+    batch = []
+    for i in range(n_articles):
+        topic = topics[i % len(topics)]
+        title = " ".join(topic[:2] + rng.choices(FILLER, weights, k=2)).capitalize()
+        body = rng.choices(FILLER, weights, k=rng.randint(60, 200)) + topic * rng.randint(1, 3)
+        rng.shuffle(body)
+        batch.append((title, " ".join(body), "bench"))
+        if len(batch) == 5000:
+            conn.executemany("INSERT INTO articles (title, content, author) VALUES (?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO articles (title, content, author) VALUES (?, ?, ?)", batch)
+    conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        start = time.perf_counter()
+        seed(args.articles, rng)
+        print(f"{args.articles} artikler indeksert på {time.perf_counter() - start:.1f} s")
+
+        db.search_articles("feide")  # oppvarming
+        first, second = [], []
+        for i in range(args.queries):
+            q = QUERIES[i % len(QUERIES)]
+            t0 = time.perf_counter()
+            page = db.search_articles(q)
+            first.append((time.perf_counter() - t0) * 1000)
+            if page["next"]:
+                t0 = time.perf_counter()
+                db.search_articles(q, after=page["next"])
+                second.append((time.perf_counter() - t0) * 1000)
+
+        for label, timings in (("side 1", first), ("side 2", second)):
+            timings.sort()
+            p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+            print(f"{label}: {len(timings)} søk, snitt {statistics.mean(timings):.2f} ms, "
+                  f"p50 {statistics.median(timings):.2f} ms, p99 {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: varsler til support under en hendelsestopp, med og uten sammenslåing.
+
+Kjør fra backend/:
+    python benchmarks/bench_notification_burst.py --support 25 --events 2000
+
+Hver ny sak varsler hele support-teamet ("Ny sak opprettet av ..."). Uten
+`kind` blir det én rad per bruker og sak; med kind="ticket_created" slås
+uleste varsler innenfor NOTIFICATION_COALESCE_MINUTES sammen til én rad.
+Måler notify_many(), antall rader og første side av /notifications.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db  # noqa: E402
+
+
+def run(support: int, events: int, kind) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        names = [f"support{i}" for i in range(support)]
+        for name in names:
+            db.create_user(name, "x", role="support")
+
+        timings = []
+        for i in range(events):
+            t0 = time.perf_counter()
+            db.notify_many(names, f"Ny sak opprettet av bruker{i}: Nettet er nede", f"/tickets/{i}", kind=kind)
+            timings.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        for _ in range(100):
+            db.get_notifications_page("support0")
+        page_ms = (time.perf_counter() - t0) * 10
+
+        conn = db._conn()
+        rows = conn.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
+        conn.close()
+        unread = db.count_notifications("support0")
+
+    label = "sammenslått" if kind else "én rad per sak"
+    print(
+        f"{label:<15} notify_many p50 {statistics.median(timings):.3f} ms | "
+        f"{rows} rader, {unread} uleste for support0 | første side {page_ms:.3f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--support", type=int, default=25)
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    run(args.support, args.events, None)
+    run(args.support, args.events, "ticket_created")
+
+
+if __name__ == "__main__":
+    main()
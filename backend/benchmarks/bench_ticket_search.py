@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fulltekstsøk i saker (tickets_fts) for support, med og uten
+status-/prioritetsfilter, mot LIKE '%...%' på tittel og beskrivelse.
+
+Kjør fra backend/:
+    python benchmarks/bench_ticket_search.py --tickets 500000 --queries 200
+
+LIKE-varianten må lese hele tickets-tabellen for hvert søk; FTS-varianten
+leser treffene nyeste først og stopper etter én side.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db  # noqa: E402
+
+FILLER = [f"ord{i}" for i in range(5000)]
+TOPIC_WORDS = (
+    "skriver toner papirstopp vpn wifi eduroam feide passord innlogging teams outlook "
+    "epost mfa mobil laptop skjerm tastatur mus lader batteri lisens office onedrive "
+    "tilgang mappe kamera lyd oppdatering treg krasj blåskjerm"
+).split()
+QUERIES = [
+    ("skriver", {}),
+    ("vpn mac", {}),
+    ("passo", {}),
+    ('"toner papirstopp"', {}),
+    ("blåskjerm", {"status": "Åpen"}),
+    ("feide", {"priority": "Kritisk"}),
+    ("lyd kamera", {"status": "Åpen", "priority": "Høy"}),
+]
+PRIORITIES = ["Lav", "Middels", "Middels", "Høy", "Kritisk"]
+DEVICES = ["PC", "Mac", "Laptop", "Mobil", "Skriver"]
+
+
+def seed(n_tickets: int, rng: random.Random) -> None:
+    db.init_db()
+    weights = [1 / (i + 1) for i in range(len(FILLER))]  # Zipf-aktig fordeling
+
+    conn = db._conn()
+    batch = []
+    for i in range(n_tickets):
+        topic = rng.sample(TOPIC_WORDS, 2)
+        title = " ".join(topic + rng.choices(FILLER, weights, k=2)).capitalize()
+        desc = " ".join(rng.choices(FILLER, weights, k=rng.randint(15, 60)) + topic)
+        status = "Lukket" if rng.random() < 0.8 else "Åpen"
+        batch.append((title, desc, f"bench_user{i % 500}", "Annet", rng.choice(PRIORITIES), rng.choice(DEVICES), status))
+        if len(batch) == 10_000:
+            conn.executemany(
+                "INSERT INTO tickets (title, desc, owner, category, priority, device, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO tickets (title, desc, owner, category, priority, device, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+    conn.execute("INSERT INTO tickets_fts (tickets_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+
+def like_search(text: str) -> list:
+    # Slik et naivt søk ville sett ut uten FTS-indeksen
+    conn = db._conn()
+    pattern = f"%{text.strip(chr(34))}%"
+    rows = conn.execute(
+        "SELECT * FROM tickets WHERE title LIKE ? OR desc LIKE ? ORDER BY id DESC LIMIT ?",
+        (pattern, pattern, db.PAGE_SIZE),
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def report(label: str, timings: list[float]) -> None:
+    timings.sort()
+    p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+    print(f"{label:<18}{len(timings):>6} søk  snitt {statistics.mean(timings):8.2f} ms  "
+          f"p50 {statistics.median(timings):8.2f} ms  p99 {p99:8.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--like-queries", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        start = time.perf_counter()
+        seed(args.tickets, rng)
+        print(f"{args.tickets} saker indeksert på {time.perf_counter() - start:.1f} s")
+
+        db.search_tickets("skriver")  # oppvarming
+        first, second = [], []
+        for i in range(args.queries):
+            q, filters = QUERIES[i % len(QUERIES)]
+            t0 = time.perf_counter()
+            page = db.search_tickets(q, **filters)
+            first.append((time.perf_counter() - t0) * 1000)
+            if page["next"] is not None:
+                t0 = time.perf_counter()
+                db.search_tickets(q, after=page["next"], **filters)
+                second.append((time.perf_counter() - t0) * 1000)
+
+        like = []
+        for i in range(args.like_queries):
+            t0 = time.perf_counter()
+            like_search(QUERIES[i % len(QUERIES)][0])
+            like.append((time.perf_counter() - t0) * 1000)
+
+        report("FTS side 1", first)
+        report("FTS side 2", second)
+        report("LIKE side 1", like)
+
+
+if __name__ == "__main__":
+    main()
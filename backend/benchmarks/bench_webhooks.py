@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: webhooks sendt direkte fra requesten mot køen (webhooks.py).
+
+Kjør fra backend/:
+    python benchmarks/bench_webhooks.py --events 500 --endpoints 5 --latency-ms 20
+
+Mottakerne er HTTP-stubben fra tests/conftest.py på localhost, med
+--latency-ms forsinkelse før svaret. "Direkte" er én signert POST per
+hendelse og abonnent inne i requesten. Med køen måles tiden emit() bruker
+(det requesten venter på) og hvor lang tid dispatcheren bruker på å tømme
+køen med én POST per endepunkt og batch.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import db, webhooks  # noqa: E402
+from tests.conftest import HttpStub  # noqa: E402
+
+
+def report(label: str, timings: list, total: float, deliveries: int, requests: int) -> None:
+    timings.sort()
+    print(
+        f"{label:<8} per hendelse p50 {statistics.median(timings):8.3f} ms, "
+        f"p99 {timings[int(len(timings) * 0.99) - 1]:8.3f} ms | "
+        f"{deliveries / total:7.0f} leveranser/s, {requests} POST-er"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--endpoints", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    servers = []
+    for _ in range(args.endpoints):
+        server = HttpStub()
+        server.delay = args.latency_ms / 1000
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        subs = [db.create_webhook_subscription(s.url, [], "admin") for s in servers]
+        payloads = [{"ticket_id": i, "title": f"Sak {i}", "actor": "admin"} for i in range(args.events)]
+
+        # Direkte: requesten poster til hver abonnent før den svarer
+        direct = webhooks.WebhookDispatcher(timeout=10)
+        timings = []
+        start = time.perf_counter()
+        for i, data in enumerate(payloads):
+            t0 = time.perf_counter()
+            for sub in subs:
+                row = {**sub, "subscription_id": sub["id"], "id": i, "event": "ticket.closed",
+                       "created_at": "", "payload": data}
+                direct._post([row])
+            timings.append((time.perf_counter() - t0) * 1000)
+        report("direkte", timings, time.perf_counter() - start, args.events * len(subs), args.events * len(subs))
+
+        # Kø: emit() i requesten, dispatcheren sender i bakgrunnen
+        dispatcher = webhooks.WebhookDispatcher(workers=args.workers, batch_size=args.batch, timeout=10)
+        webhooks.dispatcher = dispatcher
+        timings = []
+        start = time.perf_counter()
+        for data in payloads:
+            t0 = time.perf_counter()
+            webhooks.emit("ticket.closed", data)
+            timings.append((time.perf_counter() - t0) * 1000)
+        delivered = dispatcher.run_pending()
+        report("kø", timings, time.perf_counter() - start, delivered, dispatcher.stats["requests"])
+        dispatcher.stop()
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
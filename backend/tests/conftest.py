@@ -0,0 +1,173 @@
+import json
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import create_app  # noqa: E402
+from app import activity, db, dedup, routes  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Egen database per test, så helpdesk.db i repoet aldri blir rørt
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "helpdesk.db")
+    monkeypatch.setattr(db.Config, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    db._unread_cache.clear()
+    dedup.index.clear()
+    # Boten lastes på nytt fra test-databasen (kunnskapsbasen har versjoner der)
+    monkeypatch.setattr(routes, "_bot_instance", None)
+    # SLA-timeren startes ikke i bakgrunnen; testene kaller run_pending() selv
+    monkeypatch.setattr(db.Config, "SLA_TIMER_ENABLED", False)
+    # Det samme gjelder e-post-senderen (outbox.py), sammendragene (digest.py)
+    # og webhook-leveringen (webhooks.py)
+    monkeypatch.setattr(db.Config, "EMAIL_OUTBOX_ENABLED", False)
+    monkeypatch.setattr(db.Config, "DIGEST_TIMER_ENABLED", False)
+    monkeypatch.setattr(db.Config, "WEBHOOKS_ENABLED", False)
+
+    # create_app() kjører migreringene mot test-databasen
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True, SECRET_KEY="test")
+    yield flask_app
+    # Aktivitetsrader i køen skrives til denne testens database
+    activity.writer.flush()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        time.sleep(server.connect_delay)
+        if server.down:
+            self._reply("421 Tjenesten er nede")
+            return
+        self._reply("220 smtp-stub")
+        mail_from, rcpts = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip()
+            verb = cmd[:4].upper()
+            if verb in ("EHLO", "HELO", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "MAIL":
+                mail_from, rcpts = cmd[10:].strip("<> "), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                addr = cmd[8:].strip("<> ")
+                if addr in server.refuse:
+                    self._reply(f"{server.refuse[addr]} Mottaker avvist")
+                else:
+                    rcpts.append(addr)
+                    self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 Send data")
+                data = []
+                for raw in self.rfile:
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw)
+                server.messages.append((mail_from, rcpts, b"".join(data).decode()))
+                self._reply("250 OK")
+            elif verb == "RSET":
+                mail_from, rcpts = None, []
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Ha det")
+                return
+            else:
+                self._reply("500 Ukjent kommando")
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    """Minimal SMTP-server på localhost som tar vare på e-postene den mottar."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.messages = []
+        self.connections = 0
+        self.refuse = {}  # adresse -> SMTP-kode for RCPT
+        self.down = False  # svarer 421 ved tilkobling
+        self.connect_delay = 0.0  # sekunder før hilsenen (treg server / TLS-oppsett)
+
+
+@pytest.fixture
+def smtp_server(app, monkeypatch):
+    server = SmtpStub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state = app.extensions["mail"]
+    monkeypatch.setattr(state, "server", "127.0.0.1")
+    monkeypatch.setattr(state, "port", server.server_address[1])
+    monkeypatch.setattr(state, "use_tls", False)
+    monkeypatch.setattr(state, "suppress", False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(server.delay)
+        with server.lock:
+            status = server.statuses.pop(0) if server.statuses else 200
+            server.requests.append({
+                "path": self.path, "headers": dict(self.headers), "raw": body, "json": json.loads(body or b"null"),
+            })
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpStub(ThreadingHTTPServer):
+    """HTTP-server på localhost som tar vare på POST-ene den får og svarer med `statuses` (ellers 200)."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _HttpHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.statuses = []
+        self.delay = 0.0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+@pytest.fixture
+def http_server():
+    servers = []
+
+    def start():
+        server = HttpStub()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,87 @@
+from app import activity, db
+
+
+def _rows():
+    conn = db._conn()
+    rows = conn.execute("SELECT user, details, created_at FROM activity ORDER BY id").fetchall()
+    conn.close()
+    return [tuple(r) for r in rows]
+
+
+def test_entries_are_written_in_one_batch(app):
+    writer = activity.ActivityWriter(flush_ms=60_000, batch_size=100)
+    try:
+        for i in range(5):
+            writer.log("kari", f"Handling {i}")
+        assert _rows() == [] and writer.depth == 5
+
+        assert writer.flush() == 5
+        rows = _rows()
+        assert [r[1] for r in rows] == [f"Handling {i}" for i in range(5)]
+        assert all(r[2] for r in rows)  # tidspunktet fra da aktiviteten skjedde
+        assert writer.metrics()["flushes"] == 1 and writer.metrics()["depth"] == 0
+    finally:
+        writer.stop()
+
+
+def test_full_batch_wakes_writer_thread(app):
+    writer = activity.ActivityWriter(flush_ms=60_000, batch_size=3)
+    try:
+        for i in range(3):
+            writer.log("kari", f"Handling {i}")
+        writer._thread.join(timeout=0.5)  # tråden skriver uten å vente på intervallet
+        assert len(_rows()) == 3
+    finally:
+        writer.stop()
+
+
+def test_full_queue_writes_directly_and_stop_flushes(app):
+    writer = activity.ActivityWriter(flush_ms=60_000, batch_size=100, maxsize=2)
+    for i in range(3):
+        writer.log("ola", f"Handling {i}")
+    assert writer.stats["overflow"] == 1
+    assert [r[1] for r in _rows()] == ["Handling 2"]
+
+    writer.stop()
+    assert len(_rows()) == 3 and writer.depth == 0
+
+
+def test_failed_flush_is_retried(app, monkeypatch):
+    writer = activity.ActivityWriter(flush_ms=60_000)
+    writer.log("kari", "Innlogget")
+
+    def locked(rows):
+        raise RuntimeError("database is locked")
+
+    insert_activity = db.insert_activity
+    monkeypatch.setattr(db, "insert_activity", locked)
+    assert writer.flush() == 0
+    assert writer.stats["errors"] == 1 and writer.depth == 1
+
+    monkeypatch.setattr(db, "insert_activity", insert_activity)
+    writer.stop()
+    assert [r[1] for r in _rows()] == ["Innlogget"]
+
+
+def test_activity_is_visible_to_own_process(app, client):
+    with client.session_transaction() as sess:
+        sess["user"] = "kari"
+        sess["role"] = "user"
+    client.post("/chat", json={"message": "glemt passord"})
+
+    assert db.get_activity()[0]["details"].startswith("Chat: glemt passord")
+
+
+def test_deleting_user_keeps_queued_activity(app, client):
+    # delete_user_db sletter bare brukeren; historikken i activity beholdes,
+    # også rader som fortsatt lå i køen da brukeren ble slettet
+    db.create_user("ola", "x")
+    db.log_activity("ola", "Opprettet sak #1")
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "support"
+    client.post("/admin/users/ola/delete")
+
+    assert db.get_user("ola") is None
+    details = [(a["user"], a["details"]) for a in db.get_activity(limit=10)]
+    assert ("ola", "Opprettet sak #1") in details and ("admin", "Slettet bruker ola") in details
@@ -0,0 +1,107 @@
+import hashlib
+import io
+import os
+
+from app import blobstore, db
+from app.config import Config
+
+SCREENSHOT = b"\x89PNG\r\n" + b"skjermbilde av feilmeldingen " * 5000
+
+
+def _login(client, user, role):
+    with client.session_transaction() as sess:
+        sess["user"] = user
+        sess["role"] = role
+
+
+def _upload(client, ticket_id, content=SCREENSHOT, name="skjerm.png"):
+    return client.post(
+        f"/tickets/{ticket_id}/upload",
+        data={"file": (io.BytesIO(content), name)},
+        content_type="multipart/form-data",
+    )
+
+
+def _blob(sha):
+    conn = db._conn()
+    row = conn.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def _files():
+    root = os.path.join(Config.UPLOAD_FOLDER, blobstore.BLOB_DIR)
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, fs in os.walk(root) for f in fs)
+
+
+def test_same_file_is_stored_once(app, client, monkeypatch):
+    writes = []
+    write = blobstore._write
+    monkeypatch.setattr(blobstore, "_write", lambda stream, path: (writes.append(path), write(stream, path)))
+    ids = [db.add_ticket("kari", f"Nettet er nede {i}", "d", "Nettverk", "Høy", "") for i in range(3)]
+
+    _login(client, "kari", "user")
+    for ticket_id in ids:
+        _upload(client, ticket_id)
+
+    sha = hashlib.sha256(SCREENSHOT).hexdigest()
+    assert _files() == [os.path.join(sha[:2], sha[2:4], sha)]
+    assert len(writes) == 1
+    assert _blob(sha)["refcount"] == 3 and _blob(sha)["size"] == len(SCREENSHOT)
+
+    atts = [db.get_attachments(t)[0] for t in ids]
+    assert {a["stored_filename"] for a in atts} == {f"blobs/{sha[:2]}/{sha[2:4]}/{sha}"}
+    res = client.get(f"/attachments/{atts[1]['id']}/download")
+    assert res.data == SCREENSHOT
+    assert "skjerm.png" in res.headers["Content-Disposition"]
+    assert client.get(f"/attachments/{atts[2]['id']}/view").mimetype == "image/png"
+
+
+def test_deleting_tickets_releases_blobs(app, client):
+    a, b, c = (db.add_ticket("kari", f"Sak {i}", "d", "Annet", "Middels", "") for i in range(3))
+    _login(client, "kari", "user")
+    _upload(client, a)
+    _upload(client, b)
+    _upload(client, c, b"annen logg", "feil.log")
+    shared = hashlib.sha256(SCREENSHOT).hexdigest()
+    log = hashlib.sha256(b"annen logg").hexdigest()
+
+    _login(client, "admin", "support")
+    client.post(f"/tickets/{a}/delete")
+    assert _blob(shared)["refcount"] == 1
+    assert len(_files()) == 2  # b bruker fortsatt skjermbildet
+
+    client.post("/admin/tickets/bulk-delete", data={"ticket_ids[]": [str(b), str(c)]})
+    assert _blob(shared) is None and _blob(log) is None
+    assert _files() == []
+
+
+def test_blob_removed_during_upload_is_written_again(app, client, monkeypatch):
+    ticket_id = db.add_ticket("kari", "Sak", "d", "Annet", "Middels", "")
+    blobstore.save(io.BytesIO(SCREENSHOT), ticket_id, "skjerm.png", "kari")
+    db.delete_ticket_db(ticket_id)  # bloben står igjen med refcount 0
+
+    # collect_garbage() kjører mellom store() og add_attachment()
+    add_attachment = db.add_attachment
+    monkeypatch.setattr(db, "add_attachment", lambda *a, **kw: (blobstore.collect_garbage(), add_attachment(*a, **kw))[1])
+    ticket_id = db.add_ticket("kari", "Sak 2", "d", "Annet", "Middels", "")
+    blobstore.save(io.BytesIO(SCREENSHOT), ticket_id, "skjerm.png", "kari")
+
+    sha = hashlib.sha256(SCREENSHOT).hexdigest()
+    assert _blob(sha)["refcount"] == 1
+    with open(blobstore.blob_path(sha), "rb") as f:
+        assert f.read() == SCREENSHOT
+
+
+def test_old_attachments_are_still_served(app, client):
+    ticket_id = db.add_ticket("kari", "Sak", "d", "Annet", "Middels", "")
+    os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+    with open(os.path.join(Config.UPLOAD_FOLDER, f"ticket_{ticket_id}_abc.txt"), "wb") as f:
+        f.write(b"gammel fil")
+    att_id = db.add_attachment(ticket_id, f"ticket_{ticket_id}_abc.txt", "notat.txt", "kari")
+
+    _login(client, "kari", "user")
+    assert client.get(f"/attachments/{att_id}/download").data == b"gammel fil"
+    _login(client, "admin", "support")
+    client.post(f"/tickets/{ticket_id}/delete")
+    assert db.get_attachment(att_id) is None
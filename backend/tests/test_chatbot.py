@@ -0,0 +1,202 @@
+import io
+import json
+import random
+
+import pytest
+
+from app import db, routes
+from app.routes import IntelligentHelpdeskAI, sanitize_chat_reply
+from app.textmatch import AhoCorasick, required_literals
+
+# Fasit fra klassifiseringen før Aho-Corasick (samme svar, også særhetene:
+# "nå" i "når" gir høy hast, "får" i "får ikke" regnes som feilmelding osv.)
+CLASSIFIED = [
+    ('Jeg får ikke logget meg inn på Feide, det står "session expired"', "feide", 1.0, "normal", "neutral", None, None),
+    ("wifi virker ikke på macbook", "wifi", 0.9, "normal", "neutral", "macos", None),
+    ("Skriveren svarer ikke, papirstopp igjen!! haster", "utskrift", 1.0, "high", "neutral", None, None),
+    ("glemt passord, kontoen er låst", "passord", 1.0, "normal", "neutral", None, None),
+    ("Teams krasjer når jeg deler skjerm i møte om 5 min", "m365", 1.0, "high", "neutral", None, "Teams"),
+    ("chrome laster ikke nettsider, ERR_NAME_NOT_RESOLVED", "nettleser", 1.0, "normal", "neutral", None, None),
+    ("hei", "unknown", 0.0, "normal", "neutral", None, None),
+    ("forstår ikke hvordan jeg skal koble til eduroam på iphone", "unknown", 0.0, "normal", "confused", "ios", None),
+    ("har prøvd å restartet og tømt cache, fortsatt samme feil", "nettleser", 0.6, "high", "neutral", None, None),
+    ("Onedrive synker ikke på windows laptop", "m365", 1.0, "normal", "neutral", "windows", "OneDrive"),
+]
+
+
+@pytest.fixture(scope="module")
+def bot():
+    return IntelligentHelpdeskAI()
+
+
+@pytest.mark.parametrize("msg,topic,confidence,urgency,emotion,os_name,application", CLASSIFIED)
+def test_classification_matches_reference(bot, msg, topic, confidence, urgency, emotion, os_name, application):
+    sentiment = bot._analyze_sentiment(msg)
+    entities = bot._extract_entities(msg)
+    assert bot._classify_topic(msg, entities) == (topic, confidence)
+    assert (sentiment["urgency"], sentiment["emotion"]) == (urgency, emotion)
+    assert (entities["os"], entities["application"]) == (os_name, application)
+
+
+def test_keyword_word_overlap_both_directions(bot):
+    # "skriveren" inneholder nøkkelordet "skriver"; "nett" er en del av "nettverk"
+    hits = bot._scan("skriveren nett")
+    assert ("utskrift", bot.knowledge_base["utskrift"]["keywords"].index("skriver")) in hits["kw_word"]
+    assert ("wifi", bot.knowledge_base["wifi"]["keywords"].index("nettverk")) in hits["kw_word"]
+    # Støyord og korte ord teller ikke
+    assert not bot._scan("på er og")["kw_word"]
+
+
+def test_reply_links_related_articles_once(app, bot):
+    vpn = db.create_article("VPN fra hjemmekontor", "Installer VPN-klienten og logg inn med Feide.", "admin")
+    db.create_article("Skriver", "Bytt toner.", "admin")
+
+    reply, state = bot.process_message("vpn-klienten kobler ikke til hjemmefra")
+    assert f"/kb/{vpn}" in reply
+    assert state["suggested_articles"] == [vpn]
+
+    # Samme artikkel foreslås ikke to ganger i samme samtale
+    reply, state = bot.process_message("vpn virker fortsatt ikke", state)
+    assert f"/kb/{vpn}" not in reply
+    assert state["suggested_articles"] == [vpn]
+
+
+def test_aho_corasick_overlapping_matches():
+    ac = AhoCorasick()
+    for word in ("he", "she", "hers", "ikke nett", "nett"):
+        ac.add(word, word)
+    found = [(start, end, value) for start, end, value in ac.finditer("ushers får ikke nett")]
+    assert found == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers"), (11, 20, "ikke nett"), (16, 20, "nett")]
+
+
+def test_required_literals():
+    assert required_literals("timeout|time out|tidsavbrudd") == ["timeout", "time out", "tidsavbrudd"]
+    assert required_literals("begrensa.*tilkobling|begrenset") == ["tilkobling", "begrenset"]
+    assert required_literals(r"err_\d+") is None
+    assert required_literals("(a|b)c") is None
+
+
+def _login(client, user, role="user"):
+    with client.session_transaction() as sess:
+        sess["user"] = user
+        sess["role"] = role
+
+
+def _cookie(client):
+    return client.get_cookie("session").value
+
+
+def test_conversation_is_stored_server_side(app, client):
+    _login(client, "ola")
+    client.post("/chat", json={"message": "wifi virker ikke på macbook"})
+    cookie = _cookie(client)
+    with client.session_transaction() as sess:
+        assert set(sess) == {"user", "role", "chat_id"}
+
+    # Tilstanden følger samtalen, men cookien endres ikke
+    data = client.post("/chat", json={"message": "fortsatt samme problem"}).get_json()
+    assert data["message_count"] == 2 and data["topic"] == "wifi"
+    assert _cookie(client) == cookie
+
+    # En annen bruker kan ikke overta samtalen med samme id
+    other = app.test_client()
+    _login(other, "kari")
+    with client.session_transaction() as sess:
+        chat_id = sess["chat_id"]
+    with other.session_transaction() as sess:
+        sess["chat_id"] = chat_id
+    assert other.post("/chat", json={"message": "hei"}).get_json()["message_count"] == 1
+
+    # Hele samtalen er lagret for support
+    assert client.get("/admin/chats/ola").status_code == 403
+    support = app.test_client()
+    _login(support, "support1", role="support")
+    [conversation] = support.get("/admin/chats/ola").get_json()["conversations"]
+    messages = [(m["sender"], m["message"]) for m in conversation["messages"]]
+    assert messages[0] == ("user", "wifi virker ikke på macbook")
+    assert [sender for sender, _ in messages] == ["user", "bot", "user", "bot"]
+
+    # Ny samtale etter reset
+    client.post("/chat/reset")
+    assert client.post("/chat", json={"message": "hei"}).get_json()["message_count"] == 1
+
+
+def test_reply_cache_keeps_replies_and_state_identical(app):
+    bot = IntelligentHelpdeskAI()
+    messages = ["Glemt passord", "fortsatt  samme problem", "Wifi virker ikke, har restartet", "takk, det virket!"]
+
+    replies = []
+    for _ in range(2):
+        state, cached_state = None, None
+        for i, msg in enumerate(messages):
+            random.seed(i)  # samme tilfeldige åpning i begge
+            reply, state = bot.process_message(msg, state)
+            random.seed(i)
+            cached, cached_state = bot.respond(msg, cached_state)
+            assert cached == sanitize_chat_reply(reply)
+            assert cached_state == state
+            replies.append(cached)
+
+    assert replies[:4] == replies[4:]
+    assert bot.cache_stats() == {"hits": 4, "misses": 4, "size": 4}
+
+    # Samme melding med annen tilstand (antall meldinger) er et eget oppslag
+    bot.respond("glemt   PASSORD", {**bot.new_conversation_state(), "message_count": 2})
+    assert bot.cache_stats()["misses"] == 5
+
+
+def test_reply_cache_keeps_line_breaks_in_message(app):
+    bot = IntelligentHelpdeskAI()
+    msg = "Jeg får feilmelding: Tilgang nektet\nHar prøvd å starte på nytt"
+
+    random.seed(0)
+    reply, state = bot.process_message(msg)
+    random.seed(0)
+    cached, cached_state = bot.respond(msg)
+    assert cached == sanitize_chat_reply(reply) and cached_state == state
+    assert state["context_entities"]["error_message"] == "Tilgang nektet"
+
+    # Samme ord på én linje gir en annen feilmelding, og treffer ikke cachen
+    _, one_line = bot.respond(" ".join(msg.split()))
+    assert one_line["context_entities"]["error_message"] == "Tilgang nektet Har prøvd å starte på nytt"
+    assert bot.respond(msg)[1]["context_entities"]["error_message"] == "Tilgang nektet"
+    assert bot.cache_stats() == {"hits": 1, "misses": 2, "size": 2}
+
+
+def test_reply_cache_keeps_openers_random(app):
+    bot = IntelligentHelpdeskAI()
+    openers = {bot.respond("Skriveren svarer ikke, haster")[0].split("\n")[0] for _ in range(60)}
+    assert openers == {sanitize_chat_reply(o) for o in bot.URGENCY_OPENERS}
+    assert bot.cache_stats()["misses"] == 1
+
+
+def test_knowledge_base_hot_reload(app, client):
+    bot = routes.get_bot()
+    assert bot.kb_version == 1
+    _login(client, "support1", role="support")
+
+    kb = routes.load_chatbot_kb_file()
+    kb["topics"]["vpn"] = {
+        **kb["topics"]["wifi"],
+        "keywords": ["vpn", "anyconnect"],
+        "natural_phrases": ["vpn kobler fra"],
+        "error_patterns": [],
+    }
+
+    # Ugyldig innhold avvises, og gjeldende versjon beholdes
+    broken = {**kb, "topics": {"vpn": {**kb["topics"]["vpn"], "error_patterns": [["(", "x"]]}}}
+    res = client.post("/admin/chatbot/kb", data={"kb_file": (io.BytesIO(json.dumps(broken).encode()), "kb.json")})
+    assert res.status_code == 400 and "vpn.error_patterns[0]" in res.get_json()["error"]
+    broken["topics"]["vpn"]["error_patterns"] = 3
+    res = client.post("/admin/chatbot/kb", data={"kb_file": (io.BytesIO(json.dumps(broken).encode()), "kb.json")})
+    assert res.status_code == 400 and "vpn.error_patterns" in res.get_json()["error"]
+    assert routes.get_bot() is bot
+
+    res = client.post("/admin/chatbot/kb", data={"kb_file": (io.BytesIO(json.dumps(kb).encode()), "kb.json")})
+    assert res.get_json()["version"] == 2
+    assert routes.get_bot()._classify_topic("anyconnect henger", {})[0] == "vpn"
+
+    # En annen prosess bytter når den ser etter ny versjon
+    routes._install_bot(bot)
+    routes._bot_checked_at = 0
+    assert routes.get_bot().kb_version == 2
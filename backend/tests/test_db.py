@@ -0,0 +1,322 @@
+import sqlite3
+
+import pytest
+
+from app import activity, db, db_pool, migrations
+
+
+def test_one_connection_per_request(app, client):
+    before = db_pool.pool_stats(db.DB_PATH)
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "support"
+
+    res = client.get("/tickets")
+    assert res.status_code == 200
+
+    after = db_pool.pool_stats(db.DB_PATH)
+    assert after["checkouts"] - before["checkouts"] > 1
+    assert after["acquires"] - before["acquires"] == 1
+
+
+def test_uncommitted_write_is_rolled_back_on_close(app):
+    conn = db._conn()
+    conn.execute("INSERT INTO activity (user, details) VALUES ('x', 'y')")
+    conn.close()
+
+    assert db.get_activity() == []
+
+
+def test_migrations_run_once(app):
+    conn = db._conn()
+    assert migrations.current_version(conn) == migrations.MIGRATIONS[-1].version
+    assert migrations.migrate(conn) == []
+    conn.close()
+
+
+def test_backfill_in_batches(app):
+    for i in range(25):
+        db.log_activity("u", f"entry {i}")
+    activity.writer.flush()
+
+    conn = db._conn()
+    updated = migrations.backfill(conn, "activity", "details = 'x'", "details != 'x'", batch_size=10)
+    conn.close()
+
+    assert updated == 25
+    assert {e["details"] for e in db.get_activity()} == {"x"}
+
+
+def test_keyset_pagination_round_trip(app):
+    ids = [db.add_ticket("u", f"Sak {i}", "d", "Annet", "Middels", "") for i in range(30)]
+
+    first = db.get_tickets_page(limit=25)
+    assert [t["id"] for t in first["rows"]] == ids[::-1][:25]
+    assert first["prev"] is None and first["next"] == ids[5]
+
+    second = db.get_tickets_page(after=first["next"], limit=25)
+    assert [t["id"] for t in second["rows"]] == ids[4::-1]
+    assert second["next"] is None and second["prev"] == ids[4]
+
+    back = db.get_tickets_page(before=second["prev"], limit=25)
+    assert back["rows"] == first["rows"]
+    assert back["prev"] is None
+
+
+def test_paginated_views_render(app, client):
+    for i in range(30):
+        db.add_ticket("admin", f"Sak {i}", "d", "Annet", "Middels", "")
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "support"
+
+    for url in ("/tickets", "/admin/tickets", "/notifications", "/kb", "/admin/kb", "/admin/users"):
+        assert client.get(url).status_code == 200
+
+    res = client.get("/admin/tickets")
+    assert b"after=6" in res.data
+
+
+def test_attachments_batched_and_lazy_json(app, client):
+    mine = db.add_ticket("admin", "Min sak", "d", "Annet", "Middels", "")
+    other = db.add_ticket("ola", "Annen sak", "d", "Annet", "Middels", "")
+    for name in ("a.png", "b.pdf"):
+        db.add_attachment(mine, f"s_{name}", name, "admin")
+    db.add_attachment(other, "s_c.txt", "c.txt", "ola")
+
+    grouped = db.get_attachments_for_tickets([mine, other])
+    assert [a["original_filename"] for a in grouped[mine]] == ["b.pdf", "a.png"]
+    assert db.get_attachments_for_tickets([mine, other], owner="admin").keys() == {mine}
+    assert db.count_attachments_for_tickets([mine, other, 999]) == {mine: 2, other: 1}
+
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "user"
+
+    assert b"Vedlegg (2)" in client.get("/tickets").data
+
+    data = client.get(f"/tickets/attachments.json?ids={mine},{other}").get_json()
+    assert set(data) == {str(mine)}
+    assert data[str(mine)][1]["is_image"] is True
+
+
+def test_bulk_ticket_operations(app):
+    db.create_user("kari", "x")
+    db.create_user("ola", "x")
+    db.update_preferences("ola", 1, 0)
+    ids = [db.add_ticket("kari" if i % 2 else "ola", f"Sak {i}", "d", "Annet", "Middels", "") for i in range(6)]
+    db.add_attachment(ids[5], "s", "f.txt", "kari")
+    db.add_rating(ids[5], "kari", 4, "")
+    db.close_ticket(ids[0])
+
+    # Allerede lukket sak og ukjent id telles ikke med
+    assert db.close_tickets(ids + [9999], "admin", link="/tickets") == 5
+    assert db.close_tickets(ids, "admin") == 0
+    assert {db.get_ticket(i)["status"] for i in ids} == {"Lukket"}
+
+    # Varsler bare til eiere med notify_inapp = 1 (ola har skrudd det av)
+    assert db.count_notifications("kari") == 3
+    assert db.count_notifications("ola") == 0
+
+    assert db.assign_tickets(ids[:4], "support1", "admin") == 4
+    assert db.assign_tickets(ids[:4], "support1", "admin") == 0
+    assert db.update_tickets_priority(ids, "Høy", "admin") == 6
+
+    assert db.delete_tickets(ids[4:], "admin") == 2
+    assert db.get_ticket(ids[5]) is None
+    assert db.get_attachments(ids[5]) == []
+    assert db.get_rating(ids[5]) is None
+
+    details = [a["details"] for a in db.get_activity(limit=100)]
+    assert details.count("Slettet sak #%d permanent" % ids[5]) == 1
+    assert sum(d.startswith("Lukket sak #") for d in details) == 5
+
+
+def test_bulk_priority_rejects_unknown_value(app, client):
+    ticket_id = db.add_ticket("kari", "Sak", "d", "Annet", "Middels", "")
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "support"
+
+    res = client.post("/admin/tickets/bulk-priority", data={"ticket_ids[]": [str(ticket_id)], "bulk_priority": "Haster!!"})
+    assert res.status_code == 400
+    assert db.get_ticket(ticket_id)["priority"] == "Middels"
+    client.post("/admin/tickets/bulk-priority", data={"ticket_ids[]": [str(ticket_id)], "bulk_priority": "Høy"})
+    assert db.get_ticket(ticket_id)["priority"] == "Høy"
+
+
+def test_priority_rejects_unknown_value(app, client):
+    ticket_id = db.add_ticket("kari", "Sak", "d", "Annet", "Middels", "")
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "support"
+
+    assert client.post(f"/tickets/{ticket_id}/priority", data={"priority": "Haster!!"}).status_code == 400
+    assert db.get_ticket(ticket_id)["priority"] == "Middels"
+    client.post(f"/tickets/{ticket_id}/priority", data={"priority": "Kritisk"})
+    assert db.get_ticket(ticket_id)["priority"] == "Kritisk"
+
+
+def test_bulk_operation_rolls_back_on_error(app, monkeypatch):
+    ids = [db.add_ticket("kari", f"Sak {i}", "d", "Annet", "Middels", "") for i in range(3)]
+
+    # activity.user er NOT NULL: feilen kommer etter UPDATE, i samme transaksjon
+    with pytest.raises(sqlite3.IntegrityError):
+        db.close_tickets(ids, None)
+    assert {db.get_ticket(i)["status"] for i in ids} == {"Åpen"}
+
+
+def test_notify_many_filters_on_preferences(app, client):
+    for name in ("s1", "s2", "s3"):
+        db.create_user(name, "x", role="support")
+    db.update_preferences("s2", 1, 0)
+
+    assert db.notify_many(["s1", "s2", "s3", "s1", "ukjent"], "Hei", "/tickets") == 2
+    assert [db.count_notifications(u) for u in ("s1", "s2", "s3")] == [1, 0, 1]
+    assert db.notify_many([], "Hei") == 0
+
+    # Ny sak varsler hele support-teamet med én INSERT
+    db.create_user("kari", "x")
+    with client.session_transaction() as sess:
+        sess["user"] = "kari"
+        sess["role"] = "user"
+    client.post("/tickets", data={"title": "Printer", "desc": "Virker ikke", "device": "PC"})
+    assert [db.count_notifications(u) for u in ("s1", "s2", "s3")] == [2, 0, 2]
+
+
+def test_repeated_notifications_are_coalesced(app, client):
+    for name in ("s1", "s2"):
+        db.create_user(name, "x", role="support")
+    for i in range(5):
+        assert db.notify_many(["s1", "s2"], f"Ny sak {i}", f"/tickets/{i}", kind="ticket_created") == 2
+    db.notify_many(["s1"], "Sak #1 fikk 5★", kind="ticket_rated")
+    db.add_notification("s1", "Uten type")
+
+    rows = db.get_notifications("s1")
+    assert [(r["message"], r["count"], r["link"]) for r in rows] == [
+        ("Uten type", 1, None),
+        ("Sak #1 fikk 5★", 1, None),
+        ("Ny sak 4", 5, "/tickets/4"),
+    ]
+    assert db.count_notifications("s1") == 3 and db.count_notifications("s2") == 1
+
+    # Leste varsler og varsler eldre enn vinduet slås ikke sammen med nye
+    db.mark_all_notifications_read("s1")
+    conn = db._conn()
+    conn.execute("UPDATE notifications SET updated_at = datetime('now', '-1 hour') WHERE user = 's2'")
+    conn.commit()
+    conn.close()
+    db.notify_many(["s1", "s2"], "Ny sak 5", kind="ticket_created")
+    assert [r["count"] for r in db.get_notifications("s1")][0] == 1
+    assert [r["count"] for r in db.get_notifications("s2")] == [1, 5]
+
+    # Den som har skrudd av varsler i appen får verken ny eller sammenslått rad
+    db.update_preferences("s2", notify_email=0, notify_inapp=0)
+    assert db.notify_many(["s2"], "Ny sak 6", kind="ticket_created") == 0
+    assert [r["count"] for r in db.get_notifications("s2")] == [1, 5]
+    db.update_preferences("s2", notify_email=0, notify_inapp=1)
+
+    # Nye saker fra skjemaet varsler support som én rad
+    db.create_user("kari", "x")
+    with client.session_transaction() as sess:
+        sess["user"] = "kari"
+        sess["role"] = "user"
+    for title in ("Printer", "Wi-Fi", "Teams"):
+        client.post("/tickets", data={"title": title, "desc": "Virker ikke", "device": "PC"})
+    latest = db.get_notifications("s1")[0]
+    assert (latest["count"], latest["message"]) == (4, "Ny sak opprettet av kari: Teams")
+
+
+def test_unread_counter_follows_writes(app):
+    db.create_user("kari", "x")
+    db.create_user("ola", "x")
+    for i in range(3):
+        db.add_notification("kari", f"Varsel {i}")
+    db.notify_many(["kari", "ola"], "Felles")
+    assert db.count_notifications("kari") == 4
+
+    conn = db._conn()
+    counted = conn.execute("SELECT user, unread FROM notification_counts ORDER BY user").fetchall()
+    # Triggerne fanger også skrivinger som går rett mot tabellen
+    conn.execute("UPDATE notifications SET read = 1 WHERE user = 'ola'")
+    conn.execute("INSERT INTO notifications (user, message, read) VALUES ('ola', 'lest', 1)")
+    conn.execute("DELETE FROM notifications WHERE user = 'kari' AND message = 'Varsel 0'")
+    conn.commit()
+    after = dict(conn.execute("SELECT user, unread FROM notification_counts").fetchall())
+    conn.close()
+    assert [tuple(r) for r in counted] == [("kari", 4), ("ola", 1)]
+    assert after == {"kari": 3, "ola": 0}
+
+    db.mark_all_notifications_read("kari")
+    assert db.count_notifications("kari") == 0
+
+
+def test_unread_count_is_cached(app):
+    db.create_user("kari", "x")
+    db.add_notification("kari", "Hei")
+    assert db.count_notifications("kari") == 1
+
+    # Direkte skriving forbi db.py invaliderer ikke cachen før TTL har gått ut
+    conn = db._conn()
+    conn.execute("INSERT INTO notifications (user, message) VALUES ('kari', 'x')")
+    conn.commit()
+    conn.close()
+    assert db.count_notifications("kari") == 1
+
+    db._unread_cache.invalidate("kari")
+    assert db.count_notifications("kari") == 2
+
+
+def _rollup_tables(conn):
+    return {
+        table: sorted(tuple(r) for r in conn.execute(f"SELECT * FROM {table}"))
+        for table in ("ticket_gauges", "ticket_rollups", "resolution_histogram")
+    }
+
+
+def test_dashboard_stats_are_maintained_incrementally(app):
+    ids = [
+        db.add_ticket("kari" if i % 2 else "ola", f"Sak {i}", "d", category, priority, "")
+        for i, (category, priority) in enumerate(
+            [("Feide", "Kritisk"), ("Wi-Fi", "Høy"), ("Annet", "Lav"), ("Annet", "Middels"), ("Feide", "Lav")]
+        )
+    ]
+    db.close_ticket(ids[0])
+    db.close_tickets(ids[1:3], "admin")
+
+    # Triggerne skal gi samme tall som en full omberegning (backfillen i migrering 5)
+    conn = db._conn()
+    incremental = _rollup_tables(conn)
+    migrations._m005_ticket_stats_rollups(conn)
+    conn.commit()
+    recomputed = _rollup_tables(conn)
+    conn.close()
+    incremental["ticket_gauges"] = [r for r in incremental["ticket_gauges"] if r[2] != 0]
+    assert incremental == recomputed
+
+    # Prioritetsendring flytter åpne saker mellom bøttene; sletting trekkes fra
+    # nåverdiene, mens historikken (rollups) beholdes
+    db.update_ticket_priority(ids[3], "Kritisk")
+    db.update_tickets_priority([ids[4]], "Høy", "admin")
+    db.delete_ticket_db(ids[2])
+
+    stats = db.get_dashboard_stats()
+    assert (stats["total_active"], stats["critical"], stats["closed_today"]) == (2, 2, 3)
+    assert stats["avg_hours"] is not None and stats["avg_hours"] < 1
+
+    mine = db.get_dashboard_stats(owner="kari")
+    assert (mine["total_active"], mine["critical"], mine["closed_today"]) == (1, 1, 1)
+
+    assert db.get_ticket_rollups("day", "created")[0]["n"] == 5
+    assert db.get_resolution_histogram()[0]["n"] == 3
+
+
+def test_dashboard_renders_real_stats(app, client):
+    db.add_ticket("admin", "Sak", "d", "Annet", "Kritisk", "")
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "support"
+
+    res = client.get("/dashboard")
+    assert res.status_code == 200
+    assert b"2.4t" not in res.data
@@ -0,0 +1,132 @@
+import io
+import re
+
+from app import db, dedup
+
+
+def _ticket(title, desc, owner="kari"):
+    ticket_id = db.add_ticket(owner, title, desc, "Wi-Fi", "Middels", "PC")
+    dedup.index.remember(ticket_id, dedup.signature(title, desc))
+    return ticket_id
+
+
+def _login(client, user, role="user"):
+    with client.session_transaction() as sess:
+        sess["user"] = user
+        sess["role"] = role
+
+
+def _unread(user):
+    conn = db._conn()
+    n = conn.execute("SELECT COUNT(*) FROM notifications WHERE user = ?", (user,)).fetchone()[0]
+    conn.close()
+    return n
+
+
+def test_signature_similarity():
+    a = dedup.signature("Får ikke nett", "Wifi på rom 204 virker ikke etter lunsj.")
+    b = dedup.signature("får ikke nett!!", "WiFi på rom 204 virker ikke etter lunsj")
+    c = dedup.signature("Skriveren skriver ut blanke ark", "Toneren er ny.")
+
+    assert dedup.similarity(a, b) == 1.0  # bare tegnsetting og store/små bokstaver skiller
+    assert dedup.similarity(a, c) < 0.2
+    assert dedup.signature("", "  !! ") is None
+    assert dedup.from_blob(dedup.to_blob(a)) == a
+
+
+def test_find_similar_open_tickets(app):
+    outage = _ticket("Får ikke nett", "Wifi på rom 204 virker ikke etter lunsj.")
+    _ticket("Skriver", "Skriveren i 2. etasje skriver ut blanke ark.")
+
+    sig = dedup.signature("får ikke nett på rom 204", "Wifi på rom 204 virker ikke etter lunsj")
+    assert [t["id"] for t in dedup.index.find_similar(sig)] == [outage]
+
+    # Lukkede saker foreslås ikke, og fjernes fra indeksen
+    db.close_ticket(outage)
+    assert dedup.index.find_similar(sig) == []
+    assert outage not in dict(dedup.index.candidates(sig))
+
+
+def test_index_is_rebuilt_from_persisted_signatures(app):
+    first = _ticket("Teams krasjer", "Teams krasjer når jeg deler skjerm i møter.")
+
+    # Ny prosess: tom indeks som lastes fra ticket_signatures
+    fresh = dedup.DuplicateIndex()
+    sig = dedup.signature("Teams krasjer", "Teams krasjer når jeg deler skjerm i møte")
+    assert [t["id"] for t in fresh.find_similar(sig)] == [first]
+
+    # Endret tekst sletter signaturen (trigger), og den regnes ut på nytt
+    conn = db._conn()
+    conn.execute("UPDATE tickets SET title = 'Outlook', desc = 'Outlook synker ikke kalenderen.' WHERE id = ?", (first,))
+    conn.commit()
+    conn.close()
+    assert dedup.DuplicateIndex().find_similar(sig) == []
+
+
+def test_linking_duplicate_skips_support_broadcast(app, client):
+    db.create_user("support1", "x")
+    db.change_user_role("support1", "support")
+    original = _ticket("Får ikke nett", "Wifi på rom 204 virker ikke etter lunsj.")
+    db.assign_ticket(original, "support1")
+    before = _unread("support1")
+
+    _login(client, "ola")
+    form = {
+        "title": "får ikke nett",
+        "desc": "wifi på rom 204 virker ikke etter lunsj!",
+        "category": "Wi-Fi",
+        "priority": "Middels",
+        "device": "PC",
+    }
+
+    # Første innsending: ingen sak opprettes, forslaget vises
+    client.post("/tickets", data=form)
+    html = client.get("/tickets").data.decode()
+    assert f'name="duplicate_of" value="{original}"' in html
+    assert len(db.get_tickets(owner="ola")) == 0
+
+    client.post("/tickets", data={**form, "duplicate_of": original})
+    [ticket] = db.get_tickets(owner="ola")
+    assert ticket["duplicate_of"] == original
+    # Bare den tildelte får ett varsel, ingen "Ny sak opprettet"-kringkasting
+    assert _unread("support1") == before + 1
+
+    # "Opprett ny sak likevel" gir vanlig varsling til support
+    client.post("/tickets", data={**form, "force_new": "1"})
+    assert len(db.get_tickets(owner="ola")) == 2
+    assert _unread("support1") == before + 2
+
+
+def test_draft_keeps_files_and_long_description(app, client):
+    db.create_user("support1", "x", role="support")
+    original = _ticket("Får ikke nett", "Wifi på rom 204 virker ikke etter lunsj.")  # ikke tildelt
+    _login(client, "ola")
+    desc = "wifi på rom 204 virker ikke etter lunsj! " + "Logg: tilkobling tidsavbrutt. " * 300
+
+    client.post(
+        "/tickets",
+        data={"title": "får ikke nett", "desc": desc, "category": "Wi-Fi", "priority": "Middels", "device": "PC",
+              "files": [(io.BytesIO(b"skjermbilde"), "nett.png")]},
+        content_type="multipart/form-data",
+    )
+    res = client.get("/tickets")
+    html = res.data.decode()
+    assert "nett.png" in html and len(db.get_tickets(owner="ola")) == 0
+    # Cookien har bare id-en til utkastet, ikke beskrivelsen
+    assert all(len(c) < 1000 for c in res.headers.getlist("Set-Cookie"))
+    draft_id = re.search(r'name="draft_id" value="([^"]+)"', html).group(1)
+
+    # Skjemaet for å koble saken har bare utkastet og valget
+    client.post("/tickets", data={"draft_id": draft_id, "duplicate_of": original})
+    [ticket] = db.get_tickets(owner="ola")
+    assert ticket["desc"] == desc.strip() and ticket["duplicate_of"] == original
+    [att] = db.get_attachments(ticket["id"])
+    assert att["original_filename"] == "nett.png"
+    assert client.get(f"/attachments/{att['id']}/download").data == b"skjermbilde"
+    assert db.get_ticket_draft(draft_id, "ola") is None
+
+    # Originalsaken har ingen ansvarlig: support varsles som for en ny sak
+    [notification] = db.get_notifications("support1")
+    assert notification["link"] == "/tickets"
+    _login(client, "support1", "support")
+    assert client.get(notification["link"]).status_code == 200
@@ -0,0 +1,91 @@
+from app import db, digest, outbox
+from app.config import Config
+
+
+def _query(sql, *args):
+    conn = db._conn()
+    rows = conn.execute(sql, args).fetchall()
+    conn.commit()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def _user(name, email=None, notify_email=1, frequency="hourly"):
+    db.create_user(name, "x", email=email)
+    db.update_preferences(name, notify_email, 1, email_digest=frequency)
+
+
+def test_burst_becomes_one_email_per_user(app):
+    _user("kari", "kari@skole.no", frequency="immediate")
+    _user("ola", "ola@skole.no", frequency="hourly")
+    _user("per", "per@skole.no", notify_email=0)
+    _user("lisa", None, frequency="immediate")
+
+    for i in range(100):
+        db.notify_many(["kari", "ola", "per", "lisa"], f"Ny sak #{i}", f"/tickets/{i}")
+    assert db.count_notifications("per") == 100  # varslene i appen er som før
+
+    job = digest.DigestJob()
+    assert job.run_pending() == 1
+    [mail] = _query("SELECT * FROM email_outbox")
+    assert mail["recipients"] == '["kari@skole.no"]'
+    assert mail["subject"] == "Helpdesk: 100 nye varsler"
+    assert "Ny sak #99" in mail["body"] and "og 50 eldre varsler" in mail["body"]
+
+    # ola får sitt sammendrag når timen er over
+    assert {r["user"] for r in _query("SELECT user FROM digest_items")} == {"ola"}
+    assert job.run_pending() == 0
+    _query("UPDATE digest_items SET due_at = datetime('now')")
+    assert job.run_pending() == 1
+    assert _query("SELECT COUNT(*) AS n FROM digest_items")[0]["n"] == 0
+    assert job.stats["items"] == 200
+
+
+def test_due_at_follows_frequency(app, monkeypatch):
+    monkeypatch.setattr(Config, "DIGEST_DAILY_HOUR", 7)
+    _user("kari", "kari@skole.no", frequency="hourly")
+    _user("ola", "ola@skole.no", frequency="daily")
+    db.notify_many(["kari", "ola"], "Hei")
+
+    due = {r["user"]: r for r in _query("SELECT user, due_at, datetime('now') AS now FROM digest_items")}
+    assert due["kari"]["due_at"].endswith(":00:00") and due["kari"]["due_at"] > due["kari"]["now"]
+    assert due["ola"]["due_at"].endswith(" 07:00:00") and due["ola"]["due_at"] > due["ola"]["now"]
+
+
+def test_bulk_close_and_disabled_email(app):
+    _user("kari", "kari@skole.no", frequency="immediate")
+    ids = [db.add_ticket("kari", f"Sak {i}", "d", "Annet", "Middels", "") for i in range(3)]
+    db.close_tickets(ids, "admin")
+    assert len(_query("SELECT id FROM digest_items WHERE user = 'kari'")) == 3
+
+    # Skrur brukeren av e-post før jobben kjører, sendes ingenting
+    db.update_preferences("kari", 0, 1)
+    job = digest.DigestJob()
+    assert job.run_pending() == 0
+    assert job.stats["skipped"] == 3
+    assert _query("SELECT COUNT(*) AS n FROM digest_items")[0]["n"] == 0
+
+
+def test_digests_share_one_smtp_connection(app, smtp_server):
+    for i in range(30):
+        _user(f"u{i}", f"u{i}@skole.no", frequency="immediate")
+    for _ in range(10):
+        db.notify_many([f"u{i}" for i in range(30)], "Ny sak")
+
+    assert digest.DigestJob(batch_users=7).run_pending() == 30
+    assert outbox.OutboxSender(app=app, batch_size=50).run_pending() == 30
+    assert smtp_server.connections == 1
+    assert sorted(m[1][0] for m in smtp_server.messages) == sorted(f"u{i}@skole.no" for i in range(30))
+
+
+def test_settings_saves_digest_frequency(app, client):
+    db.create_user("kari", "x")
+    with client.session_transaction() as sess:
+        sess["user"] = "kari"
+        sess["role"] = "user"
+
+    assert b'value="daily"' in client.get("/settings").data
+    client.post("/settings", data={"notify_email": "1", "notify_inapp": "1", "email_digest": "daily"})
+    assert db.get_user("kari")["email_digest"] == "daily"
+    client.post("/settings", data={"notify_email": "1", "email_digest": "ukjent"})
+    assert db.get_user("kari")["email_digest"] == "daily"
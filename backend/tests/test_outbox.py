@@ -0,0 +1,133 @@
+import time
+
+from app import db, email_service, outbox
+
+
+def _outbox_rows():
+    conn = db._conn()
+    rows = conn.execute("SELECT * FROM email_outbox ORDER BY id").fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_new_ticket_queues_email_instead_of_sending(app, client, smtp_server):
+    app.config["MAIL_SUPPORT_RECIPIENTS"] = "support@skole.no"
+    db.create_user("kari", "x")
+    with client.session_transaction() as sess:
+        sess["user"] = "kari"
+        sess["role"] = "user"
+
+    client.post("/tickets", data={"title": "Printer", "desc": "Virker ikke", "device": "PC"})
+    assert smtp_server.connections == 0
+    [row] = _outbox_rows()
+    assert row["status"] == "pending" and "Printer" in row["body"]
+
+    sender = outbox.OutboxSender(app=app)
+    assert sender.run_pending() == 1
+    assert [m[1] for m in smtp_server.messages] == [["support@skole.no"]]
+    assert _outbox_rows() == []
+
+
+def test_batch_is_sent_over_one_connection(app, smtp_server):
+    for i in range(12):
+        db.enqueue_email([f"u{i}@skole.no"], f"Emne {i}", "Hei")
+
+    sender = outbox.OutboxSender(app=app, batch_size=50)
+    assert sender.run_pending() == 12
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 12
+
+    metrics = sender.metrics()
+    assert (metrics["sent"], metrics["batches"], metrics["connections"]) == (12, 1, 1)
+    assert metrics["messages_per_sec"] > 0
+    assert metrics["outbox"] == {"pending": 0, "due": 0, "failed": 0, "oldest_pending": None}
+
+
+def test_rejected_recipient_is_retried_or_given_up(app, smtp_server):
+    smtp_server.refuse = {"full@skole.no": 452, "ukjent@skole.no": 550}
+    for to in ("a@skole.no", "full@skole.no", "ukjent@skole.no", "b@skole.no"):
+        db.enqueue_email([to], "Emne", "Hei")
+
+    sender = outbox.OutboxSender(app=app, retry_seconds=60)
+    assert sender.run_pending() == 2
+    # Avvisningene stopper ikke resten av batchen
+    assert smtp_server.connections == 1
+    assert [m[1] for m in smtp_server.messages] == [["a@skole.no"], ["b@skole.no"]]
+
+    rows = {r["recipients"]: r for r in _outbox_rows()}
+    full, unknown = rows['["full@skole.no"]'], rows['["ukjent@skole.no"]']
+    assert (full["status"], full["attempts"]) == ("pending", 1)
+    assert "452" in full["last_error"]
+    assert unknown["status"] == "failed"
+    assert db.get_email_outbox_stats()["due"] == 0  # neste forsøk om 60 s
+
+
+def test_breaker_stops_sending_while_server_is_down(app, smtp_server):
+    smtp_server.down = True
+    for i in range(3):
+        db.enqueue_email([f"u{i}@skole.no"], "Emne", "Hei")
+
+    clock = FakeClock()
+    sender = outbox.OutboxSender(app=app, retry_seconds=0, breaker=outbox.CircuitBreaker(2, 30, clock=clock))
+    assert sender.run_pending() == 0
+    assert sender.breaker.state == outbox.OPEN
+    assert smtp_server.connections == 2
+    # Tilkoblingsfeil teller ikke som forsøk på e-postene
+    assert {(r["status"], r["attempts"]) for r in _outbox_rows()} == {("pending", 0)}
+
+    assert sender.run_once() == 0
+    assert smtp_server.connections == 2
+
+    smtp_server.down = False
+    clock.now += 31
+    assert sender.run_pending() == 3
+    assert sender.breaker.state == outbox.CLOSED
+    assert sender.metrics()["breaker_opens"] == 1
+
+
+def test_worker_threads_drain_outbox(app, smtp_server):
+    sender = outbox.OutboxSender(app=app, workers=2, batch_size=5, poll_seconds=0.05)
+    sender.ensure_started()
+    try:
+        for i in range(20):
+            assert email_service.send_email("Emne", f"Melding {i}", f"u{i}@skole.no", app=app)
+        deadline = time.monotonic() + 5
+        while len(smtp_server.messages) < 20 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        sender.stop()
+
+    assert len(smtp_server.messages) == 20
+    assert _outbox_rows() == []
+    assert smtp_server.connections <= sender.stats["batches"]
+
+
+def test_message_that_cannot_be_built_fails_alone(app, client, smtp_server):
+    db.enqueue_email(["evil@x.no\nBcc: a@b.no"], "Emne", "Hei")
+    for i in range(3):
+        db.enqueue_email([f"u{i}@skole.no"], "Emne", "Hei")
+
+    sender = outbox.OutboxSender(app=app)
+    assert sender.run_pending() == 3
+    assert sender.breaker.state == outbox.CLOSED
+    [bad] = _outbox_rows()
+    assert bad["status"] == "failed" and bad["attempts"] == 1
+    assert sender.metrics()["connection_errors"] == 0
+
+    # Adressen kommer ikke inn via innstillingene heller
+    db.create_user("kari", "x", email="kari@skole.no")
+    with client.session_transaction() as sess:
+        sess["user"] = "kari"
+        sess["role"] = "user"
+    client.post("/settings", data={"email": "kari@skole.no\nBcc: a@b.no", "notify_email": "1"})
+    assert db.get_user("kari")["email"] == "kari@skole.no"
+    client.post("/settings", data={"email": "kari.nordmann@skole.no", "notify_email": "1"})
+    assert db.get_user("kari")["email"] == "kari.nordmann@skole.no"
@@ -0,0 +1,271 @@
+"""
+Regresjonstest for spørreplaner: kjører alle offentlige funksjoner i db.py mot
+en database med >10k rader i hver tabell, fanger opp SQL-en de kjører og
+feiler hvis EXPLAIN QUERY PLAN viser en full SCAN av en stor tabell.
+"""
+import inspect
+import re
+
+import pytest
+
+from app import activity, db
+
+LARGE_TABLE_ROWS = 10_000
+SEED_ROWS = LARGE_TABLE_ROWS + 1
+
+# Ett kall per offentlig funksjon i db.py. Nye funksjoner må legges til her.
+CALLS = {
+    "user_exists": lambda: db.user_exists("user5"),
+    "create_user": lambda: db.create_user("ny_bruker", "hash"),
+    "get_user": lambda: db.get_user("user5"),
+    "update_last_login": lambda: db.update_last_login("user5"),
+    "update_preferences": lambda: db.update_preferences("user5", 1, 1),
+    "get_support_users": lambda: db.get_support_users(),
+    "set_password_hash": lambda: db.set_password_hash("user5", "hash"),
+    "change_user_role": lambda: db.change_user_role("user6", "support"),
+    "delete_user_db": lambda: db.delete_user_db("user7"),
+    "get_all_users": lambda: db.get_all_users(),
+    "get_users_page": lambda: db.get_users_page(after="user5000"),
+    "count_users_by_role": lambda: db.count_users_by_role(),
+    "add_ticket": lambda: db.add_ticket("user5", "Tittel", "Beskrivelse", "Annet", "Middels", "PC"),
+    "get_tickets": lambda: db.get_tickets(owner="user5"),
+    "get_tickets_page": lambda: db.get_tickets_page(owner="user5", after=5000),
+    "search_tickets": lambda: db.search_tickets("t d"),
+    "get_ticket": lambda: db.get_ticket(5),
+    "close_ticket": lambda: db.close_ticket(5),
+    "assign_ticket": lambda: db.assign_ticket(5, "user6"),
+    "update_ticket_priority": lambda: db.update_ticket_priority(5, "Høy"),
+    "delete_ticket_db": lambda: db.delete_ticket_db(9),
+    "close_tickets": lambda: db.close_tickets(range(10, 1200), "user100"),
+    "assign_tickets": lambda: db.assign_tickets(range(10, 1200), "user100", "user100"),
+    "update_tickets_priority": lambda: db.update_tickets_priority(range(10, 1200), "Høy", "user100"),
+    "delete_tickets": lambda: db.delete_tickets(range(2000, 2100), "user100"),
+    "add_rating": lambda: db.add_rating(SEED_ROWS + 5, "user5", 5, "bra"),
+    "get_rating": lambda: db.get_rating(5),
+    "add_notification": lambda: db.add_notification("user5", "Hei", "/tickets"),
+    "notify_many": lambda: db.notify_many([f"user{i}" for i in range(0, 10_000, 100)], "Hei", "/tickets"),
+    "get_notifications": lambda: db.get_notifications("user5"),
+    "get_notifications_page": lambda: db.get_notifications_page("user5", before=100),
+    "mark_all_notifications_read": lambda: db.mark_all_notifications_read("user5"),
+    "count_notifications": lambda: db.count_notifications("user5"),
+    "create_article": lambda: db.create_article("Tittel", "Innhold", "user5"),
+    "get_articles": lambda: db.get_articles(),
+    "get_articles_page": lambda: db.get_articles_page(after=5000),
+    "get_article": lambda: db.get_article(5),
+    "update_article": lambda: db.update_article(5, "Tittel", "Innhold"),
+    "delete_article_db": lambda: db.delete_article_db(9),
+    "search_articles": lambda: db.search_articles("a c"),
+    "suggest_articles": lambda: db.suggest_articles(["a", "ccc", "innhold"]),
+    "save_ticket_signatures": lambda: db.save_ticket_signatures([(5, b"sig"), (6, b"sig")]),
+    "get_open_ticket_signatures": lambda: db.get_open_ticket_signatures(after_id=9000),
+    "get_open_tickets_without_signature": lambda: db.get_open_tickets_without_signature(),
+    "get_open_tickets_by_ids": lambda: db.get_open_tickets_by_ids([5, 50, 500]),
+    "create_chat_conversation": lambda: db.create_chat_conversation("user5", {}),
+    "get_chat_conversation": lambda: db.get_chat_conversation("chat5", "user5"),
+    "create_ticket_draft": lambda: db.create_ticket_draft("user5", {"title": "t"}, [(f"{7:064x}", 100, "f.png")]),
+    "get_ticket_draft": lambda: db.get_ticket_draft("draft5", "user5"),
+    "delete_ticket_draft": lambda: db.delete_ticket_draft("draft6"),
+    "save_chat_turn": lambda: db.save_chat_turn("chat5", {"message_count": 1}, "hei", "hallo"),
+    "get_chat_conversations": lambda: db.get_chat_conversations("user5"),
+    "save_chatbot_kb": lambda: db.save_chatbot_kb({"format": 1}, "user5"),
+    "get_chatbot_kb": lambda: db.get_chatbot_kb(after_version=5),
+    "get_chatbot_kb_versions": lambda: db.get_chatbot_kb_versions(),
+    "enqueue_email": lambda: db.enqueue_email(["a@b.no"], "Emne", "Tekst"),
+    "claim_emails": lambda: db.claim_emails(50, 300),
+    "mark_emails_sent": lambda: db.mark_emails_sent(range(1, 51)),
+    "release_emails": lambda: db.release_emails(range(51, 101), 30),
+    "fail_email": lambda: db.fail_email(5, "452 Mottaker avvist", retry_in_seconds=60),
+    "get_email_outbox_stats": lambda: db.get_email_outbox_stats(),
+    "claim_digest_items": lambda: db.claim_digest_items(50, 300),
+    "enqueue_digest_emails": lambda: db.enqueue_digest_emails([("a@b.no", "Emne", "Tekst")], range(1, 51)),
+    "create_webhook_subscription": lambda: db.create_webhook_subscription("http://x", ["ticket.created"], "user5"),
+    "get_webhook_subscriptions": lambda: db.get_webhook_subscriptions(),
+    "delete_webhook_subscription": lambda: db.delete_webhook_subscription(3),
+    "enqueue_webhook_events": lambda: db.enqueue_webhook_events([("ticket.created", {"ticket_id": 5})] * 3),
+    "claim_webhook_deliveries": lambda: db.claim_webhook_deliveries(50, 120),
+    "complete_webhook_deliveries": lambda: db.complete_webhook_deliveries(range(1, 51)),
+    "retry_webhook_deliveries": lambda: db.retry_webhook_deliveries(range(51, 101), "HTTP 500", 30),
+    "dead_letter_webhook_deliveries": lambda: db.dead_letter_webhook_deliveries(range(101, 151), "HTTP 410"),
+    "get_webhook_dead_letters": lambda: db.get_webhook_dead_letters(),
+    "requeue_webhook_dead_letter": lambda: db.requeue_webhook_dead_letter(1),
+    "get_webhook_queue_stats": lambda: db.get_webhook_queue_stats(),
+    "log_activity": lambda: (db.log_activity("user5", "test"), activity.writer.flush()),
+    "insert_activity": lambda: db.insert_activity([("user5", "test", "2024-01-01 00:00:00")] * 3),
+    "get_activity": lambda: db.get_activity(),
+    "add_attachment": lambda: db.add_attachment(5, "fil.png", "fil.png", "user5"),
+    "get_attachments": lambda: db.get_attachments(5),
+    "get_attachments_for_tickets": lambda: db.get_attachments_for_tickets(range(1, 26)),
+    "count_attachments_for_tickets": lambda: db.count_attachments_for_tickets(range(1, 26)),
+    "get_attachment": lambda: db.get_attachment(5),
+    "delete_unreferenced_blobs": lambda: db.delete_unreferenced_blobs(lambda sha: None, 50),
+    "get_dashboard_stats": lambda: db.get_dashboard_stats(),
+    "get_ticket_rollups": lambda: db.get_ticket_rollups("hour", "created"),
+    "get_resolution_histogram": lambda: db.get_resolution_histogram(),
+    "get_sla_deadlines": lambda: db.get_sla_deadlines("2000-01-01 00:00:00"),
+    "mark_sla_notified": lambda: db.mark_sla_notified(5, 1, "2000-01-01 00:00:00"),
+    "get_sla_queue_page": lambda: db.get_sla_queue_page(after="2000-01-01 00:00:00|5"),
+    "create_reset_code": lambda: db.create_reset_code("user5", "email", "a@b.no"),
+    "verify_reset_code": lambda: db.verify_reset_code("user5", "123456"),
+    "consume_reset_code": lambda: db.consume_reset_code("user5", "123456"),
+}
+
+# Flere varianter av samme funksjon (første side, andre filtre, bakover).
+EXTRA_CALLS = {
+    "get_tickets_all": lambda: db.get_tickets(),
+    "get_tickets_page_first": lambda: db.get_tickets_page(),
+    "get_tickets_page_all_after": lambda: db.get_tickets_page(after=5000),
+    "get_tickets_page_owner_before": lambda: db.get_tickets_page(owner="user5", before=100),
+    "get_users_page_before": lambda: db.get_users_page(before="user5000"),
+    "get_sla_queue_page_first": lambda: db.get_sla_queue_page(),
+    "get_sla_queue_page_before": lambda: db.get_sla_queue_page(before="2000-01-01 00:00:00|5"),
+    "get_tickets_page_status": lambda: db.get_tickets_page(status="Åpen", priority="Høy", after=5000),
+    "search_tickets_status_after": lambda: db.search_tickets("t", status="Åpen", after=5000),
+    "search_tickets_before": lambda: db.search_tickets('"d"', before=100),
+    "search_articles_after": lambda: db.search_articles("a", after="-0.5|100"),
+    "notify_many_coalesced": lambda: db.notify_many([f"user{i}" for i in range(0, 10_000, 100)], "Hei", "/t", kind="x"),
+    "get_dashboard_stats_owner": lambda: db.get_dashboard_stats(owner="user5"),
+    "claim_webhook_deliveries_excluding": lambda: db.claim_webhook_deliveries(50, 120, exclude_subscriptions=[1, 2]),
+    "add_attachment_blob": lambda: db.add_attachment(5, "blobs/x", "fil.png", "user5", blob_sha256=f"{7:064x}", size=10),
+    "get_attachments_for_tickets_owner": lambda: db.get_attachments_for_tickets([5, 505], owner="user5"),
+}
+
+# Ikke-paginerte lister som med vilje henter hele tabellen, og tellingen av
+# brukere per rolle (aggregat over den smale indeksen idx_users_role).
+ALLOWED_FULL_SCANS = {"get_tickets_all", "get_articles", "get_all_users", "count_users_by_role"}
+
+SCAN_RE = re.compile(r"^SCAN (\w+)")
+# FTS5 rapporterer MATCH-oppslag som "SCAN x VIRTUAL TABLE INDEX 0:M1" – det er
+# et indeksoppslag, ikke en full scan
+FTS_MATCH_RE = re.compile(r"VIRTUAL TABLE INDEX \d+:\S*M")
+LIMIT_RE = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+
+def _seed(conn):
+    n = range(1, SEED_ROWS + 1)
+    conn.executemany(
+        "INSERT INTO users (username, pw_hash, role) VALUES (?, 'x', ?)",
+        [(f"user{i}", "support" if i % 100 == 0 else "user") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO tickets (title, desc, owner) VALUES ('t', 'd', ?)",
+        [(f"user{i % 500}",) for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO notifications (user, message, read) VALUES (?, 'm', ?)",
+        [(f"user{i % 500}", i % 2) for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO ratings (ticket_id, user, stars) VALUES (?, ?, 4)",
+        [(i, f"user{i % 500}") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO articles (title, content, author) VALUES ('a', 'c', ?)",
+        [(f"user{i % 50}",) for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO activity (user, details) VALUES (?, 'x')",
+        [(f"user{i % 500}",) for i in n],
+    )
+    conn.executemany("INSERT INTO blobs (sha256, size) VALUES (?, 100)", [(f"{i:064x}",) for i in n])
+    conn.executemany(
+        "INSERT INTO attachments (ticket_id, stored_filename, original_filename, uploaded_by, blob_sha256) "
+        "VALUES (?, 'f', 'f', 'u', ?)",
+        [(i, None if i % 10 == 0 else f"{i % 5000:064x}") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO password_resets (username, code, channel, sent_to, expires_at) "
+        "VALUES (?, ?, 'email', 'x', datetime('now'))",
+        [(f"user{i % 500}", f"{i:06d}") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO chat_conversations (id, user, state) VALUES (?, ?, '{}')",
+        [(f"chat{i}", f"user{i % 500}") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO ticket_drafts (id, user, data) VALUES (?, ?, '{}')",
+        [(f"draft{i}", f"user{i}") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO ticket_draft_files (draft_id, blob_sha256, original_filename) VALUES (?, ?, 'f')",
+        [(f"draft{i}", f"{i:064x}") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO chat_messages (conversation_id, sender, message) VALUES (?, 'user', 'm')",
+        [(f"chat{i % 500}",) for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO email_outbox (recipients, subject, body, status) VALUES ('[\"a@b.no\"]', 's', 'b', ?)",
+        [("failed" if i % 10 == 0 else "pending",) for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO digest_items (user, message, due_at) VALUES (?, 'm', datetime('now', ?))",
+        [(f"user{i % 500}", "-1 hour" if i % 100 == 0 else "+1 hour") for i in n],
+    )
+    conn.executemany(
+        "INSERT INTO webhook_deliveries (subscription_id, event, payload, next_attempt_at) "
+        "VALUES (?, 'ticket.created', '{}', datetime('now', ?))",
+        [(i % 5 + 1, "-1 minute" if i % 100 == 0 else "+1 hour") for i in n],
+    )
+    conn.commit()
+
+
+def _table_sizes(conn):
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return {t: conn.execute(f"SELECT COUNT(*) FROM \"{t}\"").fetchone()[0] for t in tables}
+
+
+def _large_scans(conn, sql, sizes):
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    # ORDER BY id DESC LIMIT n uten sortering leser bare n rader
+    bounded = LIMIT_RE.search(sql) and not any("TEMP B-TREE" in p for p in plan)
+
+    scans = []
+    for detail in plan:
+        m = SCAN_RE.match(detail)
+        if FTS_MATCH_RE.search(detail):
+            continue
+        if m and sizes.get(m.group(1), 0) > LARGE_TABLE_ROWS and not bounded:
+            scans.append(detail)
+    return scans
+
+
+@pytest.fixture
+def seeded(app):
+    conn = db._conn()
+    _seed(conn)
+    yield conn
+    conn.close()
+
+
+def test_every_db_function_is_covered():
+    public = {
+        name
+        for name, fn in inspect.getmembers(db, inspect.isfunction)
+        if fn.__module__ == db.__name__ and not name.startswith("_") and name != "init_db"
+    }
+    assert public == set(CALLS)
+
+
+def test_no_full_scan_on_large_tables(seeded):
+    sizes = _table_sizes(seeded)
+    problems = {}
+
+    for name, call in {**CALLS, **EXTRA_CALLS}.items():
+        statements = []
+        seeded.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            seeded.set_trace_callback(None)
+
+        queries = [s for s in statements if s.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT"))]
+        assert queries, f"{name} kjørte ingen SQL"
+
+        if name in ALLOWED_FULL_SCANS:
+            continue
+        for sql in queries:
+            scans = _large_scans(seeded, sql, sizes)
+            if scans:
+                problems[name] = (sql, scans)
+
+    assert not problems, f"Full SCAN av tabeller med >{LARGE_TABLE_ROWS} rader: {problems}"
@@ -0,0 +1,136 @@
+from app import db
+
+
+def _titles(result):
+    return [r["title"] for r in result["rows"]]
+
+
+def test_article_index_follows_writes(app):
+    a = db.create_article("Feide-innlogging", "Velg riktig organisasjon.", "admin")
+    b = db.create_article("Skriver", "Feide brukes ikke her. Sjekk toner og papir.", "admin")
+
+    # Tittel vektes over innhold; prefiks treffer
+    assert _titles(db.search_articles("feid")) == ["Feide-innlogging", "Skriver"]
+
+    db.update_article(b, "Skriver", "Sjekk toner og papir.")
+    assert _titles(db.search_articles("feide")) == ["Feide-innlogging"]
+
+    db.delete_article_db(a)
+    assert db.search_articles("feide")["rows"] == []
+    assert _titles(db.search_articles("toner")) == ["Skriver"]
+
+
+def test_article_search_phrases_and_hostile_input(app):
+    db.create_article("Wi-Fi", "Koble til eduroam på nytt.", "admin")
+    db.create_article("Eduroam", "Nytt passord? Koble til igjen.", "admin")
+
+    assert _titles(db.search_articles('"til eduroam"')) == ["Wi-Fi"]
+    assert _titles(db.search_articles('"pa"')) == ["Wi-Fi"]  # diakritika ignoreres (på)
+    for q in ('"', "AND OR NOT", "*", "(eduroam", "NEAR(", ""):
+        db.search_articles(q)  # aldri syntaksfeil
+
+
+def test_article_search_cursor_paging(app):
+    for i in range(7):
+        db.create_article(f"Passord {i}", "passord " * (i + 1), "admin")
+
+    seen = []
+    cursor = None
+    while True:
+        page = db.search_articles("passord", after=cursor, limit=3)
+        seen += [r["id"] for r in page["rows"]]
+        cursor = page["next"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 7
+
+
+def test_kb_search_endpoint_escapes_snippets(app, client):
+    db.create_article("Feide <b>hjelp</b>", "Logg inn med <script>alert(1)</script> Feide.", "admin")
+    with client.session_transaction() as sess:
+        sess["user"] = "kari"
+        sess["role"] = "user"
+
+    html = client.get("/kb/search?q=feide").data.decode()
+    assert "<mark>Feide</mark>" in html
+    assert "<script>alert(1)" not in html and "&lt;script&gt;" in html
+
+    data = client.get("/kb/search?q=feide&format=json").get_json()
+    assert data["results"][0]["title_html"] == "<mark>Feide</mark> &lt;b&gt;hjelp&lt;/b&gt;"
+    assert data["next"] is None
+
+
+def _ticket(title, desc, priority="Middels", device="PC", category="Annet"):
+    return db.add_ticket("kari", title, desc, category, priority, device)
+
+
+def test_ticket_index_follows_writes(app):
+    a = _ticket("Skriver virker ikke", "Papirstopp i skriveren på rom 204.")
+    b = _ticket("VPN", "Får ikke koblet til.", device="Laptop")
+
+    assert [r["id"] for r in db.search_tickets("skriv")["rows"]] == [a]
+    assert [r["id"] for r in db.search_tickets("laptop")["rows"]] == [b]
+    assert [r["id"] for r in db.search_tickets('"rom 204"')["rows"]] == [a]
+
+    conn = db._conn()
+    conn.execute("UPDATE tickets SET title = 'Blekk', desc = 'Tomt for blekk.' WHERE id = ?", (a,))
+    conn.commit()
+    conn.close()
+    assert db.search_tickets("skriver")["rows"] == []
+    assert [r["id"] for r in db.search_tickets("blekk")["rows"]] == [a]
+
+    db.delete_tickets([b], "admin")
+    assert db.search_tickets("vpn")["rows"] == []
+
+
+def test_ticket_search_filters_and_paging(app):
+    ids = [_ticket(f"Passord {i}", "Glemt passord.", priority="Høy" if i % 2 else "Lav") for i in range(7)]
+    db.close_tickets(ids[:2], "admin")
+
+    open_high = db.search_tickets("passord", status="Åpen", priority="Høy")
+    assert [r["id"] for r in open_high["rows"]] == [ids[5], ids[3]]
+    assert "\x02passord\x03" in open_high["rows"][0]["snippet"].lower()
+
+    seen, cursor = [], None
+    while True:
+        page = db.search_tickets("passord", after=cursor, limit=3)
+        seen += [r["id"] for r in page["rows"]]
+        cursor = page["next"]
+        if cursor is None:
+            break
+    assert seen == sorted(ids, reverse=True)
+
+    back = db.search_tickets("passord", before=ids[2], limit=3)
+    assert [r["id"] for r in back["rows"]] == [ids[5], ids[4], ids[3]]
+    for q in ('"', "AND", "*", ""):
+        db.search_tickets(q)
+
+
+def test_admin_tickets_search_endpoint(app, client):
+    _ticket("Skjerm <flimrer>", "Skjermen flimrer etter oppdatering.")
+    _ticket("Mus", "Musen er treg.")
+    with client.session_transaction() as sess:
+        sess["user"] = "support1"
+        sess["role"] = "support"
+
+    html = client.get("/admin/tickets?q=flimrer&status=Åpen").data.decode()
+    assert "Skjerm &lt;flimrer&gt;" in html and html.count('class="ticketCheckbox"') == 1
+    assert "<mark>flimrer</mark>" in html
+
+    html = client.get("/admin/tickets?priority=Middels").data.decode()
+    assert html.count('class="ticketCheckbox"') == 2
+
+
+def test_suggest_articles_prefers_rare_terms(app):
+    printer = db.create_article("Skriveren skriver blankt", "Bytt toner i skriveren.", "admin")
+    for i in range(5):
+        db.create_article(f"Passord {i}", "Problem med innlogging. Problem igjen.", "admin")
+
+    # "skriver" kuttes til prefiks og treffer "skriveren"; vanlige ord rangeres lavere
+    found = db.suggest_articles(["skriveren", "problem"], limit=3)
+    assert found[0]["id"] == printer
+
+    # Ord som treffer flere artikler enn budsjettet tas ikke med i spørringen
+    assert db.suggest_articles(["problem"], max_candidates=3) == []
+    assert [a["id"] for a in db.suggest_articles(["problem", "toner"], max_candidates=3)] == [printer]
+    assert db.suggest_articles(["på", "i", ""]) == []
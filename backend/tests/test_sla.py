@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from app import db, sla
+
+
+def _set_created(ticket_id, created_at):
+    conn = db._conn()
+    conn.execute("UPDATE tickets SET created_at = ? WHERE id = ?", (sla.format_ts(created_at), ticket_id))
+    conn.commit()
+    conn.close()
+
+
+def test_due_at_follows_priority(app):
+    tid = db.add_ticket("kari", "Sak", "d", "Annet", "Kritisk", "")
+    t = db.get_ticket(tid)
+    hours = (sla.parse_ts(t["due_at"]) - sla.parse_ts(t["created_at"])).total_seconds() / 3600
+    assert hours == db.Config.SLA_CRITICAL
+
+    db.update_ticket_priority(tid, "Lav")
+    t = db.get_ticket(tid)
+    assert sla.parse_ts(t["due_at"]) - sla.parse_ts(t["created_at"]) == timedelta(hours=db.Config.SLA_LOW)
+
+
+def test_timer_sends_warning_then_breach_once(app):
+    db.create_user("s1", "x", role="support")
+    db.create_user("s2", "x", role="support")
+    now = sla.utcnow()
+
+    tid = db.add_ticket("kari", "Sak", "d", "Annet", "Kritisk", "")
+    _set_created(tid, now - timedelta(hours=1, minutes=45))
+    db.update_ticket_priority(tid, "Kritisk")  # regner ut due_at på nytt: om 15 min
+    done = db.add_ticket("kari", "Lukket", "d", "Annet", "Kritisk", "")
+    _set_created(done, now - timedelta(hours=3))
+    db.update_ticket_priority(done, "Kritisk")
+    db.close_ticket(done)
+
+    timer = sla.SlaTimer(reload_seconds=60, warning_minutes=30)
+    assert timer.run_pending(now) == 1  # nær brudd
+    assert timer.run_pending(now) == 0
+    assert db.count_notifications("s1") == db.count_notifications("s2") == 1
+
+    assert timer.run_pending(now + timedelta(minutes=16)) == 1  # brudd
+    assert db.get_ticket(tid)["sla_notified"] == sla.BREACHED
+    assert db.count_notifications("s1") == 2
+
+    # En annen prosess med egen timer sender ikke varslene på nytt
+    assert sla.SlaTimer().run_pending(now + timedelta(minutes=20)) == 0
+
+
+def test_timer_goes_to_assignee_and_skips_moved_deadline(app, client):
+    db.create_user("s1", "x", role="support")
+    db.create_user("s2", "x", role="support")
+    now = sla.utcnow()
+
+    tid = db.add_ticket("kari", "Sak", "d", "Annet", "Høy", "")
+    _set_created(tid, now - timedelta(hours=8, minutes=1))
+    db.update_ticket_priority(tid, "Høy")  # allerede brutt
+    db.assign_ticket(tid, "s2")
+
+    timer = sla.SlaTimer(reload_seconds=60, warning_minutes=30)
+    timer._load(now)  # begge hendelsene ligger i heapen
+
+    # Ny prioritet flytter fristen: de gamle hendelsene er foreldet
+    db.update_ticket_priority(tid, "Lav")
+    assert timer.run_pending(now) == 0
+    assert db.count_notifications("s1") == 0
+
+    db.update_ticket_priority(tid, "Høy")
+    timer.reload()
+    assert timer.run_pending(now) == 1  # bare bruddvarselet, ikke "nærmer seg"
+    assert (db.count_notifications("s1"), db.count_notifications("s2")) == (0, 1)
+
+    # Lenken i varselet skal kunne følges
+    [notification] = db.get_notifications("s2")
+    with client.session_transaction() as sess:
+        sess["user"] = "s2"
+        sess["role"] = "support"
+    assert client.get(notification["link"]).status_code == 200
+
+
+def test_support_can_sort_by_time_remaining(app, client):
+    ids = [db.add_ticket("kari", f"Sak {p}", "d", "Annet", p, "") for p in ("Lav", "Kritisk", "Middels", "Høy")]
+    db.close_ticket(ids[1])
+
+    page = db.get_sla_queue_page(limit=2)
+    assert [t["priority"] for t in page["rows"]] == ["Høy", "Middels"]
+    second = db.get_sla_queue_page(after=page["next"], limit=2)
+    assert [t["priority"] for t in second["rows"]] == ["Lav"]
+    assert db.get_sla_queue_page(before=second["prev"], limit=2)["rows"] == page["rows"]
+    for bad in ("x|y", "2026-01-01", "|3"):
+        assert db.get_sla_queue_page(after=bad, limit=2) == page  # ødelagt cursor gir første side
+        assert db.get_sla_queue_page(before=bad, limit=2) == page
+
+    with client.session_transaction() as sess:
+        sess["user"] = "admin"
+        sess["role"] = "support"
+    res = client.get("/admin/tickets?sort=sla")
+    assert res.status_code == 200
+    assert "Tid igjen".encode() in res.data
+    assert "Sak Høy".encode() in client.get("/admin/tickets?sort=sla&after=x|y").data